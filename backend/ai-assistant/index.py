@@ -10,6 +10,7 @@ from datetime import datetime
 
 from ai_credits_utils import check_and_spend_ai_credits
 from track_event_helper import track_event
+from llm_cache_utils import cached_completion, get_llm_cache_stats
 
 SCHEMA = '"t_p5815085_family_assistant_pro"'
 
@@ -208,6 +209,12 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         return {'statusCode': 200, 'headers': cors_headers, 'body': ''}
 
     if method == 'GET':
+        if (event.get('queryStringParameters') or {}).get('action') == 'cache_stats':
+            return {
+                'statusCode': 200,
+                'headers': {**cors_headers, 'Content-Type': 'application/json'},
+                'body': json.dumps({'cache': get_llm_cache_stats()})
+            }
         return {
             'statusCode': 200,
             'headers': {**cors_headers, 'Content-Type': 'application/json'},
@@ -332,7 +339,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
 
         t0 = time.time()
         try:
-            response = requests.post(url, headers=headers, json=payload, timeout=30)
+            response = cached_completion(url, headers=headers, json=payload, timeout=30, function_name='ai_assistant')
         except requests.exceptions.Timeout:
             latency_ms = int((time.time() - t0) * 1000)
             write_short_trace(family_id, user_id, role_code, 'ai_assistant', model_name,
@@ -8,12 +8,52 @@
 import json
 import os
 import re
+import time
+import threading
 from datetime import datetime, timedelta
 from typing import Dict, Any, List, Optional, Tuple
 import psycopg2
 from psycopg2.extras import RealDictCursor
 
 
+# Бюджет ответа: Яндекс.Диалоги ждут webhook ~3 секунды, отвечаем с запасом.
+# Не уложились — отдаём «ещё выполняю». Только для команд-чтений: изменяющие команды
+# всегда дожидаются записи — после ответа рантайм может заморозить фоновый поток.
+ALICE_DEADLINE_SECONDS = 2.2
+
+# Кэш привязки yandex_user_id → семья/участник в тёплом инстансе (только найденные)
+USER_CACHE_TTL_SECONDS = 300
+_USER_CACHE: Dict[str, Tuple[float, Dict]] = {}
+
+# Сколько фоновая запись лога ждёт команду, не уложившуюся в дедлайн
+WRITE_BEHIND_WAIT_SECONDS = 25
+
+# Изменяющие команды, которые выполняются прямо сейчас: повтор той же команды тем же
+# пользователем ждёт уже запущенную, а не пишет дубль. (yandex_user_id, command) → (поток, result);
+# запись удаляет сам поток по завершении — осознанный повтор после этого выполняется заново.
+_INFLIGHT: Dict[Tuple[str, str], Tuple[threading.Thread, Dict[str, Any]]] = {}
+
+# Таблица маршрутизации, компилируется один раз на инстанс: (категория, корни слов).
+# Порядок важен — первая совпавшая категория выигрывает.
+COMMAND_ROUTES = [
+    (category, re.compile('|'.join(re.escape(w) for w in words)))
+    for category, words in (
+        ('tasks', ['задач', 'дел', 'todo']),
+        ('calendar', ['календар', 'событи', 'встреч', 'мероприяти']),
+        ('shopping', ['покупк', 'купить', 'магазин']),
+        ('stats', ['статистик', 'балл', 'рейтинг', 'лидер']),
+    )
+]
+# Корни, по которым handle_*_command уходит в INSERT/UPDATE (см. обработчики ниже)
+MUTATING_WORDS = {
+    'tasks': ('добав', 'созда', 'новая', 'отмет', 'выполн', 'сделал'),
+    'calendar': ('добав', 'созда', 'запланир', 'запис'),
+    'shopping': ('добав', 'купить'),
+}
+HELP_RE = re.compile('помощ|что ты умеешь|команд')
+AUTH_RE = re.compile('привяжи|привязать|код')
+
+
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     """
     Обработчик запросов от Яндекс.Алисы
@@ -88,34 +128,37 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     if not db_url:
         return build_alice_response('Ошибка конфигурации сервиса', end_session=True)
     
+    started = time.monotonic()
+    timings: Dict[str, int] = {}
+    conn = None
+    
     try:
-        conn = psycopg2.connect(db_url)
-        
-        # Проверка авторизации пользователя
-        user_info = get_user_by_yandex_id(conn, yandex_user_id)
-        
         # Приветствие для новой сессии
         if new_session:
+            user_info, conn = resolve_user(db_url, yandex_user_id, timings)
+            if conn:
+                conn.close()
             if user_info:
                 text = f"Привет! Я помогу управлять делами вашей семьи. Что вы хотите узнать?"
             else:
                 text = "Привет! Чтобы начать работу, привяжите аккаунт. Скажите: 'Алиса, привяжи аккаунт' и я расскажу как это сделать."
-            conn.close()
             return build_alice_response(text, buttons=['Привяжи аккаунт', 'Помощь'])
         
-        # Команда помощи доступна всегда (без авторизации)
-        if any(word in command for word in ['помощ', 'что ты умеешь', 'команд']):
-            conn.close()
+        # Команда помощи доступна всегда (без авторизации и без БД)
+        if HELP_RE.search(command):
             return handle_help_command()
         
         # Команда привязки аккаунта
-        if 'привяжи' in command or 'привязать' in command or 'код' in command:
-            conn.close()
+        if AUTH_RE.search(command):
             return handle_auth_command(yandex_user_id, command, nlu)
         
+        # Проверка авторизации пользователя
+        user_info, conn = resolve_user(db_url, yandex_user_id, timings)
+        
         # Требуем авторизацию для остальных команд
         if not user_info:
-            conn.close()
+            if conn:
+                conn.close()
             return build_alice_response(
                 'Сначала привяжите аккаунт. Скажите "привяжи аккаунт" и назовите код из приложения.',
                 buttons=['Привяжи аккаунт']
@@ -124,44 +167,165 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         family_id = user_info['family_id']
         member_id = user_info['member_id']
         
-        # Обновляем время последнего взаимодействия
-        update_last_interaction(conn, yandex_user_id)
+        # Роутинг в отдельном потоке; соединение переходит потоку. Чтения ограничены дедлайном,
+        # изменяющие команды ждём до конца. Повтор выполняющейся изменяющей команды
+        # присоединяется к уже запущенному потоку, а не пишет дубль.
+        mutating = is_mutating_command(command)
+        dedupe_key = (yandex_user_id, command) if mutating else None
+        inflight = _INFLIGHT.get(dedupe_key) if mutating else None
+        repeated = inflight is not None
+        if repeated:
+            worker, result = inflight
+            if conn:
+                conn.close()
+        else:
+            result: Dict[str, Any] = {}
+            worker = threading.Thread(
+                target=_route_worker,
+                args=(result, conn, db_url, command, nlu, family_id, member_id, yandex_user_id, dedupe_key),
+                daemon=True
+            )
+            if mutating:
+                _INFLIGHT[dedupe_key] = (worker, result)
+            worker.start()
+        conn = None
+        if mutating:
+            worker.join()
+        else:
+            worker.join(max(0.0, ALICE_DEADLINE_SECONDS - (time.monotonic() - started)))
         
-        # Логируем команду (начало)
-        start_time = datetime.now()
+        timings['total_ms'] = int((time.monotonic() - started) * 1000)
+        timed_out = worker.is_alive()
         
-        # Роутинг команд
-        response = route_command(conn, command, nlu, family_id, member_id, yandex_user_id)
+        # Время взаимодействия и лог команды — после ответа, в фоне (повтор не логируем второй раз)
+        if not repeated:
+            write_behind(db_url, yandex_user_id, family_id, command, worker, result, timings)
         
-        # Логируем команду (конец)
-        response_time = int((datetime.now() - start_time).total_seconds() * 1000)
-        category = detect_command_category(command)
-        log_command(conn, yandex_user_id, family_id, command, category, True, None, response_time)
+        if timed_out:
+            print(f"[ALICE] ⏱ дедлайн {ALICE_DEADLINE_SECONDS}s превышен: {timings}")
+            return build_alice_response(
+                'Выполняю, это занимает чуть дольше обычного. Спросите меня ещё раз через пару секунд.',
+                buttons=['Задачи', 'Календарь', 'Покупки']
+            )
         
-        conn.close()
-        return response
+        if 'error' in result:
+            raise result['error']
+        return result['response']
         
     except Exception as e:
+        if conn:
+            conn.close()
         return build_alice_response(f'Произошла ошибка: {str(e)}', end_session=False)
 
 
+def resolve_user(db_url: str, yandex_user_id: str, timings: Dict[str, int]) -> Tuple[Optional[Dict], Any]:
+    """
+    Привязка пользователя: из кэша инстанса или из БД.
+    Возвращает (user_info, conn) — conn открыт только при промахе кэша и дальше переиспользуется.
+    """
+    stage_start = time.monotonic()
+    cached = _USER_CACHE.get(yandex_user_id)
+    if cached and cached[0] > time.time():
+        timings['resolve_user_ms'] = int((time.monotonic() - stage_start) * 1000)
+        return dict(cached[1]), None
+    
+    conn = psycopg2.connect(db_url)
+    user_info = get_user_by_yandex_id(conn, yandex_user_id)
+    if user_info:
+        _USER_CACHE[yandex_user_id] = (time.time() + USER_CACHE_TTL_SECONDS, user_info)
+    timings['resolve_user_ms'] = int((time.monotonic() - stage_start) * 1000)
+    return user_info, conn
+
+
+def _route_worker(result: Dict[str, Any], conn, db_url: str, command: str, nlu: Dict,
+                  family_id: str, member_id: str, yandex_user_id: str,
+                  dedupe_key: Optional[Tuple[str, str]] = None):
+    """Выполняет команду; result['response'] / result['error'], время — result['route_ms'].
+    dedupe_key — изменяющая команда: по завершении снимается из _INFLIGHT"""
+    stage_start = time.monotonic()
+    try:
+        if conn is None:
+            conn = psycopg2.connect(db_url)
+        result['response'] = route_command(conn, command, nlu, family_id, member_id, yandex_user_id)
+    except Exception as e:
+        result['error'] = e
+    finally:
+        result['route_ms'] = int((time.monotonic() - stage_start) * 1000)
+        if dedupe_key is not None:
+            _INFLIGHT.pop(dedupe_key, None)
+        if conn is not None:
+            try:
+                conn.close()
+            except Exception:
+                pass
+
+
+def write_behind(db_url: str, yandex_user_id: str, family_id: str, command: str,
+                 worker: threading.Thread, result: Dict[str, Any], timings: Dict[str, int]):
+    """Отложенная запись last_interaction и лога команды — не задерживает ответ Алисе"""
+    
+    def _flush():
+        worker.join(WRITE_BEHIND_WAIT_SECONDS)
+        stage_timings = dict(timings)
+        if 'route_ms' in result:
+            stage_timings['route_ms'] = result['route_ms']
+        error = None
+        if worker.is_alive():
+            error = 'still running'
+        elif 'error' in result:
+            error = str(result['error'])
+        try:
+            conn = psycopg2.connect(db_url)
+            try:
+                update_last_interaction(conn, yandex_user_id)
+                log_command(conn, yandex_user_id, family_id, command, detect_command_category(command),
+                            error is None, error, stage_timings.get('route_ms', stage_timings.get('total_ms', 0)),
+                            stage_timings)
+            finally:
+                conn.close()
+        except Exception as e:
+            print(f"[ALICE] write-behind failed: {e}")
+        print(f"[ALICE] timings {stage_timings}")
+    
+    try:
+        threading.Thread(target=_flush, daemon=True).start()
+    except Exception as e:
+        print(f"[ALICE] thread start failed: {e}")
+
+
+def match_category(command: str) -> Optional[str]:
+    """Категория команды по предкомпилированной таблице COMMAND_ROUTES"""
+    for category, pattern in COMMAND_ROUTES:
+        if pattern.search(command):
+            return category
+    return None
+
+
+def is_mutating_command(command: str) -> bool:
+    """Команда создаёт/меняет записи (задача, событие, покупка) — повторять её нельзя"""
+    words = MUTATING_WORDS.get(match_category(command) or '')
+    return bool(words) and any(w in command for w in words)
+
+
 def route_command(conn, command: str, nlu: Dict, family_id: str, member_id: str, yandex_user_id: str) -> Dict:
     """Маршрутизация команд пользователя"""
     
+    category = match_category(command)
+    
     # Задачи
-    if any(word in command for word in ['задач', 'дел', 'todo', 'список дел']):
+    if category == 'tasks':
         return handle_tasks_command(conn, command, nlu, family_id, member_id)
     
     # Календарь
-    elif any(word in command for word in ['календар', 'событи', 'встреч', 'мероприяти']):
+    elif category == 'calendar':
         return handle_calendar_command(conn, command, nlu, family_id)
     
     # Покупки
-    elif any(word in command for word in ['покупк', 'купить', 'список покупок', 'магазин']):
+    elif category == 'shopping':
         return handle_shopping_command(conn, command, nlu, family_id)
     
     # Статистика семьи
-    elif any(word in command for word in ['статистик', 'балл', 'рейтинг', 'лидер']):
+    elif category == 'stats':
         return handle_stats_command(conn, family_id)
     
     else:
@@ -241,6 +405,7 @@ def handle_auth_command(yandex_user_id: str, command: str, nlu: Dict) -> Dict:
         conn.commit()
         cursor.close()
         conn.close()
+        _USER_CACHE.pop(yandex_user_id, None)
         
         print(f"[AUTH] ✅ Успешно привязан аккаунт для user_id={yandex_user_id}")
         
@@ -816,16 +981,19 @@ def update_last_interaction(conn, yandex_user_id: str):
 
 
 def log_command(conn, yandex_user_id: str, family_id: str, command: str, 
-                category: Optional[str], success: bool, error: Optional[str], response_time: int):
-    """Логирует команду Алисы для статистики"""
+                category: Optional[str], success: bool, error: Optional[str], response_time: int,
+                stage_timings: Optional[Dict[str, int]] = None):
+    """Логирует команду Алисы для статистики (stage_timings — время по этапам, мс)"""
     
     cursor = conn.cursor()
     
     cursor.execute("""
         INSERT INTO t_p5815085_family_assistant_pro.alice_commands_log
-        (yandex_user_id, family_id, command_text, command_category, success, error_message, response_time_ms)
-        VALUES (%s, %s, %s, %s, %s, %s, %s)
-    """, (yandex_user_id, family_id, command, category, success, error, response_time))
+        (yandex_user_id, family_id, command_text, command_category, success, error_message, response_time_ms,
+         stage_timings)
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s::jsonb)
+    """, (yandex_user_id, family_id, command, category, success, error, response_time,
+          json.dumps(stage_timings) if stage_timings else None))
     
     conn.commit()
     cursor.close()
@@ -834,15 +1002,10 @@ def log_command(conn, yandex_user_id: str, family_id: str, command: str,
 def detect_command_category(command: str) -> Optional[str]:
     """Определяет категорию команды для статистики"""
     
-    if any(word in command for word in ['задач', 'дел', 'todo']):
-        return 'tasks'
-    elif any(word in command for word in ['календар', 'событи', 'встреч']):
-        return 'calendar'
-    elif any(word in command for word in ['покупк', 'купить', 'магазин']):
-        return 'shopping'
-    elif any(word in command for word in ['статистик', 'балл', 'рейтинг', 'лидер']):
-        return 'stats'
-    elif any(word in command for word in ['помощ', 'команд']):
+    category = match_category(command)
+    if category:
+        return category
+    elif HELP_RE.search(command):
         return 'help'
     else:
         return 'other'
@@ -17,7 +17,7 @@ from typing import Dict, Any, Optional
 import psycopg2
 from psycopg2.extras import RealDictCursor
 from audit_helper import log_auth_action
-from rate_limit_helper import check_rate_limit
+from rate_limit_utils import check_rate_limit
 from track_event_helper import track_event
 
 DATABASE_URL = os.environ.get('DATABASE_URL')
@@ -328,7 +328,7 @@ def login_user(phone: str, password: str, ip_address: str = 'unknown') -> Dict[s
         return {'error': 'Телефон и пароль обязательны'}
     
     # Проверка Rate Limit
-    if not check_rate_limit(ip_address, 'auth'):
+    if not check_rate_limit(ip_address, 'auth')['allowed']:
         return {'error': 'Слишком много попыток входа. Попробуйте позже.'}
     
     conn = get_db_connection()
@@ -1257,7 +1257,7 @@ def login_user_email(email: str, password: str, ip_address: str = 'unknown') ->
         return {'error': 'Email и пароль обязательны'}
     
     # Проверка Rate Limit
-    if not check_rate_limit(ip_address, 'auth'):
+    if not check_rate_limit(ip_address, 'auth')['allowed']:
         return {'error': 'Слишком много попыток входа. Попробуйте позже.'}
     
     conn = get_db_connection()
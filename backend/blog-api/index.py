@@ -1,7 +1,7 @@
 """
 Blog API — публичный SEO-блог "Наша Семья".
-GET /?action=list — лента постов (фильтры: category, tag, page, limit, q)
-GET /?action=post&slug=... — один пост + +1 view + связанные
+GET /?action=list — лента постов (фильтры: category, tag, page, limit, q; cursor — keyset из next_cursor)
+GET /?action=post&slug=... — один пост + связанные (просмотр пишется в журнал, views_count — свёрткой)
 GET /?action=categories — список категорий
 GET /?action=tags — популярные теги
 GET /?action=sitemap — данные для sitemap.xml
@@ -13,17 +13,24 @@ GET /?action=admin-stats — общая аналитика блога
 GET /?action=admin-post&id=N — один пост целиком для редактирования
 POST /?action=admin-update — обновление поля поста
 POST /?action=admin-toggle-status — публикация/скрытие/архив
+POST /?action=admin-fold-views — внеочередная свёртка журнала просмотров в views_count
 POST /?action=admin-delete — удаление поста
 """
 
 import json
 import os
+import time
+import base64
 import hashlib
 import threading
+from collections import OrderedDict
+from datetime import datetime
 from typing import Dict, Any, List, Optional
 import psycopg2
 from psycopg2.extras import RealDictCursor
 
+from blog_render_cache_utils import invalidate_blog_render
+
 try:
     import requests
 except ImportError:
@@ -163,6 +170,129 @@ def maybe_trigger_poll() -> None:
         print(f"[BLOG-API] thread start failed: {e}")
 
 
+VIEW_FOLD_INTERVAL_MINUTES = 2
+VIEW_DEDUP_WINDOW_MINUTES = 30
+# Свежие события не сворачиваем: их INSERT может ещё не быть закоммичен
+VIEW_FOLD_LAG_SECONDS = 30
+
+
+def _record_view(post_id: int, visitor_hash: str, ua: str, referrer: str) -> None:
+    """Дописывает событие просмотра в журнал. Fire-and-forget, views_count не трогает."""
+    try:
+        conn = db_conn()
+        conn.autocommit = True
+        cur = conn.cursor()
+        cur.execute(f"""
+            INSERT INTO {SCHEMA}.public_blog_post_views
+            (post_id, visitor_hash, user_agent, referrer)
+            VALUES ({int(post_id)}, {esc_sql(visitor_hash)}, {esc_sql(ua)}, {esc_sql(referrer)})
+        """)
+        cur.close()
+        conn.close()
+    except Exception as e:
+        print(f"[BLOG-API] record view failed: {e}")
+
+
+def fold_views() -> Dict:
+    """
+    Сворачивает новые события журнала просмотров в public_blog_posts.views_count.
+    Один посетитель (visitor_hash) засчитывается не чаще раза на пост за окно
+    VIEW_DEDUP_WINDOW_MINUTES, в том числе с учётом уже свёрнутых ранее событий.
+    Параллельные свёртки исключены блокировкой строки состояния.
+    """
+    window_sec = VIEW_DEDUP_WINDOW_MINUTES * 60
+    conn = db_conn()
+    cur = conn.cursor()
+    try:
+        cur.execute(f"""
+            SELECT last_view_id FROM {SCHEMA}.blog_view_fold_state
+            WHERE id = 1 FOR UPDATE SKIP LOCKED
+        """)
+        row = cur.fetchone()
+        if not row:
+            conn.rollback()
+            return {'folded': False, 'reason': 'busy'}
+        last_id = int(row[0])
+
+        cur.execute(f"""
+            SELECT COALESCE(MAX(id), {last_id}) FROM {SCHEMA}.public_blog_post_views
+            WHERE id > {last_id} AND viewed_at < NOW() - INTERVAL '{VIEW_FOLD_LAG_SECONDS} seconds'
+        """)
+        upto_id = int(cur.fetchone()[0])
+
+        updated_posts = 0
+        counted = 0
+        if upto_id > last_id:
+            cur.execute(f"""
+                WITH batch AS (
+                    SELECT DISTINCT post_id, visitor_hash,
+                           FLOOR(EXTRACT(EPOCH FROM viewed_at) / {window_sec}) AS bucket
+                    FROM {SCHEMA}.public_blog_post_views
+                    WHERE id > {last_id} AND id <= {upto_id}
+                ),
+                fresh AS (
+                    SELECT b.post_id, COUNT(*) AS cnt
+                    FROM batch b
+                    WHERE NOT EXISTS (
+                        SELECT 1 FROM {SCHEMA}.public_blog_post_views o
+                        WHERE o.post_id = b.post_id
+                          AND o.visitor_hash IS NOT DISTINCT FROM b.visitor_hash
+                          AND o.id <= {last_id}
+                          AND FLOOR(EXTRACT(EPOCH FROM o.viewed_at) / {window_sec}) = b.bucket
+                    )
+                    GROUP BY b.post_id
+                )
+                UPDATE {SCHEMA}.public_blog_posts p
+                SET views_count = COALESCE(p.views_count, 0) + fresh.cnt
+                FROM fresh
+                WHERE p.id = fresh.post_id
+                RETURNING fresh.cnt
+            """)
+            rows = cur.fetchall()
+            updated_posts = len(rows)
+            counted = sum(int(r[0]) for r in rows)
+
+        result = {'folded': True, 'events': upto_id - last_id, 'views': counted, 'posts': updated_posts}
+        cur.execute(f"""
+            UPDATE {SCHEMA}.blog_view_fold_state
+            SET last_view_id = {upto_id}, last_folded_at = NOW(), last_result = {esc_sql(json.dumps(result))}::jsonb
+            WHERE id = 1
+        """)
+        conn.commit()
+        return result
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
+        conn.close()
+
+
+def _fold_views_background() -> None:
+    try:
+        fold_views()
+    except Exception as e:
+        print(f"[BLOG-API] background view fold failed: {e}")
+
+
+def fold_due_sql() -> str:
+    """Подзапрос «пора ли сворачивать просмотры» — встраивается в запрос страницы поста."""
+    return f"""(SELECT last_folded_at IS NULL
+                   OR last_folded_at < NOW() - INTERVAL '{VIEW_FOLD_INTERVAL_MINUTES} minutes'
+            FROM {SCHEMA}.blog_view_fold_state WHERE id = 1)"""
+
+
+def maybe_fold_views(need_fold: Optional[bool]) -> None:
+    """Если свёртка просмотров не запускалась VIEW_FOLD_INTERVAL_MINUTES минут — запускаем фоновую."""
+    if not need_fold:
+        return
+    try:
+        t = threading.Thread(target=_fold_views_background, daemon=True)
+        t.start()
+    except Exception as e:
+        print(f"[BLOG-API] thread start failed: {e}")
+
+
 def respond(data: Any, status: int = 200) -> Dict:
     return {
         'statusCode': status,
@@ -172,11 +302,40 @@ def respond(data: Any, status: int = 200) -> Dict:
     }
 
 
+LIST_TOTAL_TTL_SECONDS = 120
+
+# Кэш total для ленты по фильтру (в пределах тёплого инстанса): where_sql -> (expires_at, total).
+# LRU на LIST_TOTALS_MAX_ENTRIES: category/tag приходят из запроса; поиск по q не кэшируется вовсе
+LIST_TOTALS_MAX_ENTRIES = 256
+_LIST_TOTALS: 'OrderedDict[str, tuple]' = OrderedDict()
+
+
+def encode_list_cursor(published_at: Any, post_id: int) -> str:
+    raw = f"{published_at.isoformat() if hasattr(published_at, 'isoformat') else published_at}|{int(post_id)}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_list_cursor(cursor: str) -> Optional[tuple]:
+    """(published_at ISO, id) или None, если курсор битый."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        published_at, post_id = raw.rsplit('|', 1)
+        datetime.fromisoformat(published_at)
+        return published_at, int(post_id)
+    except Exception:
+        return None
+
+
 def list_posts(params: Dict) -> Dict:
+    """
+    Лента постов одним запросом: теги — через LATERAL + json_agg, total — из кэша инстанса
+    (на промахе считается тем же запросом). Пагинация keyset по (published_at, id):
+    ответ содержит next_cursor; page без cursor — совместимость с прямыми ссылками (OFFSET).
+    """
     maybe_trigger_poll()
     page = max(1, int(params.get('page', '1') or 1))
     limit = min(50, max(1, int(params.get('limit', '12') or 12)))
-    offset = (page - 1) * limit
+    cursor = decode_list_cursor((params.get('cursor') or '').strip()) if params.get('cursor') else None
     category = (params.get('category') or '').strip()
     tag = (params.get('tag') or '').strip()
     q = (params.get('q') or '').strip()
@@ -198,137 +357,164 @@ def list_posts(params: Dict) -> Dict:
 
     where_sql = ' AND '.join(where)
 
-    conn = db_conn()
-    cur = conn.cursor(cursor_factory=RealDictCursor)
-    cur.execute(f"""
-        SELECT COUNT(*) AS total
-        FROM {SCHEMA}.public_blog_posts p
+    now = time.time()
+    cached_total = _LIST_TOTALS.get(where_sql) if not q else None
+    total = cached_total[1] if cached_total and cached_total[0] > now else None
+    if total is not None:
+        _LIST_TOTALS.move_to_end(where_sql)
+    total_sql = 'NULL' if total is not None else f"""(
+        SELECT COUNT(*) FROM {SCHEMA}.public_blog_posts p
         LEFT JOIN {SCHEMA}.public_blog_categories c ON c.id = p.category_id
-        WHERE {where_sql}
-    """)
-    total = cur.fetchone()['total']
+        WHERE {where_sql})"""
+
+    if cursor:
+        page_sql = f"AND (p.published_at, p.id) < ({esc_sql(cursor[0])}::timestamp, {cursor[1]})"
+        offset_sql = ''
+    else:
+        page_sql = ''
+        offset_sql = f"OFFSET {(page - 1) * limit}"
 
+    conn = db_conn()
+    cur = conn.cursor(cursor_factory=RealDictCursor)
     cur.execute(f"""
         SELECT p.id, p.slug, p.title, p.excerpt, p.cover_image_url,
                p.reading_time_min, p.views_count, p.likes_count,
                p.published_at, p.author_name,
-               c.slug AS category_slug, c.name AS category_name, c.emoji AS category_emoji
+               c.slug AS category_slug, c.name AS category_name, c.emoji AS category_emoji,
+               COALESCE(tg.tags, '[]'::json) AS tags,
+               {total_sql} AS _total
         FROM {SCHEMA}.public_blog_posts p
         LEFT JOIN {SCHEMA}.public_blog_categories c ON c.id = p.category_id
-        WHERE {where_sql}
-        ORDER BY p.published_at DESC
-        LIMIT {limit} OFFSET {offset}
-    """)
-    posts = [dict(r) for r in cur.fetchall()]
-
-    if posts:
-        ids = ','.join(str(p['id']) for p in posts)
-        cur.execute(f"""
-            SELECT pt.post_id, t.slug, t.name
+        LEFT JOIN LATERAL (
+            SELECT json_agg(json_build_object('slug', t.slug, 'name', t.name)) AS tags
             FROM {SCHEMA}.public_blog_post_tags pt
             JOIN {SCHEMA}.public_blog_tags t ON t.id = pt.tag_id
-            WHERE pt.post_id IN ({ids})
-        """)
-        tags_by_post: Dict[int, List[Dict]] = {}
-        for row in cur.fetchall():
-            tags_by_post.setdefault(row['post_id'], []).append({
-                'slug': row['slug'], 'name': row['name']
-            })
-        for p in posts:
-            p['tags'] = tags_by_post.get(p['id'], [])
+            WHERE pt.post_id = p.id
+        ) tg ON TRUE
+        WHERE {where_sql} {page_sql}
+        ORDER BY p.published_at DESC, p.id DESC
+        LIMIT {limit + 1} {offset_sql}
+    """)
+    rows = [dict(r) for r in cur.fetchall()]
+
+    if total is None:
+        if rows:
+            total = int(rows[0]['_total'])
+        else:
+            cur.execute(f"""
+                SELECT COUNT(*) AS total
+                FROM {SCHEMA}.public_blog_posts p
+                LEFT JOIN {SCHEMA}.public_blog_categories c ON c.id = p.category_id
+                WHERE {where_sql}
+            """)
+            total = int(cur.fetchone()['total'])
+        if not q:
+            _LIST_TOTALS[where_sql] = (now + LIST_TOTAL_TTL_SECONDS, total)
+            _LIST_TOTALS.move_to_end(where_sql)
+            while len(_LIST_TOTALS) > LIST_TOTALS_MAX_ENTRIES:
+                _LIST_TOTALS.popitem(last=False)
 
     cur.close()
     conn.close()
 
+    has_more = len(rows) > limit
+    posts = rows[:limit]
+    for p in posts:
+        p.pop('_total', None)
+    next_cursor = encode_list_cursor(posts[-1]['published_at'], posts[-1]['id']) if has_more and posts else None
+
     return respond({
         'posts': posts,
         'total': total,
         'page': page,
         'limit': limit,
         'pages': (total + limit - 1) // limit,
+        'next_cursor': next_cursor,
     })
 
 
 def get_post(params: Dict, headers: Dict, source_ip: str) -> Dict:
+    """
+    Страница поста одним запросом: категория, теги, похожие и реакции —
+    LATERAL-подзапросами с json_agg. Просмотр пишется в журнал фоном.
+    """
     slug = (params.get('slug') or '').strip()
     if not slug:
         return respond({'error': 'slug required'}, 400)
     slug_safe = slug.replace("'", "''")
+    ip_hash = hashlib.sha256(f"{source_ip}|reactions_salt_v1".encode()).hexdigest()[:64]
 
     conn = db_conn()
     cur = conn.cursor(cursor_factory=RealDictCursor)
     cur.execute(f"""
-        SELECT p.*, c.slug AS category_slug, c.name AS category_name, c.emoji AS category_emoji
+        SELECT p.*, c.slug AS category_slug, c.name AS category_name, c.emoji AS category_emoji,
+               COALESCE(tg.tags, '[]'::json) AS tags,
+               COALESCE(rel.related, '[]'::json) AS related,
+               COALESCE(rc.counts, '{{}}'::json) AS _reaction_counts,
+               COALESCE(ru.emojis, '[]'::json) AS _reaction_user,
+               {fold_due_sql()} AS _need_fold
         FROM {SCHEMA}.public_blog_posts p
         LEFT JOIN {SCHEMA}.public_blog_categories c ON c.id = p.category_id
+        LEFT JOIN LATERAL (
+            SELECT json_agg(json_build_object('slug', t.slug, 'name', t.name)) AS tags
+            FROM {SCHEMA}.public_blog_post_tags pt
+            JOIN {SCHEMA}.public_blog_tags t ON t.id = pt.tag_id
+            WHERE pt.post_id = p.id
+        ) tg ON TRUE
+        LEFT JOIN LATERAL (
+            SELECT json_agg(r ORDER BY r.published_at DESC) AS related
+            FROM (
+                SELECT rp.id, rp.slug, rp.title, rp.excerpt, rp.cover_image_url,
+                       rp.reading_time_min, rp.published_at,
+                       rc2.slug AS category_slug, rc2.name AS category_name, rc2.emoji AS category_emoji
+                FROM {SCHEMA}.public_blog_posts rp
+                LEFT JOIN {SCHEMA}.public_blog_categories rc2 ON rc2.id = rp.category_id
+                WHERE rp.status = 'published' AND rp.id <> p.id
+                  AND (p.category_id IS NULL OR rp.category_id = p.category_id)
+                ORDER BY rp.published_at DESC LIMIT 4
+            ) r
+        ) rel ON TRUE
+        LEFT JOIN LATERAL (
+            SELECT json_object_agg(x.emoji, x.cnt) AS counts
+            FROM (
+                SELECT emoji, COUNT(*) AS cnt
+                FROM {SCHEMA}.public_blog_post_reactions
+                WHERE post_id = p.id
+                GROUP BY emoji
+            ) x
+        ) rc ON TRUE
+        LEFT JOIN LATERAL (
+            SELECT json_agg(emoji) AS emojis
+            FROM {SCHEMA}.public_blog_post_reactions
+            WHERE post_id = p.id AND ip_hash = '{ip_hash}'
+        ) ru ON TRUE
         WHERE p.slug = '{slug_safe}' AND p.status = 'published'
         LIMIT 1
     """)
     post = cur.fetchone()
+    cur.close()
+    conn.close()
     if not post:
-        cur.close()
-        conn.close()
         return respond({'error': 'not found'}, 404)
     post = dict(post)
-
-    cur.execute(f"""
-        SELECT t.slug, t.name FROM {SCHEMA}.public_blog_post_tags pt
-        JOIN {SCHEMA}.public_blog_tags t ON t.id = pt.tag_id
-        WHERE pt.post_id = {post['id']}
-    """)
-    post['tags'] = [dict(r) for r in cur.fetchall()]
-
-    related_where = []
-    if post.get('category_id'):
-        related_where.append(f"p.category_id = {int(post['category_id'])}")
-    related_filter = ' AND '.join(related_where) if related_where else '1=1'
-    cur.execute(f"""
-        SELECT p.id, p.slug, p.title, p.excerpt, p.cover_image_url,
-               p.reading_time_min, p.published_at,
-               c.slug AS category_slug, c.name AS category_name, c.emoji AS category_emoji
-        FROM {SCHEMA}.public_blog_posts p
-        LEFT JOIN {SCHEMA}.public_blog_categories c ON c.id = p.category_id
-        WHERE p.status = 'published' AND p.id <> {post['id']} AND {related_filter}
-        ORDER BY p.published_at DESC LIMIT 4
-    """)
-    post['related'] = [dict(r) for r in cur.fetchall()]
+    post['reactions'] = {
+        'counts': {k: int(v) for k, v in (post.pop('_reaction_counts') or {}).items()},
+        'user': post.pop('_reaction_user') or [],
+    }
+    need_fold = post.pop('_need_fold', None)
 
     ua = (headers.get('user-agent') or headers.get('User-Agent') or '')[:500]
     referrer = (headers.get('referer') or headers.get('Referer') or '')[:500]
     visitor_raw = f"{source_ip}|{ua}"
     visitor_hash = hashlib.sha256(visitor_raw.encode()).hexdigest()[:64]
 
-    ua_safe = ua.replace("'", "''")
-    ref_safe = referrer.replace("'", "''")
-    cur.execute(f"""
-        INSERT INTO {SCHEMA}.public_blog_post_views
-        (post_id, visitor_hash, user_agent, referrer)
-        VALUES ({post['id']}, '{visitor_hash}', '{ua_safe}', '{ref_safe}')
-    """)
-    cur.execute(f"""
-        UPDATE {SCHEMA}.public_blog_posts
-        SET views_count = views_count + 1
-        WHERE id = {post['id']}
-    """)
-    conn.commit()
-
-    ip_hash = hashlib.sha256(f"{source_ip}|reactions_salt_v1".encode()).hexdigest()[:64]
-    cur.execute(f"""
-        SELECT emoji, COUNT(*) AS cnt
-        FROM {SCHEMA}.public_blog_post_reactions
-        WHERE post_id = {post['id']}
-        GROUP BY emoji
-    """)
-    counts = {row['emoji']: int(row['cnt']) for row in cur.fetchall()}
-    cur.execute(f"""
-        SELECT emoji FROM {SCHEMA}.public_blog_post_reactions
-        WHERE post_id = {post['id']} AND ip_hash = '{ip_hash}'
-    """)
-    user_reacted = [row['emoji'] for row in cur.fetchall()]
-    post['reactions'] = {'counts': counts, 'user': user_reacted}
+    # Просмотр уходит в журнал фоном, views_count обновит свёртка (fold_views)
+    try:
+        threading.Thread(target=_record_view, args=(post['id'], visitor_hash, ua, referrer), daemon=True).start()
+    except Exception as e:
+        print(f"[BLOG-API] thread start failed: {e}")
+    maybe_fold_views(need_fold)
 
-    cur.close()
-    conn.close()
     return respond({'post': post})
 
 
@@ -650,6 +836,9 @@ def admin_update(body: Dict) -> Dict:
         return admin_response({'error': str(e)}, 500)
     cur.close()
     conn.close()
+    if success:
+        invalidate_blog_render()
+        _LIST_TOTALS.clear()
     return admin_response({'ok': success, 'id': pid_int})
 
 
@@ -681,6 +870,9 @@ def admin_toggle_status(body: Dict) -> Dict:
     conn.commit()
     cur.close()
     conn.close()
+    if success:
+        invalidate_blog_render()
+        _LIST_TOTALS.clear()
     return admin_response({'ok': success, 'id': pid_int, 'status': new_status})
 
 
@@ -749,6 +941,8 @@ def handler(event: Dict[str, Any], context) -> Dict[str, Any]:
                 return admin_update(body)
             if action == 'admin-toggle-status':
                 return admin_toggle_status(body)
+            if action == 'admin-fold-views':
+                return admin_response(fold_views())
 
             return admin_response({'error': 'unknown admin action'}, 400)
 
@@ -16,6 +16,9 @@ import requests
 import psycopg2
 from psycopg2.extras import RealDictCursor
 
+from blog_render_cache_utils import invalidate_blog_render
+from s3_limit_utils import record_s3_object
+
 SCHEMA = 't_p5815085_family_assistant_pro'
 DATABASE_URL = os.environ.get('DATABASE_URL', '')
 
@@ -162,6 +165,8 @@ def upload_to_s3(image_bytes: bytes, post_id: int) -> Optional[str]:
             Body=image_bytes,
             ContentType='image/jpeg',
         )
+        record_s3_object(None, SCHEMA, key, len(image_bytes), content_type='image/jpeg',
+                         source='blog-cover-generator')
         cdn = f"https://cdn.poehali.dev/projects/{os.environ['AWS_ACCESS_KEY_ID']}/bucket/{key}"
         return cdn
     except Exception as e:
@@ -197,6 +202,8 @@ def update_cover(post_id: int, url: str) -> bool:
     conn.commit()
     cur.close()
     conn.close()
+    if success:
+        invalidate_blog_render()
     return success
 
 
@@ -6,6 +6,8 @@ GET /?type=category&slug=psychology — HTML категории
 
 Используется на стороне CDN/прокси: при User-Agent с ботом — отдаём этот HTML,
 для обычных пользователей — обычный SPA.
+Готовый HTML кэшируется в S3 (blog_render_cache_utils) с сильным ETag, If-None-Match → 304.
+Кэш сбрасывают blog-api и max-bot при публикации/правке постов.
 """
 
 import os
@@ -15,6 +17,8 @@ from datetime import datetime
 import psycopg2
 from psycopg2.extras import RealDictCursor
 
+from blog_render_cache_utils import render_key, get_rendered, put_rendered, etag_matches
+
 SCHEMA = 't_p5815085_family_assistant_pro'
 SITE = 'https://nasha-semiya.ru'
 LOGO = 'https://cdn.poehali.dev/files/Логотип Наша Семья.JPG'
@@ -377,25 +381,49 @@ def handler(event: Dict[str, Any], context) -> Dict[str, Any]:
         'X-Robots-Tag': 'index, follow',
     }
 
+    def serve(key: str, render) -> Dict[str, Any]:
+        cache_status = 'HIT'
+        cached = get_rendered(key)
+        if cached:
+            html, etag = cached
+        else:
+            rendered = render()
+            if rendered is None:
+                return {'statusCode': 404, 'headers': headers, 'body': '<h1>404</h1>', 'isBase64Encoded': False}
+            html, version = rendered
+            etag = put_rendered(key, html, headers['Content-Type'], version)
+            cache_status = 'MISS'
+        out_headers = {**headers, 'ETag': etag, 'X-Render-Cache': cache_status}
+        if etag_matches(event.get('headers'), etag):
+            return {'statusCode': 304, 'headers': out_headers, 'body': '', 'isBase64Encoded': False}
+        return {'statusCode': 200, 'headers': out_headers, 'body': html, 'isBase64Encoded': False}
+
+    def render_list():
+        data = get_list()
+        return render_list_html(data['posts']), ''
+
+    def render_category():
+        data = get_list(slug)
+        if not data['category']:
+            return None
+        return render_list_html(data['posts'], data['category']), ''
+
+    def render_post():
+        post = get_post(slug)
+        if not post:
+            return None
+        html = render_post_html(post, post.get('_related', []), post.get('_tags', []))
+        return html, fmt_iso(post.get('updated_at'))
+
     try:
         if page_type == 'list' or (not page_type and not slug):
-            data = get_list()
-            html = render_list_html(data['posts'])
-            return {'statusCode': 200, 'headers': headers, 'body': html, 'isBase64Encoded': False}
+            return serve(render_key('list'), render_list)
 
         if page_type == 'category' and slug:
-            data = get_list(slug)
-            if not data['category']:
-                return {'statusCode': 404, 'headers': headers, 'body': '<h1>404</h1>', 'isBase64Encoded': False}
-            html = render_list_html(data['posts'], data['category'])
-            return {'statusCode': 200, 'headers': headers, 'body': html, 'isBase64Encoded': False}
+            return serve(render_key('category', slug), render_category)
 
         if slug:
-            post = get_post(slug)
-            if not post:
-                return {'statusCode': 404, 'headers': headers, 'body': '<h1>404</h1>', 'isBase64Encoded': False}
-            html = render_post_html(post, post.get('_related', []), post.get('_tags', []))
-            return {'statusCode': 200, 'headers': headers, 'body': html, 'isBase64Encoded': False}
+            return serve(render_key('post', slug), render_post)
 
         return {'statusCode': 400, 'headers': headers, 'body': '<h1>400 Bad Request</h1>', 'isBase64Encoded': False}
     except Exception as e:
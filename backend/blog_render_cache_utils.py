@@ -0,0 +1,162 @@
+"""
+Кэш отрендеренных страниц блога (pre-render HTML и sitemap XML) в S3 —
+используется blog-prerender и sitemap-blog, сбрасывается blog-api, max-bot и blog-cover-generator при публикации/смене обложки.
+
+Пример использования:
+    from blog_render_cache_utils import render_key, get_rendered, put_rendered, etag_matches
+
+    key = render_key('post', slug)
+    cached = get_rendered(key)
+    if cached:
+        body, etag = cached
+    else:
+        body = render(...)                      # запрос в БД только на промахе
+        etag = put_rendered(key, body, 'text/html; charset=utf-8', version=str(post['updated_at']))
+    if etag_matches(event_headers, etag):
+        return 304
+
+Принципы:
+- Ключ — тип страницы + slug, версия контента (updated_at поста) пишется в метаданные объекта.
+- ETag сильный: sha256 от байтов страницы.
+- Любая публикация/правка поста сбрасывает весь префикс blog-render/ (invalidate_blog_render):
+  меняются не только страница поста, но и ленты, категории, «похожие» и sitemap.
+- Поверх S3 — короткий in-memory кэш тёплого инстанса (MEMORY_TTL_SECONDS).
+- Кэш мягкий: без boto3/ключей или при ошибке S3 страница просто рендерится из БД.
+"""
+import os
+import time
+import hashlib
+import logging
+from datetime import datetime, timezone
+from typing import Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+S3_ENDPOINT = 'https://bucket.poehali.dev'
+S3_BUCKET = 'files'
+RENDER_PREFIX = 'blog-render/'
+
+# Сколько тёплый инстанс отдаёт страницу из памяти, не заглядывая в S3
+MEMORY_TTL_SECONDS = 60
+
+_MEM: Dict[str, Tuple[float, str, str]] = {}
+_STATS = {'memory_hits': 0, 's3_hits': 0, 'misses': 0, 'stores': 0, 'invalidations': 0, 'errors': 0}
+
+
+def _s3():
+    aws_key = os.environ.get('AWS_ACCESS_KEY_ID', '')
+    aws_secret = os.environ.get('AWS_SECRET_ACCESS_KEY', '')
+    if not aws_key or not aws_secret:
+        return None
+    import boto3
+    return boto3.client('s3', endpoint_url=S3_ENDPOINT,
+                        aws_access_key_id=aws_key, aws_secret_access_key=aws_secret)
+
+
+def render_key(kind: str, slug: str = '') -> str:
+    """kind: post / list / category / sitemap. slug — slug поста/категории или тип sitemap."""
+    safe = hashlib.sha256(slug.encode('utf-8')).hexdigest()[:16] if slug else 'index'
+    return f'{RENDER_PREFIX}{kind}/{safe}'
+
+
+def make_etag(body: str) -> str:
+    return '"' + hashlib.sha256(body.encode('utf-8')).hexdigest()[:32] + '"'
+
+
+def etag_matches(headers: Optional[Dict], etag: str) -> bool:
+    """Проверка If-None-Match (регистр заголовка любой, поддерживаются списки и '*')."""
+    if not headers or not etag:
+        return False
+    value = ''
+    for k, v in headers.items():
+        if isinstance(k, str) and k.lower() == 'if-none-match':
+            value = str(v or '')
+            break
+    if not value:
+        return False
+    candidates = [c.strip() for c in value.split(',')]
+    return '*' in candidates or etag in candidates or f'W/{etag}' in candidates
+
+
+def get_rendered(key: str, max_age_seconds: Optional[int] = None) -> Optional[Tuple[str, str]]:
+    """(body, etag) из памяти или S3; None — промах (или страница старше max_age_seconds)."""
+    now = time.time()
+    mem = _MEM.get(key)
+    if mem and mem[0] > now:
+        _STATS['memory_hits'] += 1
+        return mem[1], mem[2]
+
+    try:
+        s3 = _s3()
+        if s3 is None:
+            return None
+        obj = s3.get_object(Bucket=S3_BUCKET, Key=key)
+        if max_age_seconds is not None:
+            age = (datetime.now(timezone.utc) - obj['LastModified']).total_seconds()
+            if age > max_age_seconds:
+                _STATS['misses'] += 1
+                return None
+        body = obj['Body'].read().decode('utf-8')
+        etag = (obj.get('Metadata') or {}).get('etag') or make_etag(body)
+    except Exception as e:
+        if 'NoSuchKey' not in str(e) and '404' not in str(e):
+            logger.warning(f'blog render cache read failed: {e}')
+            _STATS['errors'] += 1
+        _STATS['misses'] += 1
+        return None
+
+    _STATS['s3_hits'] += 1
+    _MEM[key] = (now + MEMORY_TTL_SECONDS, body, etag)
+    return body, etag
+
+
+def put_rendered(key: str, body: str, content_type: str, version: str = '') -> str:
+    """Сохраняет страницу, возвращает её ETag. Ошибка записи не мешает отдать страницу."""
+    etag = make_etag(body)
+    _MEM[key] = (time.time() + MEMORY_TTL_SECONDS, body, etag)
+    try:
+        s3 = _s3()
+        if s3 is not None:
+            s3.put_object(
+                Bucket=S3_BUCKET, Key=key, Body=body.encode('utf-8'),
+                ContentType=content_type,
+                Metadata={'etag': etag, 'version': str(version or '')[:64]},
+            )
+            _STATS['stores'] += 1
+    except Exception as e:
+        logger.warning(f'blog render cache write failed: {e}')
+        _STATS['errors'] += 1
+    return etag
+
+
+def invalidate_blog_render() -> int:
+    """Сбрасывает все отрендеренные страницы блога. Возвращает число удалённых объектов."""
+    _MEM.clear()
+    _STATS['invalidations'] += 1
+    deleted = 0
+    try:
+        s3 = _s3()
+        if s3 is None:
+            return 0
+        token = None
+        while True:
+            kwargs = {'Bucket': S3_BUCKET, 'Prefix': RENDER_PREFIX, 'MaxKeys': 1000}
+            if token:
+                kwargs['ContinuationToken'] = token
+            page = s3.list_objects_v2(**kwargs)
+            keys = [{'Key': o['Key']} for o in page.get('Contents', [])]
+            if keys:
+                s3.delete_objects(Bucket=S3_BUCKET, Delete={'Objects': keys, 'Quiet': True})
+                deleted += len(keys)
+            if not page.get('IsTruncated'):
+                break
+            token = page.get('NextContinuationToken')
+    except Exception as e:
+        logger.warning(f'blog render cache invalidation failed: {e}')
+        _STATS['errors'] += 1
+    return deleted
+
+
+def get_render_cache_stats() -> Dict[str, int]:
+    """Счётчики тёплого инстанса: memory_hits / s3_hits / misses / stores / invalidations / errors."""
+    return dict(_STATS)
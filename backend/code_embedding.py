@@ -0,0 +1,142 @@
+"""
+Локальные эмбеддинги кода для Dev Agent — используется dev-agent-indexer (при индексации)
+и dev-agent-admin (вектор запроса + поиск ближайших чанков).
+
+Пример использования:
+    from code_embedding import embed_text, build_ivf, nearest
+
+    vec = embed_text(chunk_text)                      # list[float] длины EMBED_DIM или None
+    centroids, assign = build_ivf(vectors)            # при индексации снапшота
+    top = nearest(query_vec, ids, vectors, limit=8)   # [(id, cosine), ...]
+
+Принципы:
+- Без сети и без моделей: feature hashing (signed) по токенам-идентификаторам
+  (целиком + части camelCase/snake_case), биграммам токенов и символьным триграммам.
+  Веса — сублинейный tf, вектор L2-нормирован, косинус = скалярное произведение.
+- Хэш стабильный (blake2b), не зависит от PYTHONHASHSEED: индексатор и админка
+  получают одинаковые векторы.
+- ANN — IVF: сферический k-means по векторам снапшота (NumPy), у каждого чанка
+  номер списка; запрос сравнивается с центроидами и просматривает IVF_NPROBE списков.
+- embed_text — чистый Python; NumPy нужен только build_ivf / nearest / nearest_lists.
+"""
+import hashlib
+import math
+import re
+from functools import lru_cache
+from typing import Dict, List, Optional, Sequence, Tuple
+
+EMBED_DIM = 256
+MAX_EMBED_CHARS = 8000
+
+IVF_MAX_LISTS = 64
+IVF_ITERATIONS = 8
+IVF_NPROBE = 4
+
+_RE_WORD = re.compile(r'[0-9A-Za-zА-Яа-яЁё_]+')
+_RE_CAMEL_PART = re.compile(r'[A-ZА-ЯЁ]?[a-zа-яё0-9]+|[A-ZА-ЯЁ]+(?![a-zа-яё])')
+
+# Веса видов признаков
+_W_TOKEN = 1.0
+_W_BIGRAM = 0.5
+_W_TRIGRAM = 0.25
+
+
+def tokenize(text: str) -> List[str]:
+    """Идентификаторы целиком + их части: 'useDietQuiz' → usedietquiz, use, diet, quiz."""
+    out: List[str] = []
+    for word in _RE_WORD.findall(text or ''):
+        pieces = [p for p in word.split('_') if p]
+        if len(pieces) == 1 and len(word) >= 2:
+            out.append(word.lower())
+        for piece in pieces:
+            parts = _RE_CAMEL_PART.findall(piece)
+            if len(parts) > 1 or '_' in word:
+                out.extend(p.lower() for p in parts if len(p) >= 2)
+    return out
+
+
+@lru_cache(maxsize=200_000)
+def _slot(feature: str) -> Tuple[int, float]:
+    h = hashlib.blake2b(feature.encode('utf-8'), digest_size=8).digest()
+    n = int.from_bytes(h, 'little')
+    return n % EMBED_DIM, (1.0 if (n >> 63) & 1 else -1.0)
+
+
+def embed_text(text: str) -> Optional[List[float]]:
+    """Вектор длины EMBED_DIM (L2 = 1) или None, если в тексте нет токенов."""
+    tokens = tokenize((text or '')[:MAX_EMBED_CHARS])
+    if not tokens:
+        return None
+    counts: Dict[str, float] = {}
+    for i, tok in enumerate(tokens):
+        counts['t:' + tok] = counts.get('t:' + tok, 0.0) + _W_TOKEN
+        if i:
+            bg = 'b:' + tokens[i - 1] + ' ' + tok
+            counts[bg] = counts.get(bg, 0.0) + _W_BIGRAM
+        if len(tok) >= 4:
+            for j in range(len(tok) - 2):
+                tg = 'c:' + tok[j:j + 3]
+                counts[tg] = counts.get(tg, 0.0) + _W_TRIGRAM
+    vec = [0.0] * EMBED_DIM
+    for feature, weight in counts.items():
+        idx, sign = _slot(feature)
+        vec[idx] += sign * (1.0 + math.log(weight)) if weight >= 1.0 else sign * weight
+    norm = math.sqrt(sum(v * v for v in vec))
+    if norm == 0:
+        return None
+    return [round(v / norm, 5) for v in vec]
+
+
+def _unit_rows(np, m):
+    norms = np.linalg.norm(m, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return m / norms
+
+
+def build_ivf(vectors: Sequence[Sequence[float]], n_lists: Optional[int] = None,
+              seed: int = 42) -> Tuple[List[List[float]], List[int]]:
+    """Сферический k-means → (центроиды, номер списка для каждого вектора)."""
+    import numpy as np
+
+    x = np.asarray(vectors, dtype=np.float32)
+    n = x.shape[0]
+    if n == 0:
+        return [], []
+    k = n_lists or max(1, min(IVF_MAX_LISTS, int(round(math.sqrt(n)))))
+    k = min(k, n)
+    rng = np.random.default_rng(seed)
+    centroids = x[rng.choice(n, size=k, replace=False)].copy()
+    assign = np.zeros(n, dtype=np.int64)
+    for _ in range(IVF_ITERATIONS):
+        assign = np.argmax(x @ centroids.T, axis=1)
+        for c in range(k):
+            members = x[assign == c]
+            if len(members):
+                centroids[c] = members.sum(axis=0)
+        centroids = _unit_rows(np, centroids)
+    assign = np.argmax(x @ centroids.T, axis=1)
+    return np.round(centroids, 5).tolist(), assign.tolist()
+
+
+def nearest_lists(query: Sequence[float], centroids: Sequence[Sequence[float]],
+                  nprobe: int = IVF_NPROBE) -> List[int]:
+    """Номера IVF-списков, ближайших к запросу."""
+    import numpy as np
+
+    if not centroids:
+        return []
+    sims = np.asarray(centroids, dtype=np.float32) @ np.asarray(query, dtype=np.float32)
+    order = np.argsort(-sims)[:max(1, nprobe)]
+    return [int(i) for i in order]
+
+
+def nearest(query: Sequence[float], ids: Sequence[int], vectors: Sequence[Sequence[float]],
+            limit: int, min_sim: float = 0.0) -> List[Tuple[int, float]]:
+    """Точный top-k по косинусу среди кандидатов (векторы уже L2-нормированы)."""
+    import numpy as np
+
+    if not ids:
+        return []
+    sims = np.asarray(vectors, dtype=np.float32) @ np.asarray(query, dtype=np.float32)
+    order = np.argsort(-sims)[:max(0, limit)]
+    return [(int(ids[i]), float(sims[i])) for i in order if sims[i] >= min_sim]
@@ -1,10 +1,10 @@
 import json
 import os
-import requests
 import psycopg2
 from typing import Dict, Any
 
 from ai_credits_utils import check_and_spend_ai_credits
+from llm_cache_utils import cached_completion
 
 
 def get_db_connection():
@@ -243,7 +243,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'messages': yandex_messages
         }
 
-        response = requests.post(url, headers=headers, json=payload, timeout=30)
+        response = cached_completion(url, headers=headers, json=payload, timeout=30, function_name='conflict_ai')
 
         if response.status_code != 200:
             print(f'[ERROR] YandexGPT ответ: {response.status_code} {response.text[:500]}')
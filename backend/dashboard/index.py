@@ -5,7 +5,7 @@ Returns: hubs со статистикой и прогрессом пользов
 """
 import json
 import os
-from typing import Any, Dict
+from typing import Any, Dict, List, Tuple
 import psycopg2
 from psycopg2.extras import RealDictCursor
 
@@ -33,6 +33,13 @@ ALLOWED_AUTO_TABLES = {
 }
 ALLOWED_USER_FIELDS = {'user_id', 'family_id'}
 
+# Сколько секунд счётчик из dashboard_auto_counters считается свежим
+AUTO_COUNTER_TTL_SECONDS = 120
+
+# Типы колонок владельца (udt_name) по таблицам — кэш на время жизни инстанса
+_OWNER_COLUMN_TYPES: Dict[str, Dict[str, str]] = {}
+_CASTABLE_TYPES = {'uuid', 'varchar', 'text', 'bpchar', 'int4', 'int8', 'int2'}
+
 
 def _conn():
     return psycopg2.connect(os.environ['DATABASE_URL'])
@@ -89,6 +96,83 @@ def _count_auto(cur, table: str, field: str, user_id: str, family_id: str, error
         return 0
 
 
+def _owner_column_types(cur) -> Dict[str, Dict[str, str]]:
+    """Типы колонок user_id/family_id в ALLOWED_AUTO_TABLES (один запрос на инстанс)."""
+    if not _OWNER_COLUMN_TYPES:
+        tables = ', '.join(f"'{t}'" for t in sorted(ALLOWED_AUTO_TABLES))
+        cur.execute(
+            f"SELECT table_name, column_name, udt_name FROM information_schema.columns "
+            f"WHERE table_schema = '{SCHEMA}' AND table_name IN ({tables}) "
+            f"AND column_name IN ('user_id', 'family_id')"
+        )
+        for row in cur.fetchall():
+            table, column, udt = (row['table_name'], row['column_name'], row['udt_name']) if isinstance(row, dict) else row
+            _OWNER_COLUMN_TYPES.setdefault(table, {})[column] = udt
+    return _OWNER_COLUMN_TYPES
+
+
+def _owner_predicate(types: Dict[str, Dict[str, str]], table: str, field: str, value: str) -> str:
+    """
+    Условие WHERE с приведением значения к типу колонки (а не колонки к text),
+    чтобы COUNT(*) шёл по индексу. Пустая строка — условие невыполнимо (тип не совпал).
+    """
+    udt = types.get(table, {}).get(field)
+    if udt not in _CASTABLE_TYPES:
+        return f"{field}::text = '{_esc(value)}'"
+    if udt.startswith('int') and not value.isdigit():
+        return ''
+    return f"{field} = '{_esc(value)}'::{udt}"
+
+
+def _refresh_auto_counters(cur, stale: List[Tuple[str, str, str]], errors: list) -> Dict[Tuple[str, str, str], int]:
+    """
+    Пересчитывает устаревшие счётчики одним UNION ALL и сохраняет их одним upsert.
+    stale — список (table, field, owner_id). При ошибке пакета — по одному через _count_auto.
+    """
+    counts: Dict[Tuple[str, str, str], int] = {}
+    if not stale:
+        return counts
+    types = _owner_column_types(cur)
+    parts = []
+    for idx, (table, field, owner_id) in enumerate(stale):
+        pred = _owner_predicate(types, table, field, owner_id)
+        if not pred:
+            counts[(table, field, owner_id)] = 0
+            continue
+        parts.append(f"SELECT {idx} AS idx, COUNT(*)::int AS c FROM {SCHEMA}.{table} WHERE {pred}")
+    try:
+        if parts:
+            cur.execute(' UNION ALL '.join(parts))
+            for row in cur.fetchall():
+                idx, c = (row['idx'], row['c']) if isinstance(row, dict) else row
+                counts[stale[idx]] = int(c or 0)
+    except Exception as e:
+        errors.append(f"batch count: {type(e).__name__}: {str(e)[:100]}")
+        cur.connection.rollback()
+        for table, field, owner_id in stale:
+            if (table, field, owner_id) not in counts:
+                user_id = owner_id if field == 'user_id' else ''
+                family_id = owner_id if field == 'family_id' else ''
+                counts[(table, field, owner_id)] = _count_auto(cur, table, field, user_id, family_id, errors)
+
+    values = ', '.join(
+        f"('{field}', '{_esc(owner_id)}', '{table}', {int(c)}, CURRENT_TIMESTAMP)"
+        for (table, field, owner_id), c in counts.items()
+    )
+    try:
+        cur.execute(f"""
+            INSERT INTO {SCHEMA}.dashboard_auto_counters (owner_field, owner_id, table_name, cnt, refreshed_at)
+            VALUES {values}
+            ON CONFLICT (owner_field, owner_id, table_name) DO UPDATE SET
+              cnt = EXCLUDED.cnt, refreshed_at = EXCLUDED.refreshed_at
+        """)
+        cur.connection.commit()
+    except Exception as e:
+        errors.append(f"counters upsert: {type(e).__name__}: {str(e)[:100]}")
+        cur.connection.rollback()
+    return counts
+
+
 def _load_dashboard(user_id: str) -> Dict[str, Any]:
     uid = _esc(user_id)
     with _conn() as conn:
@@ -121,6 +205,8 @@ def _load_dashboard(user_id: str) -> Dict[str, Any]:
                 SELECT s.id, s.hub_id, s.slug, s.title, s.icon, s.route, s.position,
                        s.auto_table, s.auto_user_field, s.auto_min_count,
                        s.auto_logic, s.auto_supported,
+                       ac.cnt AS auto_cached_count,
+                       (ac.refreshed_at > CURRENT_TIMESTAMP - INTERVAL '{AUTO_COUNTER_TTL_SECONDS} seconds') AS auto_fresh,
                        COALESCE(h.scope, 'family') AS hub_scope,
                        COALESCE(
                          CASE WHEN COALESCE(h.scope, 'family') = 'family'
@@ -133,6 +219,11 @@ def _load_dashboard(user_id: str) -> Dict[str, Any]:
                   ON us.section_id = s.id AND us.user_id = '{uid}'
                 LEFT JOIN {SCHEMA}.dashboard_family_settings fs
                   ON fs.section_id = s.id AND fs.family_id = '{fid}'
+                LEFT JOIN {SCHEMA}.dashboard_auto_counters ac
+                  ON ac.table_name = s.auto_table
+                 AND ac.owner_field = COALESCE(s.auto_user_field, 'user_id')
+                 AND ac.owner_id = CASE WHEN COALESCE(s.auto_user_field, 'user_id') = 'family_id'
+                                        THEN '{fid}' ELSE '{uid}' END
                 ORDER BY s.hub_id, s.position
             """)
             sections = [dict(r) for r in cur.fetchall()]
@@ -162,33 +253,52 @@ def _load_dashboard(user_id: str) -> Dict[str, Any]:
                 steps_by_section.setdefault(st['section_id'], []).append(st)
 
             debug_errors: list = []
-            with conn.cursor() as ccur:
-                debug_family_id = family_id
-                for s in sections:
-                    s_steps = steps_by_section.get(s['id'], [])
-                    s['steps'] = s_steps
-                    s['total_steps'] = len(s_steps)
-                    s['auto_count'] = 0
-                    s['auto_target'] = int(s.get('auto_min_count') or 1)
-
-                    if s.get('mode') == 'auto' and s.get('auto_supported') and s.get('auto_table'):
-                        cnt = _count_auto(
-                            ccur,
-                            s['auto_table'],
-                            s.get('auto_user_field') or 'user_id',
-                            user_id,
-                            family_id,
-                            debug_errors,
-                        )
-                        s['auto_count'] = cnt
-                        target = max(1, int(s.get('auto_min_count') or 1))
-                        progress = min(100, round(cnt / target * 100))
-                        s['progress'] = progress
-                        s['completed_steps'] = min(s['total_steps'], int(progress / 100 * s['total_steps']))
-                    else:
-                        done = sum(1 for x in s_steps if x['completed'])
-                        s['completed_steps'] = done
-                        s['progress'] = round(done / s['total_steps'] * 100) if s['total_steps'] else 0
+            debug_family_id = family_id
+
+            # Auto-прогресс: счётчики из dashboard_auto_counters (пришли в запросе выше),
+            # устаревшие/отсутствующие пересчитываются одним пакетом
+            def _auto_key(sec) -> Tuple[str, str, str]:
+                field = sec.get('auto_user_field') or 'user_id'
+                return (sec['auto_table'], field, family_id if field == 'family_id' else user_id)
+
+            auto_sections = [
+                s for s in sections
+                if s.get('mode') == 'auto' and s.get('auto_supported') and s.get('auto_table')
+            ]
+            stale = []
+            for s in auto_sections:
+                key = _auto_key(s)
+                if s['auto_table'] not in ALLOWED_AUTO_TABLES or key[1] not in ALLOWED_USER_FIELDS:
+                    debug_errors.append(f"{key[0]}.{key[1]}: not in allowlist")
+                    continue
+                if not key[2]:
+                    debug_errors.append(f"{key[0]}.{key[1]}: empty value (family_id={family_id})")
+                    continue
+                if not s.get('auto_fresh') and key not in stale:
+                    stale.append(key)
+            refreshed = _refresh_auto_counters(cur, stale, debug_errors)
+
+            for s in sections:
+                s_steps = steps_by_section.get(s['id'], [])
+                s['steps'] = s_steps
+                s['total_steps'] = len(s_steps)
+                s['auto_count'] = 0
+                s['auto_target'] = int(s.get('auto_min_count') or 1)
+                cached_count = s.pop('auto_cached_count', None)
+                s.pop('auto_fresh', None)
+
+                if s.get('mode') == 'auto' and s.get('auto_supported') and s.get('auto_table'):
+                    key = _auto_key(s)
+                    cnt = refreshed.get(key, cached_count) or 0
+                    s['auto_count'] = int(cnt)
+                    target = max(1, int(s.get('auto_min_count') or 1))
+                    progress = min(100, round(cnt / target * 100))
+                    s['progress'] = progress
+                    s['completed_steps'] = min(s['total_steps'], int(progress / 100 * s['total_steps']))
+                else:
+                    done = sum(1 for x in s_steps if x['completed'])
+                    s['completed_steps'] = done
+                    s['progress'] = round(done / s['total_steps'] * 100) if s['total_steps'] else 0
 
     sections_by_hub: Dict[int, list] = {}
     for s in sections:
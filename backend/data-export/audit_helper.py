@@ -7,7 +7,7 @@ from typing import Dict, Any, Optional
 AUDIT_LOGGER_URL = 'https://functions.poehali.dev/4891fda0-83fb-499e-833a-b3b88aeb0c4f'
 
 def log_data_export(
-    user_id: int,
+    user_id: str,
     export_format: str,
     records_count: int = 0
 ):
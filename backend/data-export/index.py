@@ -1,32 +1,83 @@
 """
 Business: Экспорт данных семьи в PDF или Excel для резервных копий
-Args: event с httpMethod, queryStringParameters (format: pdf/excel), headers с X-Auth-Token
+Args: event с httpMethod, queryStringParameters (format: pdf/excel, action), headers с X-Auth-Token
 Returns: файл PDF или Excel со всеми данными семьи
+
+GET  /?format=csv|pdf — синхронный экспорт в теле ответа (небольшие семьи)
+POST /?action=start&format=csv|pdf — фоновое задание: строки читаются серверными курсорами
+     и пишутся в S3 частями (multipart), ответ — job_id
+POST /?action=run&job_id=... — выполнить задание (вызывается самой функцией после start)
+GET  /?action=status&job_id=... — прогресс rows_done / rows_total, по готовности — ссылка на скачивание
 """
 
 import json
 import os
 import csv
 import io
+import html
+import threading
+import urllib.request
 from datetime import datetime
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Optional, Callable, Iterator
 import psycopg2
 from psycopg2.extras import RealDictCursor
 from audit_helper import log_data_export
+from s3_limit_utils import record_s3_object
 
 DATABASE_URL = os.environ.get('DATABASE_URL')
 SCHEMA = 't_p5815085_family_assistant_pro'
+DATA_EXPORT_URL = 'https://functions.poehali.dev/bc534308-e636-472a-9104-78e3268c1157'
+
+S3_BUCKET = 'files'
+EXPORT_PREFIX = 'exports'
+
+# Размер части multipart-загрузки (S3 требует не меньше 5 МБ для всех частей, кроме последней)
+PART_SIZE_BYTES = 8 * 1024 * 1024
+# Сколько строк серверный курсор отдаёт за один FETCH и как часто пишется прогресс
+FETCH_ROWS = 1000
+# Ссылка на готовый файл — presigned GET, экспорт содержит личные данные
+DOWNLOAD_URL_EXPIRES_SECONDS = 3600
+# Задание в queued дольше этого — повторно «пинаем» run; running дольше STALE — можно перезапустить
+REKICK_AFTER_SECONDS = 30
+STALE_JOB_MINUTES = 15
+
+MEMBERS_SQL = f"""
+    SELECT id, name, role, relationship, points, level, workload, created_at
+    FROM {SCHEMA}.family_members
+    WHERE family_id = %s
+    ORDER BY created_at
+"""
+
+TASKS_SQL = f"""
+    SELECT t.id, t.title, t.description, t.completed, t.points, t.priority,
+           t.category, t.created_at, fm.name as assignee_name
+    FROM {SCHEMA}.tasks t
+    LEFT JOIN {SCHEMA}.family_members fm ON t.assignee_id = fm.id
+    WHERE t.family_id = %s
+    ORDER BY t.created_at DESC
+"""
+
+CORS_JSON = {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'}
+
 
 def get_db_connection():
     return psycopg2.connect(DATABASE_URL)
 
+def get_s3():
+    import boto3
+    return boto3.client('s3',
+        endpoint_url='https://bucket.poehali.dev',
+        aws_access_key_id=os.environ['AWS_ACCESS_KEY_ID'],
+        aws_secret_access_key=os.environ['AWS_SECRET_ACCESS_KEY']
+    )
+
 def verify_token(token: str) -> Optional[str]:
     conn = get_db_connection()
     cur = conn.cursor(cursor_factory=RealDictCursor)
-    
+
     cur.execute(
         f"""
-        SELECT user_id FROM {SCHEMA}.sessions 
+        SELECT user_id FROM {SCHEMA}.sessions
         WHERE token = %s AND expires_at > CURRENT_TIMESTAMP
         """,
         (token,)
@@ -34,13 +85,11 @@ def verify_token(token: str) -> Optional[str]:
     session = cur.fetchone()
     cur.close()
     conn.close()
-    
+
     return str(session['user_id']) if session else None
 
-def get_family_data(user_id: str) -> Dict[str, Any]:
-    conn = get_db_connection()
+def get_family(conn, user_id: str) -> Optional[Dict[str, Any]]:
     cur = conn.cursor(cursor_factory=RealDictCursor)
-    
     cur.execute(
         f"""
         SELECT fm.family_id, f.name as family_name
@@ -50,79 +99,144 @@ def get_family_data(user_id: str) -> Dict[str, Any]:
         """,
         (user_id,)
     )
-    family_info = cur.fetchone()
-    
-    if not family_info:
-        cur.close()
-        conn.close()
-        return {'error': 'Семья не найдена'}
-    
-    family_id = family_info['family_id']
-    
-    cur.execute(
-        f"""
-        SELECT id, name, role, relationship, points, level, workload, created_at
-        FROM {SCHEMA}.family_members
-        WHERE family_id = %s
-        ORDER BY created_at
-        """,
-        (family_id,)
-    )
-    members = cur.fetchall()
-    
+    family = cur.fetchone()
+    cur.close()
+    return dict(family) if family else None
+
+def count_rows(conn, family_id: str) -> int:
+    cur = conn.cursor()
     cur.execute(
         f"""
-        SELECT t.id, t.title, t.description, t.completed, t.points, t.priority, 
-               t.category, t.created_at, fm.name as assignee_name
-        FROM {SCHEMA}.tasks t
-        LEFT JOIN {SCHEMA}.family_members fm ON t.assignee_id = fm.id
-        WHERE t.family_id = %s
-        ORDER BY t.created_at DESC
+        SELECT (SELECT COUNT(*) FROM {SCHEMA}.family_members WHERE family_id = %s)
+             + (SELECT COUNT(*) FROM {SCHEMA}.tasks WHERE family_id = %s)
         """,
-        (family_id,)
+        (family_id, family_id)
     )
-    tasks = cur.fetchall()
-    
+    total = cur.fetchone()[0]
     cur.close()
-    conn.close()
-    
-    return {
-        'family_name': family_info['family_name'],
-        'members': [dict(m) for m in members],
-        'tasks': [dict(t) for t in tasks],
-        'export_date': datetime.now().isoformat()
-    }
+    return int(total or 0)
+
+def stream_rows(conn, name: str, sql: str, params: tuple) -> Iterator[Dict[str, Any]]:
+    """Серверный (именованный) курсор: в памяти не больше FETCH_ROWS строк за раз."""
+    cur = conn.cursor(name=name, cursor_factory=RealDictCursor)
+    cur.itersize = FETCH_ROWS
+    try:
+        cur.execute(sql, params)
+        for row in cur:
+            yield row
+    finally:
+        cur.close()
+
+
+class S3ChunkWriter:
+    """
+    Файл-подобный объект: write() копит байты и отправляет в S3 частями по PART_SIZE_BYTES.
+    Маленький экспорт (одна часть) уходит обычным put_object.
+    """
+
+    def __init__(self, s3, key: str, content_type: str):
+        self.s3 = s3
+        self.key = key
+        self.content_type = content_type
+        self.buffer = bytearray()
+        self.upload_id = None
+        self.parts = []
+        self.size = 0
 
-def generate_csv_export(data: Dict[str, Any]) -> str:
-    output = io.StringIO()
-    
-    output.write(f"Семейный Органайзер - Экспорт данных\n")
-    output.write(f"Семья: {data['family_name']}\n")
-    output.write(f"Дата экспорта: {datetime.now().strftime('%d.%m.%Y %H:%M')}\n")
-    output.write("\n")
-    
-    output.write("=== ЧЛЕНЫ СЕМЬИ ===\n")
-    output.write("Имя,Роль,Родство,Баллы,Уровень,Загрузка %,Дата добавления\n")
-    for member in data['members']:
-        output.write(f"{member['name']},{member['role']},{member.get('relationship', '')},{member['points']},{member['level']},{member['workload']},{member['created_at']}\n")
-    
-    output.write("\n=== ЗАДАЧИ ===\n")
-    output.write("Название,Описание,Исполнитель,Выполнена,Баллы,Приоритет,Категория,Дата создания\n")
-    for task in data['tasks']:
-        completed = 'Да' if task['completed'] else 'Нет'
-        desc = (task['description'] or '').replace('\n', ' ').replace(',', ';')
-        output.write(f"{task['title']},{desc},{task.get('assignee_name', '')},{completed},{task['points']},{task['priority']},{task.get('category', '')},{task['created_at']}\n")
-    
-    output.write(f"\n=== СТАТИСТИКА ===\n")
-    output.write(f"Всего членов семьи,{len(data['members'])}\n")
-    output.write(f"Всего задач,{len(data['tasks'])}\n")
-    output.write(f"Выполнено задач,{sum(1 for t in data['tasks'] if t['completed'])}\n")
-    output.write(f"Общие баллы семьи,{sum(m['points'] for m in data['members'])}\n")
-    
-    return output.getvalue()
-
-def generate_html_for_pdf(data: Dict[str, Any]) -> str:
-    html = f"""
+    def write(self, text: str) -> None:
+        data = text.encode('utf-8')
+        self.buffer.extend(data)
+        self.size += len(data)
+        if len(self.buffer) >= PART_SIZE_BYTES:
+            self._flush_part()
+
+    def _flush_part(self) -> None:
+        if self.upload_id is None:
+            mpu = self.s3.create_multipart_upload(Bucket=S3_BUCKET, Key=self.key, ContentType=self.content_type)
+            self.upload_id = mpu['UploadId']
+        part_number = len(self.parts) + 1
+        resp = self.s3.upload_part(
+            Bucket=S3_BUCKET, Key=self.key, UploadId=self.upload_id,
+            PartNumber=part_number, Body=bytes(self.buffer)
+        )
+        self.parts.append({'ETag': resp['ETag'], 'PartNumber': part_number})
+        self.buffer = bytearray()
+
+    def close(self) -> int:
+        if self.upload_id is None:
+            self.s3.put_object(Bucket=S3_BUCKET, Key=self.key, Body=bytes(self.buffer), ContentType=self.content_type)
+        else:
+            if self.buffer:
+                self._flush_part()
+            self.s3.complete_multipart_upload(
+                Bucket=S3_BUCKET, Key=self.key, UploadId=self.upload_id,
+                MultipartUpload={'Parts': self.parts}
+            )
+        self.buffer = bytearray()
+        return self.size
+
+    def abort(self) -> None:
+        if self.upload_id is not None:
+            try:
+                self.s3.abort_multipart_upload(Bucket=S3_BUCKET, Key=self.key, UploadId=self.upload_id)
+            except Exception as e:
+                print(f"[data-export] abort multipart failed: {e}")
+
+
+def write_csv_export(out, conn, family: Dict[str, Any],
+                     on_rows: Optional[Callable[[int], None]] = None) -> int:
+    """Пишет CSV в out построчно, статистика копится по ходу. Возвращает число строк данных."""
+    family_id = family['family_id']
+    writer = csv.writer(out, lineterminator='\n')
+    rows = 0
+    members_count = tasks_count = completed_count = total_points = 0
+
+    out.write(f"Семейный Органайзер - Экспорт данных\n")
+    out.write(f"Семья: {family['family_name']}\n")
+    out.write(f"Дата экспорта: {datetime.now().strftime('%d.%m.%Y %H:%M')}\n")
+    out.write("\n")
+
+    out.write("=== ЧЛЕНЫ СЕМЬИ ===\n")
+    writer.writerow(['Имя', 'Роль', 'Родство', 'Баллы', 'Уровень', 'Загрузка %', 'Дата добавления'])
+    for member in stream_rows(conn, 'export_members', MEMBERS_SQL, (family_id,)):
+        writer.writerow([member['name'], member['role'], member.get('relationship') or '', member['points'],
+                         member['level'], member['workload'], member['created_at']])
+        members_count += 1
+        total_points += member['points'] or 0
+        rows += 1
+        if on_rows and rows % FETCH_ROWS == 0:
+            on_rows(rows)
+
+    out.write("\n=== ЗАДАЧИ ===\n")
+    writer.writerow(['Название', 'Описание', 'Исполнитель', 'Выполнена', 'Баллы', 'Приоритет', 'Категория', 'Дата создания'])
+    for task in stream_rows(conn, 'export_tasks', TASKS_SQL, (family_id,)):
+        desc = (task['description'] or '').replace('\n', ' ')
+        writer.writerow([task['title'], desc, task.get('assignee_name') or '', 'Да' if task['completed'] else 'Нет',
+                         task['points'], task['priority'], task.get('category') or '', task['created_at']])
+        tasks_count += 1
+        if task['completed']:
+            completed_count += 1
+        rows += 1
+        if on_rows and rows % FETCH_ROWS == 0:
+            on_rows(rows)
+
+    out.write(f"\n=== СТАТИСТИКА ===\n")
+    out.write(f"Всего членов семьи,{members_count}\n")
+    out.write(f"Всего задач,{tasks_count}\n")
+    out.write(f"Выполнено задач,{completed_count}\n")
+    out.write(f"Общие баллы семьи,{total_points}\n")
+
+    return rows
+
+def write_html_export(out, conn, family: Dict[str, Any],
+                      on_rows: Optional[Callable[[int], None]] = None) -> int:
+    """HTML для печати в PDF, пишется в out по строкам таблиц. Возвращает число строк данных."""
+    family_id = family['family_id']
+    esc = lambda v: html.escape(str(v if v is not None else '-'))
+    rows = 0
+    members_count = tasks_count = completed_count = total_points = 0
+
+    out.write(f"""
     <!DOCTYPE html>
     <html>
     <head>
@@ -141,9 +255,9 @@ def generate_html_for_pdf(data: Dict[str, Any]) -> str:
     </head>
     <body>
         <h1>🏠 Семейный Органайзер</h1>
-        <p><strong>Семья:</strong> {data['family_name']}</p>
+        <p><strong>Семья:</strong> {esc(family['family_name'])}</p>
         <p><strong>Дата экспорта:</strong> {datetime.now().strftime('%d.%m.%Y %H:%M')}</p>
-        
+
         <h2>👨‍👩‍👧‍👦 Члены семьи</h2>
         <table>
             <tr>
@@ -154,23 +268,28 @@ def generate_html_for_pdf(data: Dict[str, Any]) -> str:
                 <th>Уровень</th>
                 <th>Загрузка</th>
             </tr>
-    """
-    
-    for member in data['members']:
-        html += f"""
+    """)
+
+    for member in stream_rows(conn, 'export_members', MEMBERS_SQL, (family_id,)):
+        out.write(f"""
             <tr>
-                <td>{member['name']}</td>
-                <td>{member['role']}</td>
-                <td>{member.get('relationship', '-')}</td>
-                <td>{member['points']}</td>
-                <td>{member['level']}</td>
-                <td>{member['workload']}%</td>
+                <td>{esc(member['name'])}</td>
+                <td>{esc(member['role'])}</td>
+                <td>{esc(member.get('relationship'))}</td>
+                <td>{esc(member['points'])}</td>
+                <td>{esc(member['level'])}</td>
+                <td>{esc(member['workload'])}%</td>
             </tr>
-        """
-    
-    html += """
+        """)
+        members_count += 1
+        total_points += member['points'] or 0
+        rows += 1
+        if on_rows and rows % FETCH_ROWS == 0:
+            on_rows(rows)
+
+    out.write("""
         </table>
-        
+
         <h2>✅ Задачи</h2>
         <table>
             <tr>
@@ -180,63 +299,243 @@ def generate_html_for_pdf(data: Dict[str, Any]) -> str:
                 <th>Баллы</th>
                 <th>Приоритет</th>
             </tr>
-    """
-    
-    for task in data['tasks'][:50]:
+    """)
+
+    for task in stream_rows(conn, 'export_tasks', TASKS_SQL, (family_id,)):
         status = '<span class="completed">✓ Выполнена</span>' if task['completed'] else '<span class="pending">⏳ В работе</span>'
-        html += f"""
+        out.write(f"""
             <tr>
-                <td>{task['title']}</td>
-                <td>{task.get('assignee_name', '-')}</td>
+                <td>{esc(task['title'])}</td>
+                <td>{esc(task.get('assignee_name'))}</td>
                 <td>{status}</td>
-                <td>{task['points']}</td>
-                <td>{task['priority']}</td>
+                <td>{esc(task['points'])}</td>
+                <td>{esc(task['priority'])}</td>
             </tr>
-        """
-    
-    total_tasks = len(data['tasks'])
-    completed_tasks = sum(1 for t in data['tasks'] if t['completed'])
-    total_points = sum(m['points'] for m in data['members'])
-    
-    html += f"""
+        """)
+        tasks_count += 1
+        if task['completed']:
+            completed_count += 1
+        rows += 1
+        if on_rows and rows % FETCH_ROWS == 0:
+            on_rows(rows)
+
+    out.write(f"""
         </table>
-        
+
         <div class="stats">
             <h2>📊 Статистика</h2>
-            <p><strong>Всего членов семьи:</strong> {len(data['members'])}</p>
-            <p><strong>Всего задач:</strong> {total_tasks}</p>
-            <p><strong>Выполнено задач:</strong> {completed_tasks} ({round(completed_tasks/total_tasks*100 if total_tasks > 0 else 0)}%)</p>
+            <p><strong>Всего членов семьи:</strong> {members_count}</p>
+            <p><strong>Всего задач:</strong> {tasks_count}</p>
+            <p><strong>Выполнено задач:</strong> {completed_count} ({round(completed_count/tasks_count*100 if tasks_count > 0 else 0)}%)</p>
             <p><strong>Общие баллы семьи:</strong> {total_points}</p>
         </div>
-        
+
         <p style="color: #6b7280; font-size: 12px; margin-top: 40px;">
             Экспортировано из Семейного Органайзера • poehali.dev
         </p>
     </body>
     </html>
+    """)
+
+    return rows
+
+
+def _kick_run(job_id: str) -> None:
+    try:
+        req = urllib.request.Request(
+            f'{DATA_EXPORT_URL}?action=run&job_id={job_id}',
+            data=b'{}',
+            headers={'Content-Type': 'application/json'},
+            method='POST',
+        )
+        urllib.request.urlopen(req, timeout=25).read()
+    except Exception as e:
+        print(f"[data-export] run kick failed: {e}")
+
+def kick_run_background(job_id: str) -> None:
+    try:
+        threading.Thread(target=_kick_run, args=(job_id,), daemon=True).start()
+    except Exception as e:
+        print(f"[data-export] thread start failed: {e}")
+
+def start_job(user_id: str, export_format: str) -> Dict[str, Any]:
+    conn = get_db_connection()
+    try:
+        family = get_family(conn, user_id)
+        if not family:
+            return {'error': 'Семья не найдена'}
+        cur = conn.cursor()
+        cur.execute(
+            f"""
+            INSERT INTO {SCHEMA}.data_export_jobs (user_id, family_id, format)
+            VALUES (%s, %s, %s) RETURNING id
+            """,
+            (user_id, family['family_id'], export_format)
+        )
+        job_id = str(cur.fetchone()[0])
+        conn.commit()
+        cur.close()
+    finally:
+        conn.close()
+
+    kick_run_background(job_id)
+    return {'job_id': job_id, 'status': 'queued'}
+
+def run_job(job_id: str) -> Dict[str, Any]:
     """
-    
-    return html
+    Забирает задание (queued или зависшее running) и выполняет его.
+    Экспорт идёт в своей транзакции с серверными курсорами, прогресс пишется отдельным соединением.
+    """
+    progress_conn = get_db_connection()
+    progress_conn.autocommit = True
+    pcur = progress_conn.cursor(cursor_factory=RealDictCursor)
+    pcur.execute(
+        f"""
+        UPDATE {SCHEMA}.data_export_jobs
+        SET status = 'running', started_at = NOW(), rows_done = 0, error = NULL
+        WHERE id = %s
+          AND (status = 'queued'
+               OR (status = 'running' AND started_at < NOW() - INTERVAL '{STALE_JOB_MINUTES} minutes'))
+        RETURNING id, user_id, family_id, format
+        """,
+        (job_id,)
+    )
+    job = pcur.fetchone()
+    if not job:
+        pcur.close()
+        progress_conn.close()
+        return {'job_id': job_id, 'claimed': False}
+
+    def on_rows(done: int) -> None:
+        pcur.execute(f"UPDATE {SCHEMA}.data_export_jobs SET rows_done = %s WHERE id = %s", (done, job_id))
+
+    is_pdf = job['format'] == 'pdf'
+    s3_key = f"{EXPORT_PREFIX}/{job['family_id']}/{job_id}.{'html' if is_pdf else 'csv'}"
+    writer = None
+    conn = get_db_connection()
+    try:
+        cur = conn.cursor(cursor_factory=RealDictCursor)
+        cur.execute(f"SELECT name as family_name FROM {SCHEMA}.families WHERE id = %s", (job['family_id'],))
+        family = {'family_id': job['family_id'], 'family_name': (cur.fetchone() or {}).get('family_name', '')}
+        cur.close()
+
+        rows_total = count_rows(conn, job['family_id'])
+        pcur.execute(f"UPDATE {SCHEMA}.data_export_jobs SET rows_total = %s WHERE id = %s", (rows_total, job_id))
+
+        writer = S3ChunkWriter(get_s3(), s3_key, 'text/html; charset=utf-8' if is_pdf else 'text/csv; charset=utf-8')
+        if is_pdf:
+            rows = write_html_export(writer, conn, family, on_rows)
+        else:
+            rows = write_csv_export(writer, conn, family, on_rows)
+        size = writer.close()
+        conn.commit()
+        record_s3_object(progress_conn, SCHEMA, s3_key, size, family_id=str(job['family_id']),
+                         content_type=writer.content_type, source='data-export')
+
+        pcur.execute(
+            f"""
+            UPDATE {SCHEMA}.data_export_jobs
+            SET status = 'done', rows_done = %s, rows_total = GREATEST(rows_total, %s),
+                s3_key = %s, size_bytes = %s, finished_at = NOW()
+            WHERE id = %s
+            """,
+            (rows, rows, s3_key, size, job_id)
+        )
+        log_data_export(user_id=str(job['user_id']), export_format=job['format'], records_count=rows)
+        return {'job_id': job_id, 'status': 'done', 'rows': rows, 'size_bytes': size}
+    except Exception as e:
+        print(f"[data-export] job {job_id} failed: {e}")
+        if writer is not None:
+            writer.abort()
+        pcur.execute(
+            f"UPDATE {SCHEMA}.data_export_jobs SET status = 'error', error = %s, finished_at = NOW() WHERE id = %s",
+            (str(e)[:1000], job_id)
+        )
+        return {'job_id': job_id, 'status': 'error', 'error': str(e)}
+    finally:
+        conn.close()
+        pcur.close()
+        progress_conn.close()
+
+def get_job_status(user_id: str, job_id: str) -> Optional[Dict[str, Any]]:
+    conn = get_db_connection()
+    cur = conn.cursor(cursor_factory=RealDictCursor)
+    cur.execute(
+        f"""
+        SELECT id, format, status, rows_total, rows_done, s3_key, size_bytes, error,
+               created_at, finished_at,
+               (status = 'queued' AND created_at < NOW() - INTERVAL '{REKICK_AFTER_SECONDS} seconds')
+               OR (status = 'running' AND started_at < NOW() - INTERVAL '{STALE_JOB_MINUTES} minutes') AS need_kick
+        FROM {SCHEMA}.data_export_jobs
+        WHERE id = %s AND user_id = %s
+        """,
+        (job_id, user_id)
+    )
+    job = cur.fetchone()
+    cur.close()
+    conn.close()
+    if not job:
+        return None
+
+    if job['need_kick']:
+        kick_run_background(job_id)
+
+    result = {
+        'job_id': str(job['id']),
+        'format': job['format'],
+        'status': job['status'],
+        'rows_total': job['rows_total'],
+        'rows_done': job['rows_done'],
+        'progress': round(job['rows_done'] / job['rows_total'] * 100) if job['rows_total'] else (100 if job['status'] == 'done' else 0),
+        'size_bytes': job['size_bytes'],
+        'error': job['error'],
+        'created_at': job['created_at'].isoformat() if job['created_at'] else None,
+        'finished_at': job['finished_at'].isoformat() if job['finished_at'] else None,
+    }
+    if job['status'] == 'done' and job['s3_key']:
+        ext = 'html' if job['format'] == 'pdf' else 'csv'
+        filename = f"family_export_{job['finished_at'].strftime('%Y%m%d')}.{ext}"
+        result['download_url'] = get_s3().generate_presigned_url(
+            'get_object',
+            Params={
+                'Bucket': S3_BUCKET,
+                'Key': job['s3_key'],
+                'ResponseContentDisposition': f'attachment; filename="{filename}"',
+            },
+            ExpiresIn=DOWNLOAD_URL_EXPIRES_SECONDS
+        )
+    return result
+
 
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     method = event.get('httpMethod', 'GET')
-    
+
     if method == 'OPTIONS':
         return {
             'statusCode': 200,
             'headers': {
                 'Access-Control-Allow-Origin': '*',
-                'Access-Control-Allow-Methods': 'GET, OPTIONS',
+                'Access-Control-Allow-Methods': 'GET, POST, OPTIONS',
                 'Access-Control-Allow-Headers': 'Content-Type, X-Auth-Token',
                 'Access-Control-Max-Age': '86400'
             },
             'body': ''
         }
-    
+
     try:
-        token = event.get('headers', {}).get('X-Auth-Token', '')
+        params = event.get('queryStringParameters') or {}
+        action = params.get('action')
+        export_format = (params.get('format') or 'csv').lower()
+
+        if action == 'run' and method == 'POST':
+            job_id = params.get('job_id')
+            if not job_id:
+                return {'statusCode': 400, 'headers': CORS_JSON, 'body': json.dumps({'error': 'job_id обязателен'})}
+            return {'statusCode': 200, 'headers': CORS_JSON, 'body': json.dumps(run_job(job_id))}
+
+        token = (event.get('headers') or {}).get('X-Auth-Token', '')
         user_id = verify_token(token)
-        
+
         if not user_id:
             return {
                 'statusCode': 401,
@@ -246,34 +545,52 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 },
                 'body': json.dumps({'error': 'Требуется авторизация'})
             }
-        
-        data = get_family_data(user_id)
-        
-        if 'error' in data:
-            return {
-                'statusCode': 404,
-                'headers': {
-                    'Content-Type': 'application/json',
-                    'Access-Control-Allow-Origin': '*'
-                },
-                'body': json.dumps(data)
-            }
-        
-        params = event.get('queryStringParameters', {})
-        export_format = params.get('format', 'csv').lower()
-        
-        # Подсчет количества записей
-        total_records = len(data.get('members', [])) + len(data.get('tasks', []))
-        
+
+        if action == 'start' and method == 'POST':
+            result = start_job(user_id, 'pdf' if export_format == 'pdf' else 'csv')
+            if 'error' in result:
+                return {'statusCode': 404, 'headers': CORS_JSON, 'body': json.dumps(result, ensure_ascii=False)}
+            return {'statusCode': 202, 'headers': CORS_JSON, 'body': json.dumps(result)}
+
+        if action == 'status':
+            job_id = params.get('job_id')
+            if not job_id:
+                return {'statusCode': 400, 'headers': CORS_JSON, 'body': json.dumps({'error': 'job_id обязателен'})}
+            job = get_job_status(user_id, job_id)
+            if not job:
+                return {'statusCode': 404, 'headers': CORS_JSON, 'body': json.dumps({'error': 'Задание не найдено'})}
+            return {'statusCode': 200, 'headers': CORS_JSON, 'body': json.dumps(job, ensure_ascii=False)}
+
+        conn = get_db_connection()
+        try:
+            family = get_family(conn, user_id)
+
+            if not family:
+                return {
+                    'statusCode': 404,
+                    'headers': {
+                        'Content-Type': 'application/json',
+                        'Access-Control-Allow-Origin': '*'
+                    },
+                    'body': json.dumps({'error': 'Семья не найдена'})
+                }
+
+            output = io.StringIO()
+            if export_format == 'pdf':
+                total_records = write_html_export(output, conn, family)
+            else:
+                total_records = write_csv_export(output, conn, family)
+        finally:
+            conn.close()
+
         # Логирование экспорта
         log_data_export(
-            user_id=int(user_id),
+            user_id=user_id,
             export_format=export_format,
             records_count=total_records
         )
-        
+
         if export_format == 'pdf':
-            html_content = generate_html_for_pdf(data)
             return {
                 'statusCode': 200,
                 'headers': {
@@ -281,11 +598,10 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                     'Access-Control-Allow-Origin': '*',
                     'Content-Disposition': f'attachment; filename="family_export_{datetime.now().strftime("%Y%m%d")}.html"'
                 },
-                'body': html_content
+                'body': output.getvalue()
             }
-        
+
         else:
-            csv_content = generate_csv_export(data)
             return {
                 'statusCode': 200,
                 'headers': {
@@ -293,9 +609,9 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                     'Access-Control-Allow-Origin': '*',
                     'Content-Disposition': f'attachment; filename="family_export_{datetime.now().strftime("%Y%m%d")}.csv"'
                 },
-                'body': csv_content
+                'body': output.getvalue()
             }
-    
+
     except Exception as e:
         return {
             'statusCode': 500,
@@ -304,4 +620,4 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 'Access-Control-Allow-Origin': '*'
             },
             'body': json.dumps({'error': str(e)})
-        }
\ No newline at end of file
+        }
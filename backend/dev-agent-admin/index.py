@@ -14,12 +14,16 @@ import os
 import time
 import uuid
 import hashlib
+import math
 import re
 from typing import Any, Dict, List, Optional, Tuple
 
 import psycopg2
 import requests
 
+from code_embedding import embed_text, nearest, nearest_lists
+from s3_limit_utils import record_s3_object
+
 SCHEMA = '"t_p5815085_family_assistant_pro"'
 
 CORS_HEADERS = {
@@ -122,6 +126,304 @@ def _active_db_snapshot(cur, env: str) -> Optional[int]:
     return row[0] if row else None
 
 
+# ============================================================
+# Retrieval — ranked FTS (chunks) + trigram (paths, symbols)
+# ============================================================
+# Термы запроса режутся так же, как search_tsv в dev_agent_code_chunks:
+# идентификатор целиком + части camelCase / snake_case, конфиг 'simple'.
+MAX_QUERY_TERMS = 10
+CHUNK_CANDIDATES = 60
+# Веса видов при смешивании в одну выдачу
+KIND_WEIGHTS = {'symbol': 1.0, 'file': 0.95, 'route': 0.9, 'api': 0.9, 'db_table': 0.85, 'chunk': 0.85}
+
+_RE_QUERY_WORD = re.compile(r'[0-9A-Za-zА-Яа-яЁё_]+')
+_RE_CAMEL_PART = re.compile(r'[A-ZА-ЯЁ]?[a-zа-яё0-9]+|[A-ZА-ЯЁ]+(?![a-zа-яё])')
+
+
+def _query_terms(query: str, limit: Optional[int] = MAX_QUERY_TERMS) -> List[str]:
+    """'useDietQuiz save_plan' → ['usedietquiz', 'use', 'diet', 'quiz', 'save', 'plan']; limit=None — все термы"""
+    terms: List[str] = []
+    for word in _RE_QUERY_WORD.findall(query or ''):
+        parts = [] if '_' in word else [word]
+        for piece in word.split('_'):
+            parts.append(piece)
+            parts.extend(_RE_CAMEL_PART.findall(piece))
+        for p in parts:
+            t = p.lower()
+            if len(t) >= 2 and t not in terms:
+                terms.append(t)
+    return terms[:limit] if limit else terms
+
+
+def _normalized_query(query: str) -> str:
+    """Все термы запроса (без лимита), отсортированные: ключ кэша chat и текст для эмбеддинга —
+    follow-up с теми же термами в другом порядке/регистре даёт тот же retrieval."""
+    return ' '.join(sorted(set(_query_terms(query, limit=None))))
+
+
+def _tsquery_term(term: str) -> str:
+    return f"{term}:*" if len(term) >= 3 else term
+
+
+def _like_any(terms: List[str]) -> str:
+    pats = ', '.join(esc('%' + t.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%')
+                     for t in terms)
+    return f"ARRAY[{pats}]::text[]"
+
+
+def _term_coverage(text: Optional[str], terms: List[str]) -> float:
+    if not text or not terms:
+        return 0.0
+    low = text.lower()
+    return sum(1 for t in terms if t in low) / len(terms)
+
+
+def _rank_chunks(cur, snap_id: int, terms: List[str], limit: int, snippet_chars: int) -> List[Dict[str, Any]]:
+    """BM25-style ранжирование чанков: IDF-взвешенное покрытие термов запроса
+    × ts_rank_cd с нормировкой по длине; кандидаты — по GIN-индексу search_tsv."""
+    if not terms or limit <= 0:
+        return []
+    term_qs = [esc(_tsquery_term(t)) for t in terms]
+    df_cols = ', '.join(
+        f"(SELECT COUNT(*) FROM {SCHEMA}.dev_agent_code_chunks WHERE snapshot_id = {snap_id} "
+        f"AND search_tsv @@ to_tsquery('simple', {q}))"
+        for q in term_qs
+    )
+    cur.execute(
+        f"SELECT (SELECT GREATEST(chunks_count, 1) FROM {SCHEMA}.dev_agent_repo_snapshots "
+        f"WHERE id = {snap_id}), {df_cols}"
+    )
+    row = cur.fetchone()
+    n_docs = float(row[0] or 1)
+    idf = [math.log(1 + (n_docs - df + 0.5) / (df + 0.5)) for df in row[1:]]
+    idf_total = sum(idf) or 1.0
+
+    any_q = esc(' | '.join(_tsquery_term(t) for t in terms))
+    match_cols = ', '.join(f"c.search_tsv @@ to_tsquery('simple', {q})" for q in term_qs)
+    cur.execute(
+        f"SELECT c.id, c.symbol_name, c.start_line, c.end_line, "
+        f"substring(c.chunk_text from 1 for {int(snippet_chars)}), f.path, "
+        f"ts_rank_cd(c.search_tsv, q, 33), {match_cols} "
+        f"FROM {SCHEMA}.dev_agent_code_chunks c "
+        f"JOIN {SCHEMA}.dev_agent_files f ON f.id = c.file_id, "
+        f"to_tsquery('simple', {any_q}) q "
+        f"WHERE c.snapshot_id = {snap_id} AND c.search_tsv @@ q "
+        f"ORDER BY 7 DESC LIMIT {CHUNK_CANDIDATES}"
+    )
+    out = []
+    for r in cur.fetchall():
+        matched = r[7:]
+        coverage = sum(w for w, m in zip(idf, matched) if m) / idf_total
+        score = coverage * (0.5 + 0.5 * float(r[6] or 0))
+        if r[1] and r[1].lower() in terms:
+            score += 0.2
+        out.append({
+            'chunk_id': r[0], 'symbol_name': r[1], 'start_line': r[2], 'end_line': r[3],
+            'snippet': r[4] or '', 'path': r[5], 'score': round(min(score, 1.0), 4),
+        })
+    out.sort(key=lambda x: -x['score'])
+    return out[:limit]
+
+
+# Семантика: локальные эмбеддинги чанков + IVF (code_embedding.py, строит dev-agent-indexer)
+HYBRID_LEXICAL_WEIGHT = 0.6
+MIN_SEMANTIC_SIM = 0.15
+
+
+def _semantic_chunk_ids(cur, snap_id: int, qvec: Optional[List[float]], limit: int,
+                        exclude_file_id: Optional[int] = None,
+                        min_sim: float = MIN_SEMANTIC_SIM) -> List[Tuple[int, float]]:
+    """Ближайшие чанки по косинусу: центроиды IVF → просмотр IVF_NPROBE списков.
+    Снапшот без векторного индекса (или без NumPy) — пустой список, остаётся лексика."""
+    if not qvec or limit <= 0:
+        return []
+    cur.execute("SAVEPOINT semantic")
+    try:
+        cur.execute(
+            f"SELECT list_no, centroid FROM {SCHEMA}.dev_agent_vector_lists "
+            f"WHERE snapshot_id = {snap_id} ORDER BY list_no"
+        )
+        lists = cur.fetchall()
+        if not lists:
+            cur.execute("RELEASE SAVEPOINT semantic")
+            return []
+        probe = [lists[i][0] for i in nearest_lists(qvec, [r[1] for r in lists])]
+        cur.execute(
+            f"SELECT id, embedding FROM {SCHEMA}.dev_agent_code_chunks "
+            f"WHERE snapshot_id = {snap_id} AND ivf_list IN ({', '.join(str(int(n)) for n in probe)}) "
+            f"AND embedding IS NOT NULL"
+            + (f" AND file_id <> {int(exclude_file_id)}" if exclude_file_id else '')
+        )
+        rows = cur.fetchall()
+        cur.execute("RELEASE SAVEPOINT semantic")
+        return nearest(qvec, [r[0] for r in rows], [r[1] for r in rows], limit, min_sim)
+    except Exception as e:
+        cur.execute("ROLLBACK TO SAVEPOINT semantic")
+        print(f"[dev-agent-admin] semantic retrieval skipped: {e}")
+        return []
+
+
+def _chunk_details(cur, chunk_ids: List[int], snippet_chars: int) -> Dict[int, Dict[str, Any]]:
+    if not chunk_ids:
+        return {}
+    cur.execute(
+        f"SELECT c.id, c.symbol_name, c.start_line, c.end_line, "
+        f"substring(c.chunk_text from 1 for {int(snippet_chars)}), f.path "
+        f"FROM {SCHEMA}.dev_agent_code_chunks c "
+        f"JOIN {SCHEMA}.dev_agent_files f ON f.id = c.file_id "
+        f"WHERE c.id IN ({', '.join(str(int(i)) for i in chunk_ids)})"
+    )
+    return {
+        r[0]: {'chunk_id': r[0], 'symbol_name': r[1], 'start_line': r[2], 'end_line': r[3],
+               'snippet': r[4] or '', 'path': r[5]}
+        for r in cur.fetchall()
+    }
+
+
+def _hybrid_chunks(cur, snap_id: int, query: str, terms: List[str], limit: int,
+                   snippet_chars: int, semantic_text: Optional[str] = None) -> List[Dict[str, Any]]:
+    """Лексика (_rank_chunks) + семантика (эмбеддинги), смешанный скор
+    HYBRID_LEXICAL_WEIGHT * lexical + (1 - HYBRID_LEXICAL_WEIGHT) * cosine.
+    semantic_text — что эмбеддить вместо query (chat: нормализованный запрос, как в ключе кэша)."""
+    pool = max(limit * 3, limit)
+    lexical = {c['chunk_id']: c for c in _rank_chunks(cur, snap_id, terms, pool, snippet_chars)}
+    semantic = dict(_semantic_chunk_ids(cur, snap_id, embed_text(semantic_text or query), pool))
+
+    # без векторного индекса — чисто лексический скор, без понижения весом
+    w_lex = HYBRID_LEXICAL_WEIGHT if semantic else 1.0
+    missing = [cid for cid in semantic if cid not in lexical]
+    details = {**_chunk_details(cur, missing, snippet_chars), **lexical}
+    out = []
+    for cid, item in details.items():
+        lex = lexical[cid]['score'] if cid in lexical else 0.0
+        sem = max(0.0, semantic.get(cid, 0.0))
+        out.append({**item, 'score': round(w_lex * lex + (1 - w_lex) * sem, 4),
+                    'semantic': round(sem, 4)})
+    out.sort(key=lambda x: -x['score'])
+    return out[:limit]
+
+
+def _rank_files(cur, snap_id: int, query: str, terms: List[str], limit: int) -> List[Dict[str, Any]]:
+    """Файлы по пути: trigram word_similarity + доля термов в пути (GIN gin_trgm_ops)."""
+    if not terms or limit <= 0:
+        return []
+    q = esc(query.lower())
+    cur.execute(
+        f"SELECT id, path, lang_code, file_category, line_count, word_similarity({q}, lower(path)) "
+        f"FROM {SCHEMA}.dev_agent_files "
+        f"WHERE snapshot_id = {snap_id} "
+        f"AND (lower(path) LIKE ANY({_like_any(terms)}) OR {q} <% lower(path)) "
+        f"ORDER BY 6 DESC, path LIMIT {int(limit) * 4}"
+    )
+    out = []
+    for r in cur.fetchall():
+        score = 0.5 * float(r[5] or 0) + 0.5 * _term_coverage(r[1], terms)
+        out.append({'file_id': r[0], 'path': r[1], 'language': r[2], 'category': r[3],
+                    'line_count': r[4], 'score': round(score, 4)})
+    out.sort(key=lambda x: (-x['score'], x['path']))
+    return out[:limit]
+
+
+def _rank_symbols(cur, snap_id: int, query: str, terms: List[str], limit: int) -> List[Dict[str, Any]]:
+    """Символы: точное совпадение > trigram-похожесть > доля термов в имени."""
+    if not terms or limit <= 0:
+        return []
+    q = esc(query.lower())
+    cur.execute(
+        f"SELECT s.id, s.symbol_name, s.symbol_kind, s.line_no, f.path, "
+        f"word_similarity({q}, lower(s.symbol_name)) "
+        f"FROM {SCHEMA}.dev_agent_symbols s "
+        f"JOIN {SCHEMA}.dev_agent_files f ON f.id = s.file_id "
+        f"WHERE s.snapshot_id = {snap_id} "
+        f"AND (lower(s.symbol_name) LIKE ANY({_like_any(terms)}) OR {q} <% lower(s.symbol_name)) "
+        f"ORDER BY 6 DESC, s.symbol_name LIMIT {int(limit) * 4}"
+    )
+    out = []
+    for r in cur.fetchall():
+        if r[1].lower() in terms:
+            score = 1.0
+        else:
+            score = 0.5 * float(r[5] or 0) + 0.4 * _term_coverage(r[1], terms)
+        out.append({'symbol_id': r[0], 'symbol_name': r[1], 'symbol_kind': r[2],
+                    'line_no': r[3], 'path': r[4], 'score': round(score, 4)})
+    out.sort(key=lambda x: (-x['score'], x['symbol_name']))
+    return out[:limit]
+
+
+# ============================================================
+# Retrieval cache — по снапшоту (dev_agent_retrieval_cache)
+# ============================================================
+# Ключ: вид + нормализованный запрос (_normalized_query: все термы без лимита, отсортированные —
+# его же эмбеддит семантическая часть) или file_path + max_chunks.
+# Виды из RETRIEVAL_UNCACHED_KINDS не кэшируются: live() досчитывает их на каждый запрос.
+# snapshot_id входит в ключ строки: смена активного снапшота сразу даёт промах,
+# а dev-agent-indexer при активации удаляет записи неактивных снапшотов окружения.
+RETRIEVAL_CACHE_TTL_HOURS = 24
+RETRIEVAL_UNCACHED_KINDS = ('db_table',)
+
+
+def _retrieval_cache_key(kind: str, subject: str, max_chunks: int) -> str:
+    if kind == 'chat':
+        norm = _normalized_query(subject) or ' '.join(subject.lower().split())
+    else:
+        norm = subject.strip()
+    raw = f"{kind}|{norm}|{int(max_chunks)}"
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+def _cached_retrieval(conn, env: str, kind: str, subject: str, max_chunks: int,
+                      builder, live=None) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+    """Активный снапшот и готовый retrieval — одним запросом; на промахе builder()
+    считает citations и результат сохраняется. live(cur) на попадании досчитывает
+    некэшируемые citations (RETRIEVAL_UNCACHED_KINDS). Ошибки кэша не ломают retrieval."""
+    cache_key = _retrieval_cache_key(kind, subject, max_chunks)
+    cur = conn.cursor()
+    cur.execute(
+        f"SELECT s.id, rc.payload "
+        f"FROM {SCHEMA}.dev_agent_repo_snapshots s "
+        f"LEFT JOIN {SCHEMA}.dev_agent_retrieval_cache rc ON rc.snapshot_id = s.id "
+        f"AND rc.cache_key = {esc(cache_key)} "
+        f"AND rc.created_at > NOW() - INTERVAL '{int(RETRIEVAL_CACHE_TTL_HOURS)} hours' "
+        f"WHERE s.environment = {esc(env)} AND s.is_active = TRUE "
+        f"ORDER BY s.created_at DESC LIMIT 1"
+    )
+    row = cur.fetchone()
+    snap_id = row[0] if row else _active_snapshot(cur, env)
+    if row and row[1]:
+        payload = row[1] if isinstance(row[1], dict) else json.loads(row[1])
+        cur.execute(
+            f"UPDATE {SCHEMA}.dev_agent_retrieval_cache SET hits = hits + 1, last_hit_at = NOW() "
+            f"WHERE snapshot_id = {int(snap_id)} AND cache_key = {esc(cache_key)}"
+        )
+        conn.commit()
+        allowed = payload['allowed']
+        summary = payload['summary']
+        if live is not None:
+            extra = live(cur)
+            allowed = _number_citations(allowed + extra)
+            summary = {**summary, 'total': len(allowed),
+                       'breakdown': {**(summary.get('breakdown') or {}), 'db': len(extra)}}
+        return allowed, {**summary, 'cache': 'hit'}
+
+    allowed, summary = builder(snap_id)
+    cached = [dict(c) for c in allowed if c['kind'] not in RETRIEVAL_UNCACHED_KINDS]
+    if cached and summary.get('snapshot_id'):
+        try:
+            cur.execute(
+                f"INSERT INTO {SCHEMA}.dev_agent_retrieval_cache "
+                f"(snapshot_id, cache_key, kind, payload) "
+                f"VALUES ({int(summary['snapshot_id'])}, {esc(cache_key)}, {esc(kind)}, "
+                f"{esc(json.dumps({'allowed': cached, 'summary': summary}, ensure_ascii=False, default=str))}::jsonb) "
+                f"ON CONFLICT (snapshot_id, cache_key) DO UPDATE SET "
+                f"payload = EXCLUDED.payload, created_at = NOW()"
+            )
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            print(f"[dev-agent-admin] retrieval cache store failed: {e}")
+    return allowed, {**summary, 'cache': 'miss'}
+
+
 # ============================================================
 # Actions
 # ============================================================
@@ -214,84 +516,62 @@ def action_search(conn, env: str, body: Dict[str, Any]) -> Dict[str, Any]:
     snap_id = _active_snapshot(cur, env)
     if not snap_id:
         return {'items': [], 'total': 0, 'reason': 'no_snapshot'}
+    terms = _query_terms(query)
+    if not terms:
+        return {'items': [], 'total': 0, 'snapshot_id': snap_id, 'query': query}
 
     items: List[Dict[str, Any]] = []
-    q_like = '%' + query.replace("'", "''") + '%'
+    likes = _like_any(terms)
 
-    # Files by path
-    cur.execute(
-        f"SELECT id, path, lang_code, file_category, line_count "
-        f"FROM {SCHEMA}.dev_agent_files "
-        f"WHERE snapshot_id = {snap_id} AND path ILIKE '{q_like}' "
-        f"ORDER BY path LIMIT 20"
-    )
-    for r in cur.fetchall():
-        items.append({
-            'type': 'file',
-            'file_id': r[0], 'path': r[1], 'language': r[2], 'category': r[3],
-            'line_count': r[4], 'score': 1.0,
-        })
+    for f in _rank_files(cur, snap_id, query, terms, 20):
+        items.append({'type': 'file', **f})
 
-    # Symbols
-    cur.execute(
-        f"SELECT s.id, s.symbol_name, s.symbol_kind, s.line_no, f.path "
-        f"FROM {SCHEMA}.dev_agent_symbols s "
-        f"JOIN {SCHEMA}.dev_agent_files f ON f.id = s.file_id "
-        f"WHERE s.snapshot_id = {snap_id} AND s.symbol_name ILIKE '{q_like}' "
-        f"ORDER BY s.symbol_name LIMIT 20"
-    )
-    for r in cur.fetchall():
-        items.append({
-            'type': 'symbol',
-            'symbol_id': r[0], 'symbol_name': r[1], 'symbol_kind': r[2],
-            'line_no': r[3], 'path': r[4], 'score': 0.95,
-        })
+    for sym in _rank_symbols(cur, snap_id, query, terms, 20):
+        items.append({'type': 'symbol', **sym})
 
     # Routes
     cur.execute(
         f"SELECT id, route_path, page_component, area "
         f"FROM {SCHEMA}.dev_agent_routes "
-        f"WHERE snapshot_id = {snap_id} AND (route_path ILIKE '{q_like}' OR page_component ILIKE '{q_like}') "
+        f"WHERE snapshot_id = {snap_id} AND (lower(route_path) LIKE ANY({likes}) "
+        f"OR lower(page_component) LIKE ANY({likes})) "
         f"ORDER BY route_path LIMIT 10"
     )
     for r in cur.fetchall():
         items.append({
             'type': 'route',
-            'route_id': r[0], 'route_path': r[1], 'page_component': r[2], 'area': r[3], 'score': 0.9,
+            'route_id': r[0], 'route_path': r[1], 'page_component': r[2], 'area': r[3],
+            'score': round(_term_coverage(f"{r[1]} {r[2] or ''}", terms), 4),
         })
 
     # API endpoints
     cur.execute(
         f"SELECT id, function_name, action_name, http_method, endpoint_path "
         f"FROM {SCHEMA}.dev_agent_api_endpoints "
-        f"WHERE snapshot_id = {snap_id} AND (function_name ILIKE '{q_like}' OR action_name ILIKE '{q_like}') "
+        f"WHERE snapshot_id = {snap_id} AND (lower(function_name) LIKE ANY({likes}) "
+        f"OR lower(action_name) LIKE ANY({likes})) "
         f"ORDER BY function_name LIMIT 10"
     )
     for r in cur.fetchall():
         items.append({
             'type': 'api',
             'api_id': r[0], 'function_name': r[1], 'action_name': r[2],
-            'http_method': r[3], 'endpoint_path': r[4], 'score': 0.9,
+            'http_method': r[3], 'endpoint_path': r[4],
+            'score': round(_term_coverage(f"{r[1]} {r[2] or ''}", terms), 4),
         })
 
-    # Code chunks (FTS by ILIKE on chunk_text)
+    # Code chunks — FTS по search_tsv + векторная близость
     if filters.get('include_chunks', True):
-        cur.execute(
-            f"SELECT c.id, c.symbol_name, c.start_line, c.end_line, "
-            f"substring(c.chunk_text from 1 for 200) AS snippet, f.path "
-            f"FROM {SCHEMA}.dev_agent_code_chunks c "
-            f"JOIN {SCHEMA}.dev_agent_files f ON f.id = c.file_id "
-            f"WHERE c.snapshot_id = {snap_id} AND c.chunk_text ILIKE '{q_like}' "
-            f"ORDER BY c.id LIMIT 10"
-        )
-        for r in cur.fetchall():
-            items.append({
-                'type': 'chunk',
-                'chunk_id': r[0], 'symbol_name': r[1], 'start_line': r[2], 'end_line': r[3],
-                'snippet': r[4], 'path': r[5], 'score': 0.7,
-            })
+        for c in _hybrid_chunks(cur, snap_id, query, terms, 10, 200):
+            items.append({'type': 'chunk', **c})
 
-    return {'items': items, 'total': len(items), 'snapshot_id': snap_id, 'query': query}
+    # смешанная выдача: релевантность внутри вида × вес вида
+    for it in items:
+        it['score'] = round(it['score'] * KIND_WEIGHTS.get(it['type'], 0.8), 4)
+    items.sort(key=lambda it: -it['score'])
+
+    return {'items': items, 'total': len(items), 'snapshot_id': snap_id, 'query': query,
+            'terms': terms}
 
 
 def action_files_tree(conn, env: str) -> Dict[str, Any]:
@@ -642,67 +922,83 @@ def _flag_enabled(cur, code: str, env: str) -> bool:
     return bool(row and row[0])
 
 
-def _build_allowed_citations(conn, env: str, query: str, max_chunks: int) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+def _db_table_citations(cur, query: str) -> List[Dict[str, Any]]:
+    """Таблицы БД по совпадению имени (top 3), скор уже с весом KIND_WEIGHTS['db_table'].
+    dev_agent_db_tables не привязаны к снапшоту кода — в кэш retrieval не попадают, считаются на каждый запрос."""
+    terms = _query_terms(query)
+    if not terms:
+        return []
+    cur.execute(
+        f"SELECT t.id, t.table_name "
+        f"FROM {SCHEMA}.dev_agent_db_tables t "
+        f"WHERE lower(t.table_name) LIKE ANY({_like_any(terms)}) "
+        f"ORDER BY t.table_name LIMIT 3"
+    )
+    return [{
+        'kind': 'db_table', 'file_path': f"db:{r[1]}",
+        'start_line': None, 'end_line': None, 'symbol_name': r[1],
+        'snippet': f"table {r[1]}",
+        'reason': f"Таблица БД {r[1]}",
+        'score': round(_term_coverage(r[1], terms) * KIND_WEIGHTS['db_table'], 4),
+    } for r in cur.fetchall()]
+
+
+def _number_citations(allowed: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Сортировка по скору и сквозные citation_id c1..cN."""
+    allowed.sort(key=lambda c: -c['score'])
+    for i, c in enumerate(allowed, 1):
+        c['citation_id'] = f'c{i}'
+    return allowed
+
+
+def _build_allowed_citations(conn, env: str, query: str, max_chunks: int,
+                             snap_id: Optional[int] = None) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
     """Делает retrieval по dev_agent_* и формирует список allowed citations [c1..cN].
     Возвращает (allowed_list, retrieval_summary).
     """
     cur = conn.cursor()
-    snap_id = _active_snapshot(cur, env)
+    snap_id = snap_id or _active_snapshot(cur, env)
     if not snap_id:
         return [], {'snapshot_id': None, 'total': 0, 'reason': 'no_snapshot'}
 
-    q_like = '%' + query.replace("'", "''") + '%'
+    terms = _query_terms(query)
+    if not terms:
+        return [], {'snapshot_id': snap_id, 'total': 0, 'reason': 'empty_query', 'query': query}
+    likes = _like_any(terms)
     allowed: List[Dict[str, Any]] = []
     counters = {'files': 0, 'symbols': 0, 'routes': 0, 'api': 0, 'chunks': 0, 'db': 0}
 
-    # 1. Code chunks (top 8)
-    cur.execute(
-        f"SELECT c.id, c.symbol_name, c.start_line, c.end_line, "
-        f"substring(c.chunk_text from 1 for 1200), f.path "
-        f"FROM {SCHEMA}.dev_agent_code_chunks c "
-        f"JOIN {SCHEMA}.dev_agent_files f ON f.id = c.file_id "
-        f"WHERE c.snapshot_id = {snap_id} AND c.chunk_text ILIKE '{q_like}' "
-        f"ORDER BY c.id LIMIT {min(max_chunks, 8)}"
-    )
-    for r in cur.fetchall():
+    # 1. Code chunks (top 8) — FTS + векторная близость
+    for c in _hybrid_chunks(cur, snap_id, query, terms, min(max_chunks, 8), 1200,
+                            semantic_text=_normalized_query(query)):
         allowed.append({
-            'kind': 'chunk', 'file_path': r[5],
-            'start_line': r[2], 'end_line': r[3],
-            'symbol_name': r[1], 'snippet': r[4] or '',
-            'reason': f"Код в {r[5]}" + (f" (символ {r[1]})" if r[1] else ''),
+            'kind': 'chunk', 'file_path': c['path'],
+            'start_line': c['start_line'], 'end_line': c['end_line'],
+            'symbol_name': c['symbol_name'], 'snippet': c['snippet'],
+            'reason': f"Код в {c['path']}" + (f" (символ {c['symbol_name']})" if c['symbol_name'] else ''),
+            'score': c['score'],
         })
         counters['chunks'] += 1
 
     # 2. Symbols (top 5)
-    cur.execute(
-        f"SELECT s.symbol_name, s.symbol_kind, s.line_no, f.path "
-        f"FROM {SCHEMA}.dev_agent_symbols s "
-        f"JOIN {SCHEMA}.dev_agent_files f ON f.id = s.file_id "
-        f"WHERE s.snapshot_id = {snap_id} AND s.symbol_name ILIKE '{q_like}' "
-        f"ORDER BY s.symbol_name LIMIT 5"
-    )
-    for r in cur.fetchall():
+    for sym in _rank_symbols(cur, snap_id, query, terms, 5):
         allowed.append({
-            'kind': 'symbol', 'file_path': r[3],
-            'start_line': r[2], 'end_line': r[2],
-            'symbol_name': r[0], 'snippet': f"{r[1]} {r[0]}",
-            'reason': f"{r[1]} {r[0]} в {r[3]}",
+            'kind': 'symbol', 'file_path': sym['path'],
+            'start_line': sym['line_no'], 'end_line': sym['line_no'],
+            'symbol_name': sym['symbol_name'], 'snippet': f"{sym['symbol_kind']} {sym['symbol_name']}",
+            'reason': f"{sym['symbol_kind']} {sym['symbol_name']} в {sym['path']}",
+            'score': sym['score'],
         })
         counters['symbols'] += 1
 
     # 3. Files (top 5)
-    cur.execute(
-        f"SELECT id, path, lang_code, file_category "
-        f"FROM {SCHEMA}.dev_agent_files "
-        f"WHERE snapshot_id = {snap_id} AND path ILIKE '{q_like}' "
-        f"ORDER BY path LIMIT 5"
-    )
-    for r in cur.fetchall():
+    for f in _rank_files(cur, snap_id, query, terms, 5):
         allowed.append({
-            'kind': 'file', 'file_path': r[1],
+            'kind': 'file', 'file_path': f['path'],
             'start_line': None, 'end_line': None,
-            'symbol_name': None, 'snippet': f"file: {r[1]} ({r[2]})",
-            'reason': f"Файл {r[1]}",
+            'symbol_name': None, 'snippet': f"file: {f['path']} ({f['language']})",
+            'reason': f"Файл {f['path']}",
+            'score': f['score'],
         })
         counters['files'] += 1
 
@@ -712,7 +1008,7 @@ def _build_allowed_citations(conn, env: str, query: str, max_chunks: int) -> Tup
         f"FROM {SCHEMA}.dev_agent_routes r "
         f"LEFT JOIN {SCHEMA}.dev_agent_files f ON f.id = r.source_file_id "
         f"WHERE r.snapshot_id = {snap_id} "
-        f"AND (r.route_path ILIKE '{q_like}' OR r.page_component ILIKE '{q_like}') "
+        f"AND (lower(r.route_path) LIKE ANY({likes}) OR lower(r.page_component) LIKE ANY({likes})) "
         f"ORDER BY r.route_path LIMIT 3"
     )
     for r in cur.fetchall():
@@ -721,6 +1017,7 @@ def _build_allowed_citations(conn, env: str, query: str, max_chunks: int) -> Tup
             'start_line': None, 'end_line': None, 'symbol_name': r[1],
             'snippet': f"route {r[0]} → {r[1]} [{r[2]}]",
             'reason': f"Роут {r[0]} → {r[1]}",
+            'score': _term_coverage(f"{r[0]} {r[1] or ''}", terms),
         })
         counters['routes'] += 1
 
@@ -730,7 +1027,7 @@ def _build_allowed_citations(conn, env: str, query: str, max_chunks: int) -> Tup
         f"FROM {SCHEMA}.dev_agent_api_endpoints a "
         f"LEFT JOIN {SCHEMA}.dev_agent_files f ON f.id = a.source_file_id "
         f"WHERE a.snapshot_id = {snap_id} "
-        f"AND (a.function_name ILIKE '{q_like}' OR a.action_name ILIKE '{q_like}') "
+        f"AND (lower(a.function_name) LIKE ANY({likes}) OR lower(a.action_name) LIKE ANY({likes})) "
         f"ORDER BY a.function_name LIMIT 3"
     )
     for r in cur.fetchall():
@@ -739,32 +1036,22 @@ def _build_allowed_citations(conn, env: str, query: str, max_chunks: int) -> Tup
             'start_line': None, 'end_line': None, 'symbol_name': r[1],
             'snippet': f"api {r[0]}" + (f"#{r[1]}" if r[1] else ''),
             'reason': f"Endpoint {r[0]}" + (f"#{r[1]}" if r[1] else ''),
+            'score': _term_coverage(f"{r[0]} {r[1] or ''}", terms),
         })
         counters['api'] += 1
 
-    # 6. DB tables (top 3) — берём имена по name match
-    cur.execute(
-        f"SELECT t.id, t.table_name "
-        f"FROM {SCHEMA}.dev_agent_db_tables t "
-        f"WHERE t.table_name ILIKE '{q_like}' "
-        f"ORDER BY t.table_name LIMIT 3"
-    )
-    for r in cur.fetchall():
-        allowed.append({
-            'kind': 'db_table', 'file_path': f"db:{r[1]}",
-            'start_line': None, 'end_line': None, 'symbol_name': r[1],
-            'snippet': f"table {r[1]}",
-            'reason': f"Таблица БД {r[1]}",
-        })
-        counters['db'] += 1
+    # смешиваем виды по релевантности (таблицы БД добавляются уже со своим весом), затем citation_id
+    for c in allowed:
+        c['score'] = round(c.pop('score', 0.0) * KIND_WEIGHTS.get(c['kind'], 0.8), 4)
 
-    # назначаем citation_id
-    for i, c in enumerate(allowed, 1):
-        c['citation_id'] = f'c{i}'
+    # 6. DB tables (top 3) — берём имена по name match
+    db_tables = _db_table_citations(cur, query)
+    counters['db'] = len(db_tables)
+    allowed = _number_citations(allowed + db_tables)
 
     summary = {
         'snapshot_id': snap_id, 'total': len(allowed),
-        'breakdown': counters, 'query': query,
+        'breakdown': counters, 'query': query, 'terms': terms,
     }
     return allowed, summary
 
@@ -978,11 +1265,13 @@ def _write_full_trace_s3(env: str, run_uuid: str, payload: Dict[str, Any]) -> Op
             aws_secret_access_key=os.environ['AWS_SECRET_ACCESS_KEY'],
         )
         key = f"dev-agent/traces/{env}/{run_uuid}.json"
+        body = json.dumps(payload, ensure_ascii=False, default=str).encode('utf-8')
         s3.put_object(
             Bucket='files', Key=key,
-            Body=json.dumps(payload, ensure_ascii=False, default=str).encode('utf-8'),
+            Body=body,
             ContentType='application/json',
         )
+        record_s3_object(None, SCHEMA, key, len(body), content_type='application/json', source='dev-agent-admin')
         return key
     except Exception as e:
         print(f"[dev-agent] full trace save failed: {e}")
@@ -1038,11 +1327,16 @@ def action_chat_send_llm(conn, env: str, actor_id: Optional[str], body: Dict[str
 
     # tool 1: search.query (retrieval)
     t_search = time.time()
-    allowed, retrieval_summary = _build_allowed_citations(conn, env, message, max_chunks)
+    allowed, retrieval_summary = _cached_retrieval(
+        conn, env, 'chat', message, max_chunks,
+        lambda sid: _build_allowed_citations(conn, env, message, max_chunks, sid),
+        live=lambda cur: _db_table_citations(cur, message),
+    )
     tool_calls.append({
         'name': 'search.query',
         'input': {'query': message, 'max_chunks': max_chunks},
-        'output': {'allowed_count': len(allowed), 'breakdown': retrieval_summary.get('breakdown')},
+        'output': {'allowed_count': len(allowed), 'breakdown': retrieval_summary.get('breakdown'),
+                   'cache': retrieval_summary.get('cache')},
         'latency_ms': int((time.time() - t_search) * 1000),
         'status': 'ok',
     })
@@ -1366,7 +1660,8 @@ _REVIEW_FOCUS_TIPS = {
 }
 
 
-def _build_review_citations(conn, env: str, file_path: str, max_chunks: int) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+def _build_review_citations(conn, env: str, file_path: str, max_chunks: int,
+                            snap_id: Optional[int] = None) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
     """File-centric retrieval для review.file.
 
     Источники:
@@ -1374,9 +1669,10 @@ def _build_review_citations(conn, env: str, file_path: str, max_chunks: int) ->
       P1 — symbols целевого файла (до 5)
       P2 — routes, в которых файл встречается (до 2)
       P2 — api endpoints с этим source_file (до 2)
+      P3 — похожие чанки других файлов по эмбеддингам (до 2)
     """
     cur = conn.cursor()
-    snap_id = _active_snapshot(cur, env)
+    snap_id = snap_id or _active_snapshot(cur, env)
     if not snap_id:
         return [], {'snapshot_id': None, 'total': 0, 'reason': 'no_snapshot',
                     'file_path': file_path}
@@ -1394,7 +1690,7 @@ def _build_review_citations(conn, env: str, file_path: str, max_chunks: int) ->
     file_id, lang_code, category, line_count, size_bytes = row
 
     allowed: List[Dict[str, Any]] = []
-    counters = {'chunks': 0, 'symbols': 0, 'routes': 0, 'api': 0}
+    counters = {'chunks': 0, 'symbols': 0, 'routes': 0, 'api': 0, 'related': 0}
 
     chunks_limit = max(2, min(max_chunks - 2, 10))
     cur.execute(
@@ -1464,6 +1760,30 @@ def _build_review_citations(conn, env: str, file_path: str, max_chunks: int) ->
         })
         counters['api'] += 1
 
+    # P3 — похожий код в других файлах (по среднему эмбеддингу чанков файла)
+    cur.execute(
+        f"SELECT embedding FROM {SCHEMA}.dev_agent_code_chunks "
+        f"WHERE snapshot_id = {snap_id} AND file_id = {file_id} AND embedding IS NOT NULL"
+    )
+    vecs = [r[0] for r in cur.fetchall()]
+    if vecs:
+        mean = [sum(col) / len(vecs) for col in zip(*vecs)]
+        norm = math.sqrt(sum(v * v for v in mean)) or 1.0
+        related = _semantic_chunk_ids(cur, snap_id, [v / norm for v in mean], 2,
+                                      exclude_file_id=file_id, min_sim=0.35)
+        details = _chunk_details(cur, [cid for cid, _ in related], 1200)
+        for cid, sim in related:
+            d = details.get(cid)
+            if not d:
+                continue
+            allowed.append({
+                'kind': 'chunk', 'file_path': d['path'],
+                'start_line': d['start_line'], 'end_line': d['end_line'],
+                'symbol_name': d['symbol_name'], 'snippet': d['snippet'],
+                'reason': f"Похожий код в {d['path']}" + (f" ({d['symbol_name']})" if d['symbol_name'] else ''),
+            })
+            counters['related'] += 1
+
     for i, c in enumerate(allowed, 1):
         c['citation_id'] = f'c{i}'
 
@@ -1733,12 +2053,16 @@ def action_review_file(conn, env: str, actor_id: Optional[str], body: Dict[str,
 
     # 1. file-centric retrieval
     t_r = time.time()
-    allowed, retrieval_summary = _build_review_citations(conn, env, file_path, max_chunks)
+    allowed, retrieval_summary = _cached_retrieval(
+        conn, env, 'review', file_path, max_chunks,
+        lambda sid: _build_review_citations(conn, env, file_path, max_chunks, sid),
+    )
     tool_calls.append({
         'name': 'review.retrieve',
         'input': {'file_path': file_path, 'max_chunks': max_chunks},
         'output': {'allowed_count': len(allowed),
                    'breakdown': retrieval_summary.get('breakdown'),
+                   'cache': retrieval_summary.get('cache'),
                    'file_in_snapshot': retrieval_summary.get('reason') != 'file_not_in_snapshot'},
         'latency_ms': int((time.time() - t_r) * 1000),
         'status': 'ok' if allowed else 'empty',
@@ -0,0 +1,57 @@
+"""V1.7 — persistent cache of GitHub blob contents.
+
+Git blob sha is a content hash, so a cached blob never goes stale: unchanged
+files are served from dev_agent_blob_cache instead of the GitHub API on every
+snapshot. Fail-open: any DB error means a cache miss / skipped write.
+"""
+from typing import Dict, List
+
+# Blobs not used for this long are pruned on write
+PRUNE_AFTER_DAYS = 30
+
+
+class BlobCache:
+    def __init__(self, conn, schema: str):
+        self.conn = conn
+        self.schema = schema
+
+    def get_many(self, blob_shas: List[str]) -> Dict[str, str]:
+        shas = list(dict.fromkeys(s for s in blob_shas if s))
+        if not shas:
+            return {}
+        try:
+            cur = self.conn.cursor()
+            cur.execute(
+                f"UPDATE {self.schema}.dev_agent_blob_cache SET last_used_at = NOW() "
+                f"WHERE blob_sha = ANY(%s) RETURNING blob_sha, content",
+                (shas,),
+            )
+            rows = cur.fetchall()
+            self.conn.commit()
+            return {r[0]: r[1] for r in rows}
+        except Exception:
+            self.conn.rollback()
+            return {}
+
+    def put_many(self, blobs: Dict[str, str]) -> int:
+        if not blobs:
+            return 0
+        shas = list(blobs.keys())
+        try:
+            cur = self.conn.cursor()
+            cur.execute(
+                f"INSERT INTO {self.schema}.dev_agent_blob_cache (blob_sha, content, size_bytes) "
+                f"SELECT sha, content, octet_length(content) "
+                f"FROM unnest(%s::text[], %s::text[]) AS t(sha, content) "
+                f"ON CONFLICT (blob_sha) DO UPDATE SET last_used_at = NOW()",
+                (shas, [blobs[s] for s in shas]),
+            )
+            cur.execute(
+                f"DELETE FROM {self.schema}.dev_agent_blob_cache "
+                f"WHERE last_used_at < NOW() - INTERVAL '{int(PRUNE_AFTER_DAYS)} days'"
+            )
+            self.conn.commit()
+            return len(shas)
+        except Exception:
+            self.conn.rollback()
+            return 0
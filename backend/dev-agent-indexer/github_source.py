@@ -4,7 +4,10 @@ Strategy:
 1. Resolve ref → commit SHA via /repos/{owner}/{repo}/commits/{ref}
 2. Fetch tree (recursive) via /repos/{owner}/{repo}/git/trees/{sha}?recursive=1
 3. Filter by whitelist (priority files) and exclude patterns
-4. Download blobs via /repos/{owner}/{repo}/git/blobs/{sha} (base64) — one-by-one
+4. Take unchanged blobs from the blob cache (keyed by blob sha, see blob_cache.py)
+5. Large selections: one tarball download for the commit, extract picked paths
+6. Remaining blobs via /repos/{owner}/{repo}/git/blobs/{sha} (base64) —
+   FETCH_CONCURRENCY parallel requests, backing off on GitHub rate limits
 
 Limits:
 - Max files per snapshot: 40 (configurable)
@@ -17,6 +20,10 @@ import base64
 import fnmatch
 import json
 import os
+import tarfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from typing import Any, Dict, List, Optional, Tuple
 from urllib import request, error
 from urllib.parse import quote
@@ -26,6 +33,10 @@ MAX_FILE_BYTES = 200_000
 MAX_FILES_PER_SNAPSHOT = 40
 USER_AGENT = 'PoehaliDevAgent/1.6'
 
+FETCH_CONCURRENCY = 8
+TARBALL_MIN_FILES = 60          # cache misses from which one tarball beats N blob calls
+RATE_LIMIT_MAX_WAIT_SEC = 10    # longer resets are reported as errors, not slept through
+
 EXCLUDE_GLOBS = [
     'node_modules/*', '*/node_modules/*',
     'dist/*', '*/dist/*',
@@ -84,20 +95,43 @@ def _headers(token: Optional[str]) -> Dict[str, str]:
     return h
 
 
-def _http_get_json(url: str, token: Optional[str], timeout: int = 20) -> Tuple[int, Any]:
+def _http_get_json_ex(url: str, token: Optional[str], timeout: int = 20) -> Tuple[int, Any, Dict[str, str]]:
     req = request.Request(url, headers=_headers(token))
     try:
         with request.urlopen(req, timeout=timeout) as resp:
             data = resp.read().decode('utf-8')
-            return resp.getcode(), json.loads(data)
+            return resp.getcode(), json.loads(data), dict(resp.headers)
     except error.HTTPError as e:
         try:
             payload = json.loads(e.read().decode('utf-8'))
         except Exception:
             payload = {'message': str(e)}
-        return e.code, payload
+        return e.code, payload, dict(e.headers or {})
     except Exception as e:
-        return 599, {'message': str(e)[:200]}
+        return 599, {'message': str(e)[:200]}, {}
+
+
+def _http_get_json(url: str, token: Optional[str], timeout: int = 20) -> Tuple[int, Any]:
+    code, payload, _ = _http_get_json_ex(url, token, timeout)
+    return code, payload
+
+
+def _rate_limit_wait(code: int, headers: Dict[str, str]) -> Optional[float]:
+    """Seconds to wait before retrying, or None if the response is not a rate limit."""
+    if code not in (403, 429):
+        return None
+    h = {k.lower(): v for k, v in headers.items()}
+    if h.get('retry-after'):
+        try:
+            return float(h['retry-after'])
+        except ValueError:
+            return 60.0
+    if h.get('x-ratelimit-remaining') == '0':
+        try:
+            return max(0.0, float(h.get('x-ratelimit-reset') or 0) - time.time())
+        except ValueError:
+            return 60.0
+    return None
 
 
 def _match_any(path: str, globs: List[str]) -> bool:
@@ -160,7 +194,14 @@ def select_files(tree: List[Dict], whitelist: Optional[List[str]] = None,
 
 def fetch_blob(owner: str, repo: str, blob_sha: str, token: Optional[str]) -> Tuple[Optional[str], Optional[Dict]]:
     url = f'{GITHUB_API}/repos/{quote(owner)}/{quote(repo)}/git/blobs/{blob_sha}'
-    code, body = _http_get_json(url, token, timeout=20)
+    code, body, headers = _http_get_json_ex(url, token, timeout=20)
+    wait = _rate_limit_wait(code, headers)
+    if wait is not None and wait <= RATE_LIMIT_MAX_WAIT_SEC:
+        time.sleep(wait)
+        code, body, headers = _http_get_json_ex(url, token, timeout=20)
+        wait = _rate_limit_wait(code, headers)
+    if wait is not None:
+        return None, {'status': code, 'body': body, 'rate_limited': True}
     if code != 200:
         return None, {'status': code, 'body': body}
     enc = body.get('encoding')
@@ -174,13 +215,81 @@ def fetch_blob(owner: str, repo: str, blob_sha: str, token: Optional[str]) -> Tu
     return data, None
 
 
+def fetch_blobs(owner: str, repo: str, blob_shas: List[str], token: Optional[str],
+                max_workers: int = FETCH_CONCURRENCY) -> Tuple[Dict[str, str], Dict[str, Dict]]:
+    """Fetch blobs with bounded concurrency. Returns ({sha: text}, {sha: error}).
+
+    After the first hard rate-limit response no new requests are started —
+    the rest are reported as rate_limited instead of hammering the API.
+    """
+    texts: Dict[str, str] = {}
+    errors: Dict[str, Dict] = {}
+    halted = threading.Event()
+
+    def one(sha: str) -> Tuple[str, Optional[str], Optional[Dict]]:
+        if halted.is_set():
+            return sha, None, {'status': 429, 'body': {'message': 'rate_limited'}, 'rate_limited': True}
+        text, err = fetch_blob(owner, repo, sha, token)
+        if err and err.get('rate_limited'):
+            halted.set()
+        return sha, text, err
+
+    unique = list(dict.fromkeys(blob_shas))
+    if not unique:
+        return texts, errors
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(unique)))) as pool:
+        for sha, text, err in pool.map(one, unique):
+            if err:
+                errors[sha] = err
+            else:
+                texts[sha] = text
+    return texts, errors
+
+
+def fetch_tarball_files(owner: str, repo: str, commit_sha: str, wanted_paths: List[str],
+                        token: Optional[str], timeout: int = 60) -> Dict[str, str]:
+    """Stream the commit tarball once and extract only wanted paths → {path: text}.
+
+    Best-effort: on any error returns what was extracted so far; the caller
+    falls back to per-blob fetching for the rest.
+    """
+    wanted = set(wanted_paths)
+    out: Dict[str, str] = {}
+    url = f'{GITHUB_API}/repos/{quote(owner)}/{quote(repo)}/tarball/{commit_sha}'
+    req = request.Request(url, headers=_headers(token))
+    try:
+        with request.urlopen(req, timeout=timeout) as resp:
+            with tarfile.open(fileobj=resp, mode='r|gz') as tar:
+                for member in tar:
+                    if not member.isfile():
+                        continue
+                    # top-level dir is "<owner>-<repo>-<sha>/"
+                    path = member.name.split('/', 1)[1] if '/' in member.name else member.name
+                    if path not in wanted:
+                        continue
+                    fh = tar.extractfile(member)
+                    if fh is None:
+                        continue
+                    out[path] = fh.read().decode('utf-8', errors='replace')
+                    if len(out) == len(wanted):
+                        break
+    except Exception:
+        pass
+    return out
+
+
 def load_files_from_github(owner: str, repo: str, ref: str,
                            whitelist: Optional[List[str]] = None,
                            extra_globs: Optional[List[str]] = None,
-                           max_files: int = MAX_FILES_PER_SNAPSHOT) -> Dict[str, Any]:
-    """End-to-end: resolve ref → tree → fetch blobs.
+                           max_files: int = MAX_FILES_PER_SNAPSHOT,
+                           blob_cache=None) -> Dict[str, Any]:
+    """End-to-end: resolve ref → tree → cached / tarball / concurrent blob fetch.
+
+    blob_cache: optional object with get_many(shas) -> {sha: text} and
+    put_many({sha: text}) (see blob_cache.BlobCache).
 
-    Returns: {success, commit_sha, commit_message, files: [{path, content, sha, size}], errors}
+    Returns: {success, commit_sha, commit_message, files: [{path, content, sha, size}],
+              errors, blob_stats}
     """
     token = os.environ.get('GITHUB_TOKEN')
     if not token:
@@ -197,13 +306,35 @@ def load_files_from_github(owner: str, repo: str, ref: str,
 
     picked = select_files(tree, whitelist, extra_globs, max_files)
 
+    blob_shas = [t['sha'] for t in picked]
+    texts: Dict[str, str] = blob_cache.get_many(blob_shas) if blob_cache else {}
+    cached_shas = set(texts)
+    stats = {'cached': len(cached_shas), 'tarball': 0, 'fetched': 0}
+
+    missing = [t for t in picked if t['sha'] not in texts]
+    if len(missing) >= TARBALL_MIN_FILES:
+        by_path = fetch_tarball_files(owner, repo, commit_sha, [t['path'] for t in missing], token)
+        for t in missing:
+            if t['path'] in by_path:
+                texts[t['sha']] = by_path[t['path']]
+                stats['tarball'] += 1
+        missing = [t for t in missing if t['sha'] not in texts]
+
+    fetched, blob_errors = fetch_blobs(owner, repo, [t['sha'] for t in missing], token)
+    texts.update(fetched)
+    stats['fetched'] = len(fetched)
+
+    if blob_cache and (stats['tarball'] or stats['fetched']):
+        blob_cache.put_many({sha: text for sha, text in texts.items() if sha not in cached_shas})
+
     files_out: List[Dict[str, Any]] = []
     errors: List[Dict[str, Any]] = []
     for t in picked:
         path = t['path']
-        text, ferr = fetch_blob(owner, repo, t['sha'], token)
-        if ferr:
-            errors.append({'path': path, 'error': ferr})
+        text = texts.get(t['sha'])
+        if text is None:
+            errors.append({'path': path, 'error': blob_errors.get(t['sha'])
+                           or {'status': 404, 'body': {'message': 'blob_missing'}}})
             continue
         files_out.append({
             'path': path,
@@ -220,4 +351,5 @@ def load_files_from_github(owner: str, repo: str, ref: str,
         'errors': errors,
         'total_in_tree': len(tree),
         'requested_in_whitelist': len(whitelist or DEFAULT_WHITELIST),
+        'blob_stats': stats,
     }
\ No newline at end of file
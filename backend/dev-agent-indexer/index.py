@@ -13,24 +13,41 @@ Legacy (kept for backward compat):
 - seed.status
 - snapshots.activate
 """
+import heapq
 import json
 import os
 import time
 import uuid
-from typing import Any, Dict, List, Optional
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Dict, List, Optional, Tuple
 
 import psycopg2
+from psycopg2.extras import execute_values
 
 from parsing import (
     chunk_file, detect_category, detect_lang,
     extract_api_endpoints_from_func2url, extract_imports,
     extract_routes, extract_symbols, sha256_hex,
 )
+from blob_cache import BlobCache
+from code_embedding import EMBED_DIM, build_ivf, embed_text
 from github_source import load_files_from_github, DEFAULT_WHITELIST
 from local_paths_loader import load_files_from_local_paths
 
 SCHEMA = '"' + os.environ.get('MAIN_DB_SCHEMA', 't_p5815085_family_assistant_pro') + '"'
 
+# Bulk ingest: files parsed/written per group, rows per INSERT ... VALUES statement
+INGEST_BATCH_FILES = 200
+BULK_PAGE_SIZE = 500
+
+# Parse stage: process pool for larger change sets (regex parsing is CPU-bound)
+PARSE_WORKERS = max(1, min(8, os.cpu_count() or 1))
+PARALLEL_PARSE_MIN_FILES = 16
+PARSE_POOL_CHUNKSIZE = 4
+SLOW_PARSE_MS = 1000
+SLOW_FILES_KEPT = 10
+
 CORS_HEADERS = {
     'Access-Control-Allow-Origin': '*',
     'Access-Control-Allow-Methods': 'GET, POST, PUT, DELETE, OPTIONS',
@@ -92,10 +109,17 @@ def _create_snapshot(cur, env: str, branch: str, commit_sha: str, message: str,
     return cur.fetchone()[0]
 
 
-def _finalize_snapshot(cur, snap_id: int, env: str, counts: Dict[str, int],
+def _finalize_snapshot(cur, snap_id: int, env: str, counts: Dict[str, Any],
                        status: str = 'ready', err: Optional[str] = None,
                        activate: bool = True):
     should_activate = (status == 'ready') and activate
+    ingest_meta = {}
+    if counts.get('timings_ms'):
+        ingest_meta['ingest_timings_ms'] = counts['timings_ms']
+    if 'reused_files' in counts:
+        ingest_meta['reused_files'] = int(counts['reused_files'])
+    if counts.get('slow_files'):
+        ingest_meta['slow_parse_files'] = counts['slow_files']
     cur.execute(
         f"UPDATE {SCHEMA}.dev_agent_repo_snapshots SET "
         f"indexing_status = {esc(status)}, "
@@ -105,6 +129,8 @@ def _finalize_snapshot(cur, snap_id: int, env: str, counts: Dict[str, int],
         f"endpoints_count = {int(counts.get('endpoints', 0))}, "
         f"symbols_count = {int(counts.get('symbols', 0))}, "
         f"indexed_at = NOW(), "
+        f"source_meta = COALESCE(source_meta, '{{}}'::jsonb) || "
+        f"{esc(json.dumps(ingest_meta))}::jsonb, "
         f"is_active = {'TRUE' if should_activate else 'FALSE'}, "
         f"err_text = {esc(err)} "
         f"WHERE id = {snap_id}"
@@ -114,125 +140,399 @@ def _finalize_snapshot(cur, snap_id: int, env: str, counts: Dict[str, int],
             f"UPDATE {SCHEMA}.dev_agent_repo_snapshots SET is_active = FALSE "
             f"WHERE environment = {esc(env)} AND id <> {snap_id}"
         )
+        _drop_retrieval_cache(cur, env)
+
+
+def _drop_retrieval_cache(cur, env: str):
+    """dev-agent-admin caches citations per snapshot; once another snapshot is
+    active, entries of the inactive ones in this environment are dead weight."""
+    cur.execute(
+        f"DELETE FROM {SCHEMA}.dev_agent_retrieval_cache rc "
+        f"USING {SCHEMA}.dev_agent_repo_snapshots s "
+        f"WHERE s.id = rc.snapshot_id AND s.environment = {esc(env)} AND s.is_active = FALSE"
+    )
 
 
 # ============================================================
 # Ingestion — real files
 # ============================================================
 
-def _insert_file(cur, snap_id: int, path: str, content: str) -> int:
+def _embed_chunks(chunks: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    for c in chunks:
+        c['embedding'] = embed_text(f"{c.get('symbol_name') or ''}\n{c['chunk_text']}")
+    return chunks
+
+
+def _parse_file(path: str, content: str, digest: str) -> Dict[str, Any]:
+    """Parse one file into compact rows for the bulk writers (no DB access)."""
     lang = detect_lang(path)
-    cat = detect_category(path)
-    size = len(content.encode('utf-8'))
-    lines = content.count('\n') + 1
-    digest = sha256_hex(content)
-    imports = extract_imports(content) if lang in ('typescript', 'tsx', 'javascript', 'jsx') else []
-    cur.execute(
+    return {
+        'path': path,
+        'lang': lang,
+        'category': detect_category(path),
+        'size': len(content.encode('utf-8')),
+        'lines': content.count('\n') + 1,
+        'sha256': digest,
+        'imports': extract_imports(content) if lang in ('typescript', 'tsx', 'javascript', 'jsx') else [],
+        'chunks': _embed_chunks(chunk_file(path, content)),
+        'symbols': extract_symbols(path, content),
+        'routes': extract_routes(path, content),
+        # func2url.json → api endpoints
+        'endpoints': extract_api_endpoints_from_func2url(content) if path.endswith('func2url.json') else [],
+    }
+
+
+def _insert_files(cur, snap_id: int, parsed: List[Dict[str, Any]]) -> Dict[str, int]:
+    """Upsert file rows in one statement per page; returns path → file_id."""
+    rows = [
+        (snap_id, p['path'], p['lang'], p['category'], p['size'], p['lines'], p['sha256'],
+         json.dumps(p['imports'], ensure_ascii=False))
+        for p in parsed
+    ]
+    returned = execute_values(
+        cur,
         f"INSERT INTO {SCHEMA}.dev_agent_files "
         f"(snapshot_id, path, lang_code, file_category, size_bytes, line_count, sha256, imports) "
-        f"VALUES ({snap_id}, {esc(path)}, {esc(lang)}, {esc(cat)}, {size}, {lines}, "
-        f"{esc(digest)}, {esc(json.dumps(imports, ensure_ascii=False))}::jsonb) "
+        f"VALUES %s "
         f"ON CONFLICT (snapshot_id, path) DO UPDATE SET "
         f"lang_code = EXCLUDED.lang_code, file_category = EXCLUDED.file_category, "
         f"size_bytes = EXCLUDED.size_bytes, line_count = EXCLUDED.line_count, "
         f"sha256 = EXCLUDED.sha256, imports = EXCLUDED.imports "
-        f"RETURNING id"
+        f"RETURNING id, path",
+        rows, template='(%s, %s, %s, %s, %s, %s, %s, %s::jsonb)',
+        page_size=BULK_PAGE_SIZE, fetch=True,
     )
-    return cur.fetchone()[0]
-
-
-def _insert_chunks(cur, snap_id: int, file_id: int, chunks: List[Dict[str, Any]]) -> int:
-    n = 0
-    for c in chunks:
-        cur.execute(
+    return {r[1]: r[0] for r in returned}
+
+
+def _insert_chunks(cur, snap_id: int, file_ids: Dict[str, int], parsed: List[Dict[str, Any]]) -> int:
+    rows = [
+        (snap_id, file_ids[p['path']], int(c['chunk_index']), c['chunk_kind'], c.get('symbol_name'),
+         int(c['start_line']) if c.get('start_line') else None,
+         int(c['end_line']) if c.get('end_line') else None,
+         int(c.get('token_estimate') or 0), c['chunk_text'], c.get('sha256'), c.get('lang_code'),
+         int(c.get('byte_size') or 0), c.get('embedding'))
+        for p in parsed for c in p['chunks']
+    ]
+    if rows:
+        execute_values(
+            cur,
             f"INSERT INTO {SCHEMA}.dev_agent_code_chunks "
             f"(snapshot_id, file_id, chunk_index, chunk_kind, symbol_name, "
-            f"start_line, end_line, token_estimate, chunk_text, sha256, lang_code, byte_size) "
-            f"VALUES ({snap_id}, {file_id}, {int(c['chunk_index'])}, {esc(c['chunk_kind'])}, "
-            f"{esc(c.get('symbol_name'))}, "
-            f"{int(c['start_line']) if c.get('start_line') else 'NULL'}, "
-            f"{int(c['end_line']) if c.get('end_line') else 'NULL'}, "
-            f"{int(c.get('token_estimate') or 0)}, "
-            f"{esc(c['chunk_text'])}, "
-            f"{esc(c.get('sha256'))}, "
-            f"{esc(c.get('lang_code'))}, "
-            f"{int(c.get('byte_size') or 0)}) "
-            f"ON CONFLICT (file_id, chunk_index) DO NOTHING"
+            f"start_line, end_line, token_estimate, chunk_text, sha256, lang_code, byte_size, embedding) "
+            f"VALUES %s ON CONFLICT (file_id, chunk_index) DO NOTHING",
+            rows, template='(%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s::real[])',
+            page_size=BULK_PAGE_SIZE,
         )
-        n += 1
-    return n
-
-
-def _insert_symbols(cur, snap_id: int, file_id: int, symbols: List[Dict[str, Any]]) -> int:
-    n = 0
-    for s in symbols:
-        cur.execute(
+    return len(rows)
+
+
+def _insert_symbols(cur, snap_id: int, file_ids: Dict[str, int], parsed: List[Dict[str, Any]]) -> int:
+    rows = [
+        (snap_id, file_ids[p['path']], s['symbol_name'], s.get('symbol_kind') or 'other',
+         bool(s.get('exported')), int(s['line_no']) if s.get('line_no') else None)
+        for p in parsed for s in p['symbols']
+    ]
+    if rows:
+        execute_values(
+            cur,
             f"INSERT INTO {SCHEMA}.dev_agent_symbols "
-            f"(snapshot_id, file_id, symbol_name, symbol_kind, exported, line_no) "
-            f"VALUES ({snap_id}, {file_id}, {esc(s['symbol_name'])}, "
-            f"{esc(s.get('symbol_kind') or 'other')}, "
-            f"{'TRUE' if s.get('exported') else 'FALSE'}, "
-            f"{int(s['line_no']) if s.get('line_no') else 'NULL'})"
+            f"(snapshot_id, file_id, symbol_name, symbol_kind, exported, line_no) VALUES %s",
+            rows, page_size=BULK_PAGE_SIZE,
         )
-        n += 1
-    return n
-
-
-def _insert_routes(cur, snap_id: int, file_id: int, routes: List[Dict[str, Any]]) -> int:
-    n = 0
-    for r in routes:
-        cur.execute(
+    return len(rows)
+
+
+def _insert_routes(cur, snap_id: int, file_ids: Dict[str, int], parsed: List[Dict[str, Any]]) -> int:
+    rows = [
+        (snap_id, r['route_path'], r.get('page_component'), file_ids[p['path']],
+         r.get('area') or 'public', r.get('auth_scope'))
+        for p in parsed for r in p['routes']
+    ]
+    if rows:
+        execute_values(
+            cur,
             f"INSERT INTO {SCHEMA}.dev_agent_routes "
-            f"(snapshot_id, route_path, page_component, source_file_id, area, auth_scope) "
-            f"VALUES ({snap_id}, {esc(r['route_path'])}, {esc(r.get('page_component'))}, "
-            f"{file_id}, {esc(r.get('area') or 'public')}, {esc(r.get('auth_scope'))})"
+            f"(snapshot_id, route_path, page_component, source_file_id, area, auth_scope) VALUES %s",
+            rows, page_size=BULK_PAGE_SIZE,
         )
-        n += 1
-    return n
+    return len(rows)
+
+
+def _insert_api(cur, snap_id: int, file_ids: Dict[str, int], parsed: List[Dict[str, Any]]) -> int:
+    rows = [
+        (snap_id, e['function_name'], e.get('action_name'), e.get('http_method'),
+         e.get('endpoint_path'), file_ids.get(p['path']), e.get('auth_scope'))
+        for p in parsed for e in p['endpoints']
+    ]
+    if rows:
+        execute_values(
+            cur,
+            f"INSERT INTO {SCHEMA}.dev_agent_api_endpoints "
+            f"(snapshot_id, function_name, action_name, http_method, endpoint_path, "
+            f"source_file_id, auth_scope) VALUES %s",
+            rows, page_size=BULK_PAGE_SIZE,
+        )
+    return len(rows)
+
+
+# ============================================================
+# Content-addressed reuse — unchanged files are copied server-side
+# ============================================================
+
+def _base_file_index(cur, snap_id: int) -> Dict[Tuple[str, str], int]:
+    """Files of the previous active ready snapshot in the same environment.
+
+    Keys: ('path:' + path, sha256) for an exact match and (lang_code, sha256)
+    for renamed/moved files with identical content (chunks, symbols and routes
+    depend only on content and language).
+    """
+    cur.execute(
+        f"SELECT f.id, f.path, f.lang_code, f.sha256 "
+        f"FROM {SCHEMA}.dev_agent_files f "
+        f"JOIN {SCHEMA}.dev_agent_repo_snapshots s ON s.id = f.snapshot_id "
+        f"WHERE s.is_active = TRUE AND s.indexing_status = 'ready' AND s.id <> {int(snap_id)} "
+        f"AND s.environment = (SELECT environment FROM {SCHEMA}.dev_agent_repo_snapshots "
+        f"WHERE id = {int(snap_id)}) "
+        f"AND f.sha256 IS NOT NULL"
+    )
+    index: Dict[Tuple[str, str], int] = {}
+    for file_id, path, lang, digest in cur.fetchall():
+        index[('path:' + path, digest)] = file_id
+        index.setdefault((lang or 'text', digest), file_id)
+    return index
+
+
+def _link_unchanged_files(cur, snap_id: int, reuse: List[Tuple[str, int]]) -> Dict[str, int]:
+    """Copy file rows, chunks, symbols and routes of unchanged files from the
+    base snapshot with INSERT ... SELECT — no re-parsing, no row round trips."""
+    counts = {'files': 0, 'chunks': 0, 'symbols': 0, 'routes': 0}
+    if not reuse:
+        return counts
+    base_by_path = dict(reuse)
+    paths = list(base_by_path.keys())
+    cur.execute(
+        f"INSERT INTO {SCHEMA}.dev_agent_files "
+        f"(snapshot_id, path, lang_code, file_category, size_bytes, line_count, sha256, imports) "
+        f"SELECT %s, m.path, b.lang_code, m.category, b.size_bytes, b.line_count, b.sha256, b.imports "
+        f"FROM unnest(%s::text[], %s::bigint[], %s::text[]) AS m(path, base_id, category) "
+        f"JOIN {SCHEMA}.dev_agent_files b ON b.id = m.base_id "
+        f"ON CONFLICT (snapshot_id, path) DO NOTHING "
+        f"RETURNING id, path",
+        (snap_id, paths, [base_by_path[p] for p in paths], [detect_category(p) for p in paths]),
+    )
+    linked = cur.fetchall()
+    counts['files'] = len(linked)
+    if not linked:
+        return counts
+    new_ids = [r[0] for r in linked]
+    base_ids = [base_by_path[r[1]] for r in linked]
+
+    cur.execute(
+        f"INSERT INTO {SCHEMA}.dev_agent_code_chunks "
+        f"(snapshot_id, file_id, chunk_index, chunk_kind, symbol_name, "
+        f"start_line, end_line, token_estimate, chunk_text, sha256, lang_code, byte_size, embedding) "
+        f"SELECT %s, m.new_id, c.chunk_index, c.chunk_kind, c.symbol_name, "
+        f"c.start_line, c.end_line, c.token_estimate, c.chunk_text, c.sha256, c.lang_code, c.byte_size, "
+        f"c.embedding "
+        f"FROM unnest(%s::bigint[], %s::bigint[]) AS m(new_id, base_id) "
+        f"JOIN {SCHEMA}.dev_agent_code_chunks c ON c.file_id = m.base_id "
+        f"ON CONFLICT (file_id, chunk_index) DO NOTHING",
+        (snap_id, new_ids, base_ids),
+    )
+    counts['chunks'] = cur.rowcount
+    cur.execute(
+        f"INSERT INTO {SCHEMA}.dev_agent_symbols "
+        f"(snapshot_id, file_id, symbol_name, symbol_kind, exported, line_no) "
+        f"SELECT %s, m.new_id, s.symbol_name, s.symbol_kind, s.exported, s.line_no "
+        f"FROM unnest(%s::bigint[], %s::bigint[]) AS m(new_id, base_id) "
+        f"JOIN {SCHEMA}.dev_agent_symbols s ON s.file_id = m.base_id",
+        (snap_id, new_ids, base_ids),
+    )
+    counts['symbols'] = cur.rowcount
+    cur.execute(
+        f"INSERT INTO {SCHEMA}.dev_agent_routes "
+        f"(snapshot_id, route_path, page_component, source_file_id, area, auth_scope) "
+        f"SELECT %s, r.route_path, r.page_component, m.new_id, r.area, r.auth_scope "
+        f"FROM unnest(%s::bigint[], %s::bigint[]) AS m(new_id, base_id) "
+        f"JOIN {SCHEMA}.dev_agent_routes r ON r.source_file_id = m.base_id",
+        (snap_id, new_ids, base_ids),
+    )
+    counts['routes'] = cur.rowcount
+    return counts
 
 
-def _insert_api(cur, snap_id: int, file_id: Optional[int], endpoints: List[Dict[str, Any]]) -> int:
-    n = 0
-    for e in endpoints:
+# ============================================================
+# Vector index — IVF lists over chunk embeddings (see code_embedding.py)
+# ============================================================
+
+def _build_vector_index(cur, snap_id: int) -> int:
+    """Cluster the snapshot's chunk embeddings into IVF lists.
+
+    Writes centroids to dev_agent_vector_lists and ivf_list on each chunk.
+    Best-effort: runs under a savepoint, a failure (e.g. NumPy missing)
+    leaves the snapshot lexical-only instead of failing the ingest.
+    """
+    cur.execute("SAVEPOINT vector_index")
+    try:
         cur.execute(
-            f"INSERT INTO {SCHEMA}.dev_agent_api_endpoints "
-            f"(snapshot_id, function_name, action_name, http_method, endpoint_path, "
-            f"source_file_id, auth_scope) "
-            f"VALUES ({snap_id}, {esc(e['function_name'])}, {esc(e.get('action_name'))}, "
-            f"{esc(e.get('http_method'))}, {esc(e.get('endpoint_path'))}, "
-            f"{file_id if file_id else 'NULL'}, {esc(e.get('auth_scope'))})"
+            f"SELECT id, embedding FROM {SCHEMA}.dev_agent_code_chunks "
+            f"WHERE snapshot_id = {int(snap_id)} AND embedding IS NOT NULL "
+            f"AND array_length(embedding, 1) = {EMBED_DIM}"
         )
-        n += 1
-    return n
+        rows = cur.fetchall()
+        if not rows:
+            cur.execute("RELEASE SAVEPOINT vector_index")
+            return 0
+        centroids, assign = build_ivf([r[1] for r in rows])
+        cur.execute(f"DELETE FROM {SCHEMA}.dev_agent_vector_lists WHERE snapshot_id = {int(snap_id)}")
+        sizes: Dict[int, int] = {}
+        for list_no in assign:
+            sizes[list_no] = sizes.get(list_no, 0) + 1
+        execute_values(
+            cur,
+            f"INSERT INTO {SCHEMA}.dev_agent_vector_lists (snapshot_id, list_no, centroid, size) VALUES %s",
+            [(snap_id, i, c, sizes.get(i, 0)) for i, c in enumerate(centroids)],
+            template='(%s, %s, %s::real[], %s)', page_size=BULK_PAGE_SIZE,
+        )
+        cur.execute(
+            f"UPDATE {SCHEMA}.dev_agent_code_chunks c SET ivf_list = m.list_no "
+            f"FROM unnest(%s::bigint[], %s::int[]) AS m(id, list_no) WHERE c.id = m.id",
+            ([r[0] for r in rows], assign),
+        )
+        cur.execute("RELEASE SAVEPOINT vector_index")
+        return len(centroids)
+    except Exception as e:
+        cur.execute("ROLLBACK TO SAVEPOINT vector_index")
+        print(f"[dev-agent-indexer] vector index skipped: {e}")
+        return 0
 
 
-def ingest_files(cur, snap_id: int, files: List[Dict[str, Any]]) -> Dict[str, int]:
-    """Run full pipeline for a list of {path, content} files."""
-    totals = {'files': 0, 'chunks': 0, 'symbols': 0, 'routes': 0, 'endpoints': 0}
-    for f in files:
-        path = f.get('path') or ''
-        content = f.get('content') or ''
-        if not path or not content:
-            continue
-        try:
-            file_id = _insert_file(cur, snap_id, path, content)
-        except Exception:
-            continue
-        totals['files'] += 1
+def _ms_since(t0: float) -> int:
+    return int((time.perf_counter() - t0) * 1000)
 
-        chunks = chunk_file(path, content)
-        totals['chunks'] += _insert_chunks(cur, snap_id, file_id, chunks)
 
-        symbols = extract_symbols(path, content)
-        totals['symbols'] += _insert_symbols(cur, snap_id, file_id, symbols)
+def _parse_file_timed(item: Tuple[str, str, str]) -> Dict[str, Any]:
+    """Pool worker: parse one (path, content, digest) and record its parse time."""
+    t0 = time.perf_counter()
+    parsed = _parse_file(*item)
+    parsed['parse_ms'] = _ms_since(t0)
+    return parsed
 
-        routes = extract_routes(path, content)
-        totals['routes'] += _insert_routes(cur, snap_id, file_id, routes)
 
-        # func2url.json → api endpoints
-        if path.endswith('func2url.json'):
-            eps = extract_api_endpoints_from_func2url(content)
-            totals['endpoints'] += _insert_api(cur, snap_id, file_id, eps)
+def _iter_parsed(changed: List[Tuple[str, str, str]]):
+    """Yield parse results in input order.
+
+    Large change sets fan out to a process pool so parsing overlaps with the
+    bulk writes in the caller. Runtimes without process support (no
+    semaphores / fork) and a broken pool fall back to inline parsing of the
+    remaining files.
+    """
+    done = 0
+    if len(changed) >= PARALLEL_PARSE_MIN_FILES and PARSE_WORKERS > 1:
+        try:
+            with ProcessPoolExecutor(max_workers=PARSE_WORKERS) as pool:
+                for parsed in pool.map(_parse_file_timed, changed, chunksize=PARSE_POOL_CHUNKSIZE):
+                    done += 1
+                    yield parsed
+        except (OSError, NotImplementedError, ImportError, BrokenProcessPool) as e:
+            print(f"[dev-agent-indexer] parse pool unavailable, parsing inline: {e}")
+    for item in changed[done:]:
+        yield _parse_file_timed(item)
+
+
+def _write_parsed(cur, snap_id: int, parsed: List[Dict[str, Any]],
+                  totals: Dict[str, Any], timings: Dict[str, int]):
+    t0 = time.perf_counter()
+    file_ids = _insert_files(cur, snap_id, parsed)
+    totals['files'] += len(file_ids)
+    timings['files'] += _ms_since(t0)
+
+    for phase, writer in (('chunks', _insert_chunks), ('symbols', _insert_symbols),
+                          ('routes', _insert_routes), ('endpoints', _insert_api)):
+        t0 = time.perf_counter()
+        totals[phase] += writer(cur, snap_id, file_ids, parsed)
+        timings[phase] += _ms_since(t0)
+
+
+def ingest_files(cur, snap_id: int, files: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Run full pipeline for a list of {path, content} files.
+
+    Files whose sha256 already exists in the previous active snapshot are not
+    re-parsed: their rows are copied server-side (see _link_unchanged_files),
+    so re-indexing after a small commit costs O(changed files). Changed files
+    are parsed (in a process pool for larger sets, see _iter_parsed) and
+    streamed into the bulk writers in groups of INGEST_BATCH_FILES, one
+    statement per table per group. Per-phase timings go to counts['timings_ms'],
+    the slowest files to parse to counts['slow_files'].
+    """
+    totals: Dict[str, Any] = {'files': 0, 'chunks': 0, 'symbols': 0, 'routes': 0,
+                              'endpoints': 0, 'reused_files': 0}
+    timings = {'lookup': 0, 'parse': 0, 'parse_cpu': 0, 'files': 0, 'chunks': 0, 'symbols': 0,
+               'routes': 0, 'endpoints': 0, 'reuse': 0, 'vectors': 0}
+
+    t0 = time.perf_counter()
+    base_index = _base_file_index(cur, snap_id)
+    timings['lookup'] = _ms_since(t0)
+
+    # last occurrence of a path wins (same as the former per-row upsert)
+    by_path: Dict[str, str] = {}
+    for f in files:
+        path = f.get('path') or ''
+        content = f.get('content') or ''
+        if path and content:
+            by_path.pop(path, None)
+            by_path[path] = content
+
+    reuse: List[Tuple[str, int]] = []
+    changed: List[Tuple[str, str, str]] = []
+    for path, content in by_path.items():
+        digest = sha256_hex(content)
+        base_id = (base_index.get(('path:' + path, digest))
+                   or base_index.get((detect_lang(path), digest)))
+        # func2url.json endpoints are cheap to re-extract and depend on the path
+        if base_id and not path.endswith('func2url.json'):
+            reuse.append((path, base_id))
+        else:
+            changed.append((path, content, digest))
+
+    # parse: wall time spent waiting for results; parse_cpu: sum of per-file parse times
+    slow: List[Tuple[int, str, int]] = []
+    group: List[Dict[str, Any]] = []
+    results = _iter_parsed(changed)
+    while True:
+        t0 = time.perf_counter()
+        parsed = next(results, None)
+        timings['parse'] += _ms_since(t0)
+        if parsed is None:
+            break
+        timings['parse_cpu'] += parsed['parse_ms']
+        heapq.heappush(slow, (parsed['parse_ms'], parsed['path'], parsed['size']))
+        if len(slow) > SLOW_FILES_KEPT:
+            heapq.heappop(slow)
+        if parsed['parse_ms'] >= SLOW_PARSE_MS:
+            print(f"[dev-agent-indexer] slow parse {parsed['parse_ms']} ms: {parsed['path']}")
+        group.append(parsed)
+        if len(group) >= INGEST_BATCH_FILES:
+            _write_parsed(cur, snap_id, group, totals, timings)
+            group = []
+    if group:
+        _write_parsed(cur, snap_id, group, totals, timings)
+    totals['slow_files'] = [{'path': p, 'parse_ms': ms, 'bytes': size}
+                            for ms, p, size in sorted(slow, reverse=True)]
+
+    t0 = time.perf_counter()
+    linked = _link_unchanged_files(cur, snap_id, reuse)
+    for key, n in linked.items():
+        totals[key] += n
+    totals['reused_files'] = linked['files']
+    timings['reuse'] = _ms_since(t0)
+
+    t0 = time.perf_counter()
+    totals['vector_lists'] = _build_vector_index(cur, snap_id)
+    timings['vectors'] = _ms_since(t0)
+
+    totals['timings_ms'] = timings
     return totals
 
 
@@ -291,7 +591,8 @@ def action_index_from_github(conn, env: str, body: Dict[str, Any],
         return {'success': False, 'error': 'owner_repo_required'}
 
     started = time.time()
-    loaded = load_files_from_github(owner, repo, ref, whitelist, extra_globs, max_files)
+    loaded = load_files_from_github(owner, repo, ref, whitelist, extra_globs, max_files,
+                                    blob_cache=BlobCache(conn, SCHEMA))
     if not loaded.get('success'):
         return {'success': False, 'error': loaded.get('error'),
                 'detail': loaded.get('detail') or loaded.get('message')}
@@ -308,6 +609,7 @@ def action_index_from_github(conn, env: str, body: Dict[str, Any],
             'total_in_tree': loaded.get('total_in_tree'),
             'requested_in_whitelist': loaded.get('requested_in_whitelist'),
             'errors': loaded.get('errors') or [],
+            'blob_stats': loaded.get('blob_stats') or {},
         },
         actor_id=actor_id,
     )
@@ -332,6 +634,7 @@ def action_index_from_github(conn, env: str, body: Dict[str, Any],
         'commit_message': loaded.get('commit_message'),
         'counts': counts,
         'fetch_errors': loaded.get('errors') or [],
+        'blob_stats': loaded.get('blob_stats') or {},
         'elapsed_sec': round(time.time() - started, 2),
     }
 
@@ -483,6 +786,7 @@ def action_activate_snapshot(conn, env: str, snap_id: int) -> Dict[str, Any]:
         f"UPDATE {SCHEMA}.dev_agent_repo_snapshots SET is_active = TRUE "
         f"WHERE id = {int(snap_id)} AND environment = {esc(env)}"
     )
+    _drop_retrieval_cache(cur, env)
     conn.commit()
     return {'success': True, 'snapshot_id': snap_id}
 
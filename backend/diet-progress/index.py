@@ -46,6 +46,60 @@ def get_user_id(event):
         conn.close()
 
 
+def record_weight_rollup(cur, user_id, weight, wellbeing):
+    """Взвешивание в дневную свёртку daily_health_rollups — в той же транзакции, что и запись в diet_weight_log"""
+    cur.execute("""
+        INSERT INTO daily_health_rollups
+            (subject_id, day, weight_first_kg, weight_last_kg, weigh_ins, last_weight_at, last_wellbeing)
+        VALUES ('%s', CURRENT_DATE, %s, %s, 1, NOW(), '%s')
+        ON CONFLICT (subject_id, day) DO UPDATE SET
+            weight_first_kg = COALESCE(daily_health_rollups.weight_first_kg, EXCLUDED.weight_first_kg),
+            weight_last_kg = EXCLUDED.weight_last_kg,
+            weigh_ins = daily_health_rollups.weigh_ins + 1,
+            last_weight_at = EXCLUDED.last_weight_at,
+            last_wellbeing = EXCLUDED.last_wellbeing,
+            updated_at = NOW()
+    """ % (str(user_id), float(weight), float(weight), str(wellbeing or '').replace("'", "''")))
+
+
+def refresh_activity_rollup(cur, user_id):
+    """Активность за сегодня в свёртку: diet_activity_log перезаписывается за день, поэтому пересчёт дня, а не инкремент"""
+    cur.execute("""
+        INSERT INTO daily_health_rollups (subject_id, day, steps, exercise_min, calories_burned)
+        SELECT '%s', CURRENT_DATE, COALESCE(SUM(steps), 0), COALESCE(SUM(exercise_duration_min), 0),
+               COALESCE(SUM(calories_burned), 0)
+        FROM diet_activity_log WHERE user_id = '%s' AND log_date = CURRENT_DATE
+        ON CONFLICT (subject_id, day) DO UPDATE SET
+            steps = EXCLUDED.steps,
+            exercise_min = EXCLUDED.exercise_min,
+            calories_burned = EXCLUDED.calories_burned,
+            updated_at = NOW()
+    """ % (str(user_id), str(user_id)))
+
+
+def get_daily_rollups(cur, user_id, start_date, end_date=None):
+    """Дни плана из daily_health_rollups (O(дней), а не O(записей)), по возрастанию даты"""
+    query = """
+        SELECT day, weight_first_kg, weight_last_kg, weigh_ins, last_weight_at, last_wellbeing,
+               steps, exercise_min, calories_burned
+        FROM daily_health_rollups
+        WHERE subject_id = '%s' AND day >= '%s'
+    """ % (str(user_id), str(start_date))
+    if end_date:
+        query += " AND day <= '%s'" % str(end_date)
+    cur.execute(query + " ORDER BY day ASC")
+    return [
+        {
+            'day': r[0],
+            'weight_first_kg': float(r[1]) if r[1] is not None else None,
+            'weight_last_kg': float(r[2]) if r[2] is not None else None,
+            'weigh_ins': r[3], 'last_weight_at': r[4], 'last_wellbeing': r[5],
+            'steps': r[6], 'exercise_min': r[7], 'calories_burned': r[8],
+        }
+        for r in cur.fetchall()
+    ]
+
+
 def handler(event, context):
     """Трекинг прогресса диеты: вес, мотивация, SOS, планы"""
     method = event.get('httpMethod', 'GET')
@@ -140,24 +194,18 @@ def get_dashboard(user_id):
         }
         plan_id = plan_row[0]
 
-        cur.execute("""
-            SELECT weight_kg, wellbeing, measured_at
-            FROM diet_weight_log WHERE user_id = '%s' AND plan_id = %d
-            ORDER BY measured_at ASC
-        """ % (str(user_id), plan_id))
+        # Вес по дням плана — из свёртки: последнее взвешивание дня
+        weight_days = [d for d in get_daily_rollups(cur, user_id, plan_row[2]) if d['weigh_ins']]
         weight_log = [
-            {'weight_kg': float(r[0]), 'wellbeing': r[1], 'measured_at': str(r[2])}
-            for r in cur.fetchall()
+            {'weight_kg': d['weight_last_kg'], 'wellbeing': d['last_wellbeing'], 'measured_at': str(d['last_weight_at'])}
+            for d in weight_days
         ]
 
         cur.execute("""
-            SELECT COUNT(*) FROM diet_meals
-            WHERE plan_id = %d AND completed = TRUE
+            SELECT COUNT(*) FILTER (WHERE completed = TRUE), COUNT(*) FROM diet_meals
+            WHERE plan_id = %d
         """ % plan_id)
-        completed_meals = cur.fetchone()[0]
-
-        cur.execute("SELECT COUNT(*) FROM diet_meals WHERE plan_id = %d" % plan_id)
-        total_meals = cur.fetchone()[0]
+        completed_meals, total_meals = cur.fetchone()
 
         today_str = date.today().isoformat()
         cur.execute("""
@@ -179,28 +227,13 @@ def get_dashboard(user_id):
         days_elapsed = (date.today() - plan_row[2]).days
         days_remaining = max(0, (plan_row[3] - date.today()).days)
 
-        cur.execute("""
-            SELECT weight_kg FROM diet_weight_log
-            WHERE user_id = '%s' AND plan_id = %d ORDER BY measured_at DESC LIMIT 1
-        """ % (str(user_id), plan_id))
-        last_w = cur.fetchone()
-        last_weight = float(last_w[0]) if last_w else None
-
-        cur.execute("""
-            SELECT weight_kg FROM diet_weight_log
-            WHERE user_id = '%s' AND plan_id = %d ORDER BY measured_at ASC LIMIT 1
-        """ % (str(user_id), plan_id))
-        first_w = cur.fetchone()
-        start_weight = float(first_w[0]) if first_w else None
+        last_weight = weight_days[-1]['weight_last_kg'] if weight_days else None
+        start_weight = weight_days[0]['weight_first_kg'] if weight_days else None
 
         weight_lost = round(start_weight - last_weight, 1) if start_weight and last_weight else 0
 
-        cur.execute("""
-            SELECT measured_at FROM diet_weight_log
-            WHERE user_id = '%s' AND plan_id = %d ORDER BY measured_at DESC LIMIT 1
-        """ % (str(user_id), plan_id))
-        last_log = cur.fetchone()
-        days_since_log = (datetime.now() - last_log[0]).days if last_log else 999
+        last_log_at = weight_days[-1]['last_weight_at'] if weight_days else None
+        days_since_log = (datetime.now() - last_log_at).days if last_log_at else 999
 
         streak = 0
         cur.execute("""
@@ -372,6 +405,7 @@ def log_weight(user_id, body):
                 INSERT INTO diet_weight_log (user_id, weight_kg, wellbeing)
                 VALUES ('%s', %s, '%s')
             """ % (str(user_id), float(weight), str(wellbeing).replace("'", "''")))
+        record_weight_rollup(cur, user_id, weight, wellbeing)
 
         try:
             cur.execute("""
@@ -515,6 +549,7 @@ def save_plan(user_id, body):
                     INSERT INTO diet_weight_log (user_id, plan_id, weight_kg, wellbeing)
                     VALUES ('%s', %d, %s, 'Начало диеты')
                 """ % (str(user_id), plan_id, w))
+                record_weight_rollup(cur, user_id, w, 'Начало диеты')
             except (ValueError, TypeError):
                 pass
 
@@ -769,34 +804,37 @@ def get_diet_context(cur, user_id, plan_id):
 
 
 def get_progress_stats(cur, user_id, plan_id):
-    cur.execute("SELECT weight_kg FROM diet_weight_log WHERE user_id = '%s' AND plan_id = %d ORDER BY measured_at ASC LIMIT 1" % (str(user_id), int(plan_id)))
-    first_w = cur.fetchone()
-    cur.execute("SELECT weight_kg FROM diet_weight_log WHERE user_id = '%s' AND plan_id = %d ORDER BY measured_at DESC LIMIT 1" % (str(user_id), int(plan_id)))
-    last_w = cur.fetchone()
-    lost = round(float(first_w[0]) - float(last_w[0]), 1) if first_w and last_w else 0
-
-    cur.execute("SELECT COUNT(*) FROM diet_meals WHERE plan_id = %d AND completed = TRUE" % int(plan_id))
-    done = cur.fetchone()[0]
-    cur.execute("SELECT COUNT(*) FROM diet_meals WHERE plan_id = %d" % int(plan_id))
-    total = cur.fetchone()[0]
-
-    cur.execute("SELECT COUNT(*) FROM diet_meals WHERE plan_id = %d AND meal_date = '%s' AND completed = TRUE" % (int(plan_id), date.today().isoformat()))
-    today_done = cur.fetchone()[0]
-    cur.execute("SELECT COUNT(*) FROM diet_meals WHERE plan_id = %d AND meal_date = '%s'" % (int(plan_id), date.today().isoformat()))
-    today_total = cur.fetchone()[0]
+    cur.execute("""
+        SELECT (ARRAY_AGG(weight_first_kg ORDER BY day ASC))[1],
+               (ARRAY_AGG(weight_last_kg ORDER BY day DESC))[1],
+               (ARRAY_AGG(last_wellbeing ORDER BY day DESC))[1]
+        FROM daily_health_rollups
+        WHERE subject_id = '%s' AND weigh_ins > 0
+          AND day >= (SELECT start_date FROM diet_plans WHERE id = %d)
+    """ % (str(user_id), int(plan_id)))
+    start_w, current_w, wellbeing = cur.fetchone()
+    start_weight = float(start_w) if start_w is not None else None
+    current_weight = float(current_w) if current_w is not None else None
+    lost = round(start_weight - current_weight, 1) if start_weight is not None and current_weight is not None else 0
 
-    cur.execute("SELECT wellbeing FROM diet_weight_log WHERE user_id = '%s' AND plan_id = %d ORDER BY measured_at DESC LIMIT 1" % (str(user_id), int(plan_id)))
-    wb = cur.fetchone()
+    cur.execute("""
+        SELECT COUNT(*) FILTER (WHERE completed = TRUE),
+               COUNT(*),
+               COUNT(*) FILTER (WHERE meal_date = '%s' AND completed = TRUE),
+               COUNT(*) FILTER (WHERE meal_date = '%s')
+        FROM diet_meals WHERE plan_id = %d
+    """ % (date.today().isoformat(), date.today().isoformat(), int(plan_id)))
+    done, total, today_done, today_total = cur.fetchone()
 
     return {
         'lost': lost,
-        'start_weight': float(first_w[0]) if first_w else None,
-        'current_weight': float(last_w[0]) if last_w else None,
+        'start_weight': start_weight,
+        'current_weight': current_weight,
         'done': done,
         'total': total,
         'today_done': today_done,
         'today_total': today_total,
-        'wellbeing': wb[0] if wb else None
+        'wellbeing': wellbeing
     }
 
 
@@ -1220,6 +1258,7 @@ def log_activity(user_id, body):
             str(user_id), int(plan_id), int(steps), ex_type_safe, int(exercise_duration), ex_note_safe, int(calories_burned),
             int(steps), ex_type_safe, int(exercise_duration), ex_note_safe, int(calories_burned)
         ))
+        refresh_activity_rollup(cur, user_id)
         conn.commit()
         return respond(200, {'success': True, 'message': 'Активность записана'})
     finally:
@@ -1255,27 +1294,24 @@ def get_final_report(user_id, plan_id):
         target_cal = plan[5]
         plan_status = plan[6]
 
-        cur.execute("SELECT weight_kg, measured_at FROM diet_weight_log WHERE user_id = '%s' AND plan_id = %d ORDER BY measured_at ASC" % (str(user_id), int(plan_id)))
-        weights = cur.fetchall()
-        start_weight = float(weights[0][0]) if weights else None
-        end_weight = float(weights[-1][0]) if weights else None
+        # Вес и активность за период плана — из дневных свёрток
+        rollup_days = get_daily_rollups(cur, user_id, start_date, end_date if plan_status != 'active' else None)
+        weight_days = [d for d in rollup_days if d['weigh_ins']]
+        start_weight = weight_days[0]['weight_first_kg'] if weight_days else None
+        end_weight = weight_days[-1]['weight_last_kg'] if weight_days else None
         actual_loss = round(start_weight - end_weight, 1) if start_weight and end_weight else 0
         goal_pct = round(actual_loss / target_loss * 100) if target_loss > 0 else 0
 
-        cur.execute("SELECT COUNT(*) FROM diet_meals WHERE plan_id = %d AND completed = TRUE" % int(plan_id))
-        meals_done = cur.fetchone()[0]
-        cur.execute("SELECT COUNT(*) FROM diet_meals WHERE plan_id = %d" % int(plan_id))
-        meals_total = cur.fetchone()[0]
+        cur.execute("SELECT COUNT(*) FILTER (WHERE completed = TRUE), COUNT(*) FROM diet_meals WHERE plan_id = %d" % int(plan_id))
+        meals_done, meals_total = cur.fetchone()
         adherence = round(meals_done / meals_total * 100) if meals_total > 0 else 0
 
         cur.execute("SELECT COUNT(*) FROM diet_sos_requests WHERE user_id = '%s' AND plan_id = %d" % (str(user_id), int(plan_id)))
         sos_count = cur.fetchone()[0]
 
-        cur.execute("SELECT COALESCE(SUM(steps), 0), COALESCE(SUM(exercise_duration_min), 0), COALESCE(SUM(calories_burned), 0) FROM diet_activity_log WHERE user_id = '%s' AND plan_id = %d" % (str(user_id), int(plan_id)))
-        act = cur.fetchone()
-        total_steps = act[0]
-        total_exercise_min = act[1]
-        total_cal_burned = act[2]
+        total_steps = sum(d['steps'] or 0 for d in rollup_days)
+        total_exercise_min = sum(d['exercise_min'] or 0 for d in rollup_days)
+        total_cal_burned = sum(d['calories_burned'] or 0 for d in rollup_days)
 
         days_active = (date.today() - start_date).days if plan_status == 'active' else (end_date - start_date).days
         days_active = max(days_active, 1)
@@ -1283,11 +1319,10 @@ def get_final_report(user_id, plan_id):
         avg_daily_steps = round(total_steps / days_active) if days_active > 0 else 0
 
         weight_trend = []
-        for w in weights:
-            weight_trend.append({'weight': float(w[0]), 'date': str(w[1])[:10]})
+        for d in weight_days:
+            weight_trend.append({'weight': d['weight_last_kg'], 'date': str(d['day'])})
 
-        cur.execute("SELECT COUNT(DISTINCT log_date) FROM diet_weight_log WHERE user_id = '%s' AND plan_id = %d" % (str(user_id), int(plan_id)))
-        weigh_in_days = cur.fetchone()[0]
+        weigh_in_days = len(weight_days)
 
         streak = 0
         cur.execute("""
@@ -63,6 +63,22 @@ def get_food_diary_user_id(conn, uuid_user_id):
     return 1
 
 
+def bump_diary_rollup(cur, fd_user_id, day, calories, protein, fats, carbs):
+    """Запись в food_diary → дельта дневной свёртки daily_health_rollups (как nutrition.bump_daily_rollup),
+    в той же транзакции. Записи без member_id сворачиваются по ключу legacy:<user_id>."""
+    cur.execute("""
+        INSERT INTO daily_health_rollups (subject_id, day, calories, protein, fats, carbs, diary_entries)
+        VALUES ('legacy:%d', '%s', %s, %s, %s, %s, 1)
+        ON CONFLICT (subject_id, day) DO UPDATE SET
+            calories = daily_health_rollups.calories + EXCLUDED.calories,
+            protein = daily_health_rollups.protein + EXCLUDED.protein,
+            fats = daily_health_rollups.fats + EXCLUDED.fats,
+            carbs = daily_health_rollups.carbs + EXCLUDED.carbs,
+            diary_entries = daily_health_rollups.diary_entries + 1,
+            updated_at = NOW()
+    """ % (int(fd_user_id), day, float(calories), float(protein), float(fats), float(carbs)))
+
+
 def handler(event, context):
     """Синхронизация диеты с Рецептами, Покупками и Счётчиком БЖУ"""
     method = event.get('httpMethod', 'POST')
@@ -252,17 +268,19 @@ def log_meal_bju(user_id, body):
         fd_type = meal_type_map.get(meal_type, 'lunch')
 
         fd_user_id = get_food_diary_user_id(conn, user_id)
+        today = date.today().isoformat()
 
         cur.execute("""
             INSERT INTO food_diary (user_id, date, meal_type, product_name, amount, calories, protein, fats, carbs, notes)
             VALUES (%d, '%s', '%s', '%s', 1, %s, %s, %s, %s, 'Из плана диеты')
         """ % (
             fd_user_id,
-            date.today().isoformat(),
+            today,
             fd_type,
             title.replace("'", "''")[:255],
             float(cal), float(prot), float(fat), float(carbs),
         ))
+        bump_diary_rollup(cur, fd_user_id, today, cal, prot, fat, carbs)
 
         cur.execute("""
             UPDATE diet_meals SET completed = TRUE, completed_at = NOW()
@@ -1,10 +1,9 @@
 import json
 import os
-import urllib.request
-import urllib.error
 import psycopg2
 
 from ai_credits_utils import check_and_spend_ai_credits
+from llm_cache_utils import cached_completion
 
 YANDEX_GPT_URL = 'https://llm.api.cloud.yandex.net/foundationModels/v1/completion'
 
@@ -140,36 +139,34 @@ def handler(event: dict, context) -> dict:
         
         print(f'[DEBUG] YandexGPT request: {json.dumps(yandex_request, ensure_ascii=False)}')
         
-        req = urllib.request.Request(
+        response = cached_completion(
             YANDEX_GPT_URL,
-            data=json.dumps(yandex_request).encode('utf-8'),
             headers={
                 'Authorization': f'Api-Key {api_key}',
                 'Content-Type': 'application/json'
-            }
+            },
+            json=yandex_request,
+            timeout=30,
+            function_name='event_ai_ideas'
         )
-        
-        try:
-            with urllib.request.urlopen(req, timeout=30) as response:
-                response_text = response.read().decode('utf-8')
-                print(f'[DEBUG] YandexGPT response: {response_text}')
-                data = json.loads(response_text)
-                
-                if data.get('result') and data['result'].get('alternatives'):
-                    text = data['result']['alternatives'][0]['message']['text']
-                    
-                    return {
-                        'statusCode': 200,
-                        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                        'body': json.dumps({'ideas': text}, ensure_ascii=False),
-                        'isBase64Encoded': False
-                    }
-                else:
-                    raise Exception('Invalid response from Yandex GPT')
-        except urllib.error.HTTPError as e:
-            error_body = e.read().decode('utf-8')
-            print(f'[ERROR] YandexGPT HTTP {e.code}: {error_body}')
-            raise Exception(f'YandexGPT API error: {error_body}')
+        if response.status_code != 200:
+            print(f'[ERROR] YandexGPT HTTP {response.status_code}: {response.text}')
+            raise Exception(f'YandexGPT API error: {response.text}')
+
+        print(f'[DEBUG] YandexGPT response (from_cache={response.from_cache}): {response.text}')
+        data = response.json()
+
+        if data.get('result') and data['result'].get('alternatives'):
+            text = data['result']['alternatives'][0]['message']['text']
+
+            return {
+                'statusCode': 200,
+                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                'body': json.dumps({'ideas': text}, ensure_ascii=False),
+                'isBase64Encoded': False
+            }
+        else:
+            raise Exception('Invalid response from Yandex GPT')
         
     except Exception as e:
         print(f'[ERROR] {str(e)}')
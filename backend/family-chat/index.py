@@ -2,6 +2,8 @@
 
 import json
 import os
+import select
+import time
 from typing import Dict, Any, Optional
 import psycopg2
 from psycopg2.extras import RealDictCursor
@@ -11,6 +13,8 @@ from track_event_helper import track_event
 SCHEMA = 't_p5815085_family_assistant_pro'
 MESSAGES_TABLE = 'family_chat_messages'
 MAX_API_BASE = 'https://platform-api.max.ru'
+# Максимальное ожидание long-poll (wait=N), чтобы уложиться в таймаут функции
+LONG_POLL_MAX_SECONDS = 25
 
 
 def send_max_message(chat_id: int, text: str) -> bool:
@@ -58,21 +62,17 @@ def resp(status: int, body: dict) -> dict:
 
 def get_user_context(cur, token: str) -> Optional[dict]:
     cur.execute(
-        f"SELECT user_id FROM {SCHEMA}.sessions WHERE token = '{escape(token)}' AND expires_at > NOW()"
-    )
-    session = cur.fetchone()
-    if not session:
-        return None
-    user_id = str(session['user_id'])
-    cur.execute(
-        f"SELECT id, family_id, name, photo_url, avatar FROM {SCHEMA}.family_members "
-        f"WHERE user_id = '{escape(user_id)}' LIMIT 1"
+        f"SELECT s.user_id, fm.id, fm.family_id, fm.name, fm.photo_url, fm.avatar "
+        f"FROM {SCHEMA}.sessions s "
+        f"LEFT JOIN LATERAL (SELECT id, family_id, name, photo_url, avatar FROM {SCHEMA}.family_members "
+        f"WHERE user_id = s.user_id LIMIT 1) fm ON TRUE "
+        f"WHERE s.token = '{escape(token)}' AND s.expires_at > NOW()"
     )
     member = cur.fetchone()
     if not member or not member['family_id']:
         return None
     return {
-        'user_id': user_id,
+        'user_id': str(member['user_id']),
         'family_id': str(member['family_id']),
         'member_id': str(member['id']),
         'member_name': member['name'],
@@ -96,26 +96,61 @@ def ensure_family_chat(cur, family_id: str) -> str:
     return str(cur.fetchone()['id'])
 
 
-def ensure_dm_chat(cur, family_id: str, me_id: str, other_id: str) -> str:
-    a, b = sorted([me_id, other_id])
+def ensure_dm_chats(cur, family_id: str, me_id: str) -> None:
+    """Создаёт одним INSERT все недостающие тет-а-тет диалоги me с членами семьи"""
     cur.execute(
-        f"SELECT id FROM {SCHEMA}.chat_conversations "
-        f"WHERE family_id = '{escape(family_id)}' AND kind = 'dm' "
-        f"AND member_a_id = '{escape(a)}' AND member_b_id = '{escape(b)}' LIMIT 1"
+        f"INSERT INTO {SCHEMA}.chat_conversations(family_id, kind, member_a_id, member_b_id) "
+        f"SELECT fm.family_id, 'dm', LEAST(fm.id, '{escape(me_id)}'::uuid), GREATEST(fm.id, '{escape(me_id)}'::uuid) "
+        f"FROM {SCHEMA}.family_members fm "
+        f"WHERE fm.family_id = '{escape(family_id)}' AND fm.id != '{escape(me_id)}' "
+        f"ON CONFLICT (family_id, member_a_id, member_b_id) WHERE kind = 'dm' DO NOTHING"
     )
-    row = cur.fetchone()
-    if row:
-        return str(row['id'])
+
+
+def load_chat_list(cur, family_id: str, me_id: str) -> list:
+    """
+    Члены семьи + id их диалога с me + счётчик непрочитанных одним запросом.
+    Строка самого me соответствует общему чату семьи, остальные — тет-а-тет.
+    conv_id = NULL значит, что диалог ещё не создан.
+    """
     cur.execute(
-        f"INSERT INTO {SCHEMA}.chat_conversations(family_id, kind, member_a_id, member_b_id) "
-        f"VALUES ('{escape(family_id)}', 'dm', '{escape(a)}', '{escape(b)}') RETURNING id"
+        f"SELECT fm.id AS member_id, fm.name, fm.role, fm.photo_url, fm.avatar, "
+        f"c.id AS conv_id, COALESCE(r.unread_count, 0) AS unread "
+        f"FROM {SCHEMA}.family_members fm "
+        f"LEFT JOIN {SCHEMA}.chat_conversations c ON c.family_id = fm.family_id AND ("
+        f"(fm.id = '{escape(me_id)}' AND c.kind = 'family') OR "
+        f"(fm.id != '{escape(me_id)}' AND c.kind = 'dm' "
+        f"AND c.member_a_id = LEAST(fm.id, '{escape(me_id)}'::uuid) "
+        f"AND c.member_b_id = GREATEST(fm.id, '{escape(me_id)}'::uuid))) "
+        f"LEFT JOIN {SCHEMA}.chat_reads r ON r.conversation_id = c.id AND r.member_id = '{escape(me_id)}' "
+        f"WHERE fm.family_id = '{escape(family_id)}' ORDER BY fm.created_at"
+    )
+    return cur.fetchall()
+
+
+def bump_unread(cur, conv_id: str, recipient_member_ids: list) -> None:
+    """+1 к счётчику непрочитанных у получателей сообщения"""
+    if not recipient_member_ids:
+        return
+    ids_sql = ', '.join(f"'{escape(mid)}'::uuid" for mid in recipient_member_ids)
+    cur.execute(
+        f"INSERT INTO {SCHEMA}.chat_reads(conversation_id, member_id, last_read_at, unread_count) "
+        f"SELECT '{escape(conv_id)}', mid, NULL, 1 FROM unnest(ARRAY[{ids_sql}]) AS mid "
+        f"ON CONFLICT (conversation_id, member_id) DO UPDATE SET unread_count = {SCHEMA}.chat_reads.unread_count + 1"
+    )
+
+
+def mark_conversation_read(cur, conv_id: str, member_id: str) -> None:
+    cur.execute(
+        f"INSERT INTO {SCHEMA}.chat_reads(conversation_id, member_id, last_read_at, unread_count) "
+        f"VALUES ('{escape(conv_id)}', '{escape(member_id)}', NOW(), 0) "
+        f"ON CONFLICT (conversation_id, member_id) DO UPDATE SET last_read_at = NOW(), unread_count = 0"
     )
-    return str(cur.fetchone()['id'])
 
 
 def check_access(cur, conversation_id: str, family_id: str, member_id: str) -> Optional[dict]:
     cur.execute(
-        f"SELECT id, family_id, kind, member_a_id, member_b_id "
+        f"SELECT id, family_id, kind, member_a_id, member_b_id, last_seq "
         f"FROM {SCHEMA}.chat_conversations WHERE id = '{escape(conversation_id)}' LIMIT 1"
     )
     conv = cur.fetchone()
@@ -131,6 +166,47 @@ def check_access(cur, conversation_id: str, family_id: str, member_id: str) -> O
     return dict(conv)
 
 
+def chat_channel(conv_id: str) -> str:
+    """Имя канала LISTEN/NOTIFY для диалога. conv_id — только conv['id'] из БД, не ввод клиента:
+    pg_notify сравнивает имя канала точно, а LISTEN без кавычек приводит его к нижнему регистру"""
+    return 'family_chat_' + str(conv_id).replace('-', '')
+
+
+def wait_for_messages(conn, conv_id: str, after_seq: int, timeout: int) -> int:
+    """
+    Long-poll: ждёт NOTIFY по диалогу до timeout секунд.
+    Возвращает актуальный last_seq диалога.
+    """
+    channel = chat_channel(conv_id)
+    conn.commit()
+    conn.autocommit = True
+    cur = conn.cursor()
+    try:
+        cur.execute(f"LISTEN {channel}")
+        # Повторная проверка после LISTEN: сообщение могло прийти между проверкой и подпиской
+        cur.execute(f"SELECT last_seq FROM {SCHEMA}.chat_conversations WHERE id = '{escape(conv_id)}'")
+        last_seq = int(cur.fetchone()[0])
+        deadline = time.monotonic() + timeout
+        while last_seq <= after_seq:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            if select.select([conn], [], [], remaining) == ([], [], []):
+                break
+            conn.poll()
+            while conn.notifies:
+                note = conn.notifies.pop(0)
+                try:
+                    last_seq = max(last_seq, int(note.payload))
+                except ValueError:
+                    pass
+        cur.execute(f"UNLISTEN {channel}")
+        return last_seq
+    finally:
+        cur.close()
+        conn.autocommit = False
+
+
 def get_recipients(cur, conv: dict, sender_id: str, family_id: str) -> list:
     """Список member_id, кому слать уведомление (без отправителя)"""
     if conv['kind'] == 'family':
@@ -200,6 +276,7 @@ def serialize_message(row: dict) -> dict:
         'sender_avatar': row.get('sender_avatar'),
         'content': row['content'],
         'reactions': reactions,
+        'seq': row.get('seq'),
         'created_at': row['created_at'].isoformat() if row.get('created_at') else None,
     }
 
@@ -236,62 +313,39 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             action = params.get('action', 'list')
 
             if action == 'list':
-                # Список чатов: общий + тет-а-тет с каждым членом семьи
-                family_chat_id = ensure_family_chat(cur, family_id)
-                conn.commit()
-
-                cur.execute(
-                    f"SELECT id, name, role, photo_url, avatar FROM {SCHEMA}.family_members "
-                    f"WHERE family_id = '{escape(family_id)}' ORDER BY created_at"
-                )
-                members = cur.fetchall()
-
-                chats = [{
-                    'id': family_chat_id,
-                    'kind': 'family',
-                    'title': 'Чат семьи',
-                    'subtitle': 'Общий чат',
-                    'member_id': None,
-                    'photo_url': None,
-                    'avatar': None,
-                }]
-
-                for m in members:
-                    if str(m['id']) == me_id:
+                # Список чатов: общий + тет-а-тет с каждым членом семьи.
+                # Обычно один запрос; недостающие диалоги создаются пачкой и список перечитывается.
+                rows = load_chat_list(cur, family_id, me_id)
+                if any(r['conv_id'] is None for r in rows):
+                    ensure_family_chat(cur, family_id)
+                    ensure_dm_chats(cur, family_id, me_id)
+                    conn.commit()
+                    rows = load_chat_list(cur, family_id, me_id)
+
+                chats = []
+                for r in rows:
+                    if str(r['member_id']) == me_id:
+                        chats.insert(0, {
+                            'id': str(r['conv_id']),
+                            'kind': 'family',
+                            'title': 'Чат семьи',
+                            'subtitle': 'Общий чат',
+                            'member_id': None,
+                            'photo_url': None,
+                            'avatar': None,
+                            'unread': r['unread'],
+                        })
                         continue
-                    dm_id = ensure_dm_chat(cur, family_id, me_id, str(m['id']))
                     chats.append({
-                        'id': dm_id,
+                        'id': str(r['conv_id']),
                         'kind': 'dm',
-                        'title': m['name'],
-                        'subtitle': m.get('role') or 'Член семьи',
-                        'member_id': str(m['id']),
-                        'photo_url': m.get('photo_url'),
-                        'avatar': m.get('avatar'),
+                        'title': r['name'],
+                        'subtitle': r.get('role') or 'Член семьи',
+                        'member_id': str(r['member_id']),
+                        'photo_url': r.get('photo_url'),
+                        'avatar': r.get('avatar'),
+                        'unread': r['unread'],
                     })
-                conn.commit()
-
-                # Подсчёт непрочитанных по каждому чату
-                for chat in chats:
-                    cur.execute(
-                        f"SELECT last_read_at FROM {SCHEMA}.chat_reads "
-                        f"WHERE conversation_id = '{escape(chat['id'])}' AND member_id = '{escape(me_id)}'"
-                    )
-                    r = cur.fetchone()
-                    if r:
-                        cur.execute(
-                            f"SELECT COUNT(*) AS c FROM {SCHEMA}.{MESSAGES_TABLE} "
-                            f"WHERE conversation_id = '{escape(chat['id'])}' "
-                            f"AND created_at > '{escape(r['last_read_at'])}' "
-                            f"AND sender_member_id != '{escape(me_id)}'"
-                        )
-                    else:
-                        cur.execute(
-                            f"SELECT COUNT(*) AS c FROM {SCHEMA}.{MESSAGES_TABLE} "
-                            f"WHERE conversation_id = '{escape(chat['id'])}' "
-                            f"AND sender_member_id != '{escape(me_id)}'"
-                        )
-                    chat['unread'] = cur.fetchone()['c']
 
                 return resp(200, {
                     'success': True,
@@ -311,26 +365,43 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 conv = check_access(cur, conv_id, family_id, me_id)
                 if not conv:
                     return resp(403, {'error': 'Нет доступа к чату'})
+                # Канонический uuid из БД: канал NOTIFY и LISTEN должны совпасть побайтно
+                conv_id = str(conv['id'])
 
-                after = params.get('after')  # ISO timestamp для polling
+                after = params.get('after')  # ISO timestamp для polling (старые клиенты)
+                after_seq = params.get('after_seq')  # водяной знак last_seq из прошлого ответа
                 limit = min(int(params.get('limit', '200')), 500)
+                last_seq = int(conv['last_seq'] or 0)
 
                 where_extra = ''
-                if after:
+                if after_seq is not None and after_seq != '':
+                    after_seq = int(after_seq)
+                    if last_seq <= after_seq:
+                        # Нового нет: без запроса к сообщениям, либо ждём NOTIFY (wait=N)
+                        wait = min(int(params.get('wait', '0') or 0), LONG_POLL_MAX_SECONDS)
+                        if wait > 0:
+                            last_seq = wait_for_messages(conn, conv_id, after_seq, wait)
+                        if last_seq <= after_seq:
+                            return resp(200, {'success': True, 'messages': [], 'last_seq': last_seq})
+                    where_extra = f"AND m.seq > {after_seq}"
+                elif after:
                     where_extra = f"AND m.created_at > '{escape(after)}'"
 
                 cur.execute(
-                    f"SELECT m.id, m.conversation_id, m.sender_member_id, m.content, m.reactions, m.created_at, "
+                    f"SELECT m.id, m.conversation_id, m.sender_member_id, m.content, m.reactions, m.created_at, m.seq, "
                     f"fm.name AS sender_name, fm.photo_url AS sender_photo, fm.avatar AS sender_avatar "
                     f"FROM {SCHEMA}.{MESSAGES_TABLE} m "
                     f"LEFT JOIN {SCHEMA}.family_members fm ON fm.id = m.sender_member_id "
                     f"WHERE m.conversation_id = '{escape(conv_id)}' {where_extra} "
-                    f"ORDER BY m.created_at ASC LIMIT {limit}"
+                    f"ORDER BY m.seq ASC, m.created_at ASC LIMIT {limit}"
                 )
                 rows = cur.fetchall()
                 messages = [serialize_message(dict(r)) for r in rows]
+                if rows and rows[-1]['seq'] is not None:
+                    # При упоре в limit водяной знак — последний отданный seq, чтобы догрузить остаток
+                    last_seq = int(rows[-1]['seq']) if len(rows) == limit else max(last_seq, int(rows[-1]['seq']))
 
-                return resp(200, {'success': True, 'messages': messages})
+                return resp(200, {'success': True, 'messages': messages, 'last_seq': last_seq})
 
             return resp(400, {'error': 'Unknown action'})
 
@@ -349,28 +420,33 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 conv = check_access(cur, conv_id, family_id, me_id)
                 if not conv:
                     return resp(403, {'error': 'Нет доступа'})
+                conv_id = str(conv['id'])
 
+                # Следующий seq диалога; блокировка строки диалога до коммита
+                # гарантирует, что seq коммитятся строго по возрастанию
                 cur.execute(
-                    f"INSERT INTO {SCHEMA}.{MESSAGES_TABLE}(conversation_id, sender_member_id, content) "
-                    f"VALUES ('{escape(conv_id)}', '{escape(me_id)}', '{escape(content)}') "
-                    f"RETURNING id, conversation_id, sender_member_id, content, reactions, created_at"
+                    f"UPDATE {SCHEMA}.chat_conversations "
+                    f"SET updated_at = NOW(), last_message_at = NOW(), last_seq = last_seq + 1 "
+                    f"WHERE id = '{escape(conv_id)}' RETURNING last_seq"
                 )
-                msg_row = cur.fetchone()
+                seq = int(cur.fetchone()['last_seq'])
 
                 cur.execute(
-                    f"UPDATE {SCHEMA}.chat_conversations SET updated_at = NOW() "
-                    f"WHERE id = '{escape(conv_id)}'"
+                    f"INSERT INTO {SCHEMA}.{MESSAGES_TABLE}(conversation_id, sender_member_id, content, seq) "
+                    f"VALUES ('{escape(conv_id)}', '{escape(me_id)}', '{escape(content)}', {seq}) "
+                    f"RETURNING id, conversation_id, sender_member_id, content, reactions, created_at, seq"
                 )
+                msg_row = cur.fetchone()
+
+                # Будим long-poll ожидающих (NOTIFY доставляется при коммите)
+                cur.execute(f"SELECT pg_notify('{chat_channel(conv_id)}', '{seq}')")
 
                 # Авто-прочтение для отправителя
-                cur.execute(
-                    f"INSERT INTO {SCHEMA}.chat_reads(conversation_id, member_id, last_read_at) "
-                    f"VALUES ('{escape(conv_id)}', '{escape(me_id)}', NOW()) "
-                    f"ON CONFLICT (conversation_id, member_id) DO UPDATE SET last_read_at = NOW()"
-                )
+                mark_conversation_read(cur, conv_id, me_id)
 
-                # Уведомления в колокольчик + сбор целей для MAX
+                # Счётчики непрочитанных + уведомления в колокольчик + сбор целей для MAX
                 recipients = get_recipients(cur, conv, me_id, family_id)
+                bump_unread(cur, conv_id, recipients)
                 max_targets = create_chat_notifications(cur, recipients, ctx['member_name'], content, conv['kind']) or []
 
                 conn.commit()
@@ -400,29 +476,30 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 emoji = body.get('emoji')
                 if not conv_id or not msg_id or not emoji:
                     return resp(400, {'error': 'conversation_id, message_id, emoji обязательны'})
-                conv = check_access(cur, conv_id, family_id, me_id)
-                if not conv:
-                    return resp(403, {'error': 'Нет доступа'})
+                if len(emoji) > 16:
+                    return resp(400, {'error': 'Некорректная реакция'})
 
+                # Атомарный инкремент счётчика эмодзи одним UPDATE (без read-modify-write),
+                # проверка доступа к диалогу — в том же запросе
                 cur.execute(
-                    f"SELECT reactions FROM {SCHEMA}.{MESSAGES_TABLE} "
-                    f"WHERE id = '{escape(msg_id)}' AND conversation_id = '{escape(conv_id)}'"
+                    f"UPDATE {SCHEMA}.{MESSAGES_TABLE} m "
+                    f"SET reactions = jsonb_set(COALESCE(m.reactions, '{{}}'::jsonb), ARRAY['{escape(emoji)}'], "
+                    f"to_jsonb(COALESCE((m.reactions->>'{escape(emoji)}')::int, 0) + 1)) "
+                    f"FROM {SCHEMA}.chat_conversations c "
+                    f"WHERE m.id = '{escape(msg_id)}' AND m.conversation_id = '{escape(conv_id)}' "
+                    f"AND c.id = m.conversation_id AND c.family_id = '{escape(family_id)}' "
+                    f"AND (c.kind != 'dm' OR '{escape(me_id)}' IN (c.member_a_id::text, c.member_b_id::text)) "
+                    f"RETURNING m.reactions"
                 )
                 row = cur.fetchone()
                 if not row:
+                    conn.rollback()
+                    if not check_access(cur, conv_id, family_id, me_id):
+                        return resp(403, {'error': 'Нет доступа'})
                     return resp(404, {'error': 'Сообщение не найдено'})
                 reactions = row['reactions'] or {}
                 if isinstance(reactions, str):
-                    try:
-                        reactions = json.loads(reactions)
-                    except Exception:
-                        reactions = {}
-                reactions[emoji] = int(reactions.get(emoji, 0)) + 1
-
-                cur.execute(
-                    f"UPDATE {SCHEMA}.{MESSAGES_TABLE} SET reactions = '{escape(json.dumps(reactions))}'::jsonb "
-                    f"WHERE id = '{escape(msg_id)}'"
-                )
+                    reactions = json.loads(reactions)
                 conn.commit()
                 return resp(200, {'success': True, 'reactions': reactions})
 
@@ -433,11 +510,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 conv = check_access(cur, conv_id, family_id, me_id)
                 if not conv:
                     return resp(403, {'error': 'Нет доступа'})
-                cur.execute(
-                    f"INSERT INTO {SCHEMA}.chat_reads(conversation_id, member_id, last_read_at) "
-                    f"VALUES ('{escape(conv_id)}', '{escape(me_id)}', NOW()) "
-                    f"ON CONFLICT (conversation_id, member_id) DO UPDATE SET last_read_at = NOW()"
-                )
+                mark_conversation_read(cur, conv_id, me_id)
                 conn.commit()
                 return resp(200, {'success': True})
 
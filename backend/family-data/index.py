@@ -4,8 +4,10 @@ Args: event с httpMethod, body, headers (X-Auth-Token)
 Returns: JSON с данными семьи или ошибкой
 """
 
+import base64
 import json
 import os
+from datetime import datetime, timedelta
 from typing import Dict, Any, Optional, List
 import psycopg2
 from psycopg2.extras import RealDictCursor
@@ -61,150 +63,235 @@ def verify_token(token: str) -> Optional[Dict[str, Any]]:
         cur.close()
         conn.close()
 
-def get_family_data(family_id: int) -> Dict[str, Any]:
+# Коллекции синхронизации. change — колонка версии строки для delta-режима (since=<token>).
+# where получает уже экранированный family_id.
+SYNC_COLLECTIONS = [
+    {
+        'name': 'members', 'alias': 'fm',
+        'select': """fm.id, fm.name, fm.role, fm.avatar, fm.avatar_type, fm.photo_url,
+                     fm.points, fm.level, fm.workload, fm.age, fm.achievements,
+                     fm.food_preferences, fm.responsibilities, fm.mood_status""",
+        'from': f"{SCHEMA}.family_members fm",
+        'where': "fm.family_id = {fid}",
+        'order': None, 'limit': None,
+    },
+    {
+        'name': 'tasks', 'alias': 't',
+        'select': """t.id, t.title, t.assignee, t.completed, t.category, t.points,
+                     t.deadline, t.reminder_time, t.shopping_list, t.is_recurring,
+                     t.recurring_pattern, t.next_occurrence""",
+        'from': f"{SCHEMA}.tasks t",
+        'where': "t.family_id = {fid}",
+        'order': 't.created_at DESC', 'limit': None,
+    },
+    {
+        'name': 'children_profiles', 'alias': 'cp',
+        'select': "cp.*, fm.name as child_name, fm.avatar, fm.age",
+        'from': f"{SCHEMA}.children_profiles cp JOIN {SCHEMA}.family_members fm ON cp.child_member_id = fm.id",
+        'where': "cp.family_id = {fid}",
+        'order': None, 'limit': None,
+    },
+    {
+        'name': 'test_results', 'alias': 'tr',
+        'select': "tr.*, fm.name as child_name",
+        'from': f"{SCHEMA}.test_results tr JOIN {SCHEMA}.family_members fm ON tr.child_member_id = fm.id",
+        'where': "fm.family_id = {fid}",
+        'order': 'tr.date DESC', 'limit': None,
+    },
+    {
+        'name': 'calendar_events', 'alias': 'ce',
+        'select': "ce.*",
+        'from': f"{SCHEMA}.calendar_events ce",
+        'where': "ce.family_id = {fid}",
+        'order': 'ce.date DESC', 'limit': 100,
+    },
+    {
+        'name': 'family_values', 'alias': 'fv',
+        'select': "fv.*",
+        'from': f"{SCHEMA}.family_values fv",
+        'where': "fv.family_id = {fid}",
+        'order': None, 'limit': None,
+    },
+    {
+        'name': 'traditions', 'alias': 'tdn',
+        'select': "tdn.*",
+        'from': f"{SCHEMA}.traditions tdn",
+        'where': "tdn.family_id = {fid}",
+        'order': None, 'limit': None,
+    },
+    {
+        'name': 'blog_posts', 'alias': 'bp',
+        'select': "bp.*, fm.name as author_name",
+        'from': f"{SCHEMA}.blog_posts bp LEFT JOIN {SCHEMA}.family_members fm ON bp.author_id = fm.id",
+        'where': "bp.family_id = {fid}",
+        'order': 'bp.created_at DESC', 'limit': 50,
+    },
+    {
+        'name': 'family_album', 'alias': 'fa',
+        'select': "fa.*, fm.name as uploaded_by_name",
+        'from': f"{SCHEMA}.family_album fa LEFT JOIN {SCHEMA}.family_members fm ON fa.uploaded_by = fm.id",
+        'where': "fa.family_id = {fid}",
+        'order': 'fa.created_at DESC', 'limit': 100,
+    },
+    {
+        'name': 'family_tree', 'alias': 'ft',
+        'select': "ft.*",
+        'from': f"{SCHEMA}.family_tree ft",
+        'where': "ft.family_id = {fid}",
+        'order': None, 'limit': None,
+    },
+    {
+        'name': 'chat_messages', 'alias': 'cm',
+        'select': "cm.*, fm.name as sender_name, fm.avatar as sender_avatar",
+        'from': f"{SCHEMA}.chat_messages cm LEFT JOIN {SCHEMA}.family_members fm ON cm.sender_id = fm.id",
+        'where': "cm.family_id = {fid}",
+        'order': 'cm.created_at DESC', 'limit': 100,
+    },
+]
+
+# Перекрытие окна delta-синхронизации: строки, закоммиченные чуть позже снимка,
+# всё равно попадут в следующий ответ (клиент применяет их идемпотентно по id)
+SYNC_OVERLAP_SECONDS = 60
+
+
+# updated_at поддерживает триггер touch_updated_at (V0377) — любой UPDATE сдвигает версию строки
+def _change_expr(coll: Dict[str, Any]) -> str:
+    return f"COALESCE({coll['alias']}.updated_at, {coll['alias']}.created_at)"
+
+
+def encode_sync_token(server_time: str, versions: Dict[str, Any]) -> str:
+    raw = json.dumps({'t': server_time, 'v': versions}, separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii')
+
+
+def decode_sync_token(token: Optional[str]) -> Optional[Dict[str, Any]]:
+    if not token:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(token.encode('ascii') + b'=' * (-len(token) % 4))
+        parsed = json.loads(raw.decode('utf-8'))
+        if not isinstance(parsed, dict) or 't' not in parsed or not isinstance(parsed.get('v'), dict):
+            return None
+        datetime.fromisoformat(parsed['t'])
+        return parsed
+    except Exception:
+        return None
+
+
+def _collection_query(coll: Dict[str, Any], fid: str, extra_where: str = '', select: Optional[str] = None) -> str:
+    sql = f"SELECT {select or coll['select']} FROM {coll['from']} WHERE {coll['where'].format(fid=fid)} {extra_where}"
+    if coll['order']:
+        sql += f" ORDER BY {coll['order']}"
+    if coll['limit']:
+        sql += f" LIMIT {coll['limit']}"
+    return sql
+
+
+def _collection_versions(cur, fid: str, since: Optional[str]) -> Dict[str, Dict[str, Any]]:
+    """
+    Вектор версий одним запросом: по каждой коллекции count, max(updated_at|created_at)
+    и сколько строк создано после since (чтобы отличить удаления от вставок).
+    """
+    since_sql = escape_string(since) if since else 'NULL'
+    parts = []
+    for coll in SYNC_COLLECTIONS:
+        change = _change_expr(coll)
+        created = f"{coll['alias']}.created_at"
+        parts.append(
+            f"SELECT '{coll['name']}' AS name, COUNT(*) AS cnt, MAX({change}) AS version, "
+            f"COUNT(*) FILTER (WHERE {created} > {since_sql}::timestamp) AS inserted "
+            f"FROM {coll['from']} WHERE {coll['where'].format(fid=fid)}"
+        )
+    versions = {}
+    try:
+        cur.execute(' UNION ALL '.join(parts))
+        for row in cur.fetchall():
+            versions[row['name']] = {
+                'count': int(row['cnt'] or 0),
+                'version': row['version'].isoformat() if row['version'] else None,
+                'inserted': int(row['inserted'] or 0),
+            }
+    except Exception:
+        # Схема коллекции не совпала — версии по одной, сломанная коллекция уйдёт полной выгрузкой
+        for coll in SYNC_COLLECTIONS:
+            try:
+                cur.execute(
+                    f"SELECT COUNT(*) AS cnt, MAX({_change_expr(coll)}) AS version, "
+                    f"COUNT(*) FILTER (WHERE {coll['alias']}.created_at > {since_sql}::timestamp) AS inserted "
+                    f"FROM {coll['from']} WHERE {coll['where'].format(fid=fid)}"
+                )
+                row = cur.fetchone()
+                versions[coll['name']] = {
+                    'count': int(row['cnt'] or 0),
+                    'version': row['version'].isoformat() if row['version'] else None,
+                    'inserted': int(row['inserted'] or 0),
+                }
+            except Exception:
+                pass
+    return versions
+
+
+def get_family_data(family_id: Any, since: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Полная (since=None) или delta-синхронизация данных семьи.
+    Delta возвращает только изменённые с прошлого sync_token строки; если в коллекции
+    были удаления — ещё и полный список её id в ids, чтобы клиент удалил лишнее.
+    Неизменённые коллекции перечислены в unchanged и не запрашиваются.
+    """
     conn = get_db_connection()
     cur = conn.cursor(cursor_factory=RealDictCursor)
-    
+    fid = escape_string(str(family_id))
+    token = decode_sync_token(since)
+
     try:
-        data = {}
-        
-        # Члены семьи
-        try:
-            cur.execute(f"""
-                SELECT id, name, role, avatar, avatar_type, photo_url, 
-                       points, level, workload, age, achievements, 
-                       food_preferences, responsibilities, mood_status
-                FROM {SCHEMA}.family_members 
-                WHERE family_id = {family_id}
-            """)
-            data['members'] = [dict(row) for row in cur.fetchall()]
-        except Exception as e:
-            data['members'] = []
-        
-        # Задачи
-        try:
-            cur.execute(f"""
-                SELECT id, title, assignee, completed, category, points, 
-                       deadline, reminder_time, shopping_list, is_recurring,
-                       recurring_pattern, next_occurrence
-                FROM {SCHEMA}.tasks 
-                WHERE family_id = {family_id}
-                ORDER BY created_at DESC
-            """)
-            data['tasks'] = [dict(row) for row in cur.fetchall()]
-        except Exception:
-            data['tasks'] = []
-        
-        # Профили детей
-        try:
-            cur.execute(f"""
-                SELECT cp.*, fm.name as child_name, fm.avatar, fm.age
-                FROM {SCHEMA}.children_profiles cp
-                JOIN {SCHEMA}.family_members fm ON cp.child_member_id = fm.id
-                WHERE cp.family_id = {family_id}
-            """)
-            data['children_profiles'] = [dict(row) for row in cur.fetchall()]
-        except Exception:
-            data['children_profiles'] = []
-        
-        # Результаты тестов
-        try:
-            cur.execute(f"""
-                SELECT tr.*, fm.name as child_name
-                FROM {SCHEMA}.test_results tr
-                JOIN {SCHEMA}.family_members fm ON tr.child_member_id = fm.id
-                WHERE fm.family_id = {family_id}
-                ORDER BY tr.date DESC
-            """)
-            data['test_results'] = [dict(row) for row in cur.fetchall()]
-        except Exception:
-            data['test_results'] = []
-        
-        # Календарные события
-        try:
-            cur.execute(f"""
-                SELECT * FROM {SCHEMA}.calendar_events 
-                WHERE family_id = {family_id}
-                ORDER BY date DESC
-                LIMIT 100
-            """)
-            data['calendar_events'] = [dict(row) for row in cur.fetchall()]
-        except Exception:
-            data['calendar_events'] = []
-        
-        # Семейные ценности
-        try:
-            cur.execute(f"""
-                SELECT * FROM {SCHEMA}.family_values 
-                WHERE family_id = {family_id}
-            """)
-            data['family_values'] = [dict(row) for row in cur.fetchall()]
-        except Exception:
-            data['family_values'] = []
-        
-        # Традиции
-        try:
-            cur.execute(f"""
-                SELECT * FROM {SCHEMA}.traditions 
-                WHERE family_id = {family_id}
-            """)
-            data['traditions'] = [dict(row) for row in cur.fetchall()]
-        except Exception:
-            data['traditions'] = []
-        
-        # Блог
-        try:
-            cur.execute(f"""
-                SELECT bp.*, fm.name as author_name
-                FROM {SCHEMA}.blog_posts bp
-                LEFT JOIN {SCHEMA}.family_members fm ON bp.author_id = fm.id
-                WHERE bp.family_id = {family_id}
-                ORDER BY bp.created_at DESC
-                LIMIT 50
-            """)
-            data['blog_posts'] = [dict(row) for row in cur.fetchall()]
-        except Exception:
-            data['blog_posts'] = []
-        
-        # Альбом
-        try:
-            cur.execute(f"""
-                SELECT fa.*, fm.name as uploaded_by_name
-                FROM {SCHEMA}.family_album fa
-                LEFT JOIN {SCHEMA}.family_members fm ON fa.uploaded_by = fm.id
-                WHERE fa.family_id = {family_id}
-                ORDER BY fa.created_at DESC
-                LIMIT 100
-            """)
-            data['family_album'] = [dict(row) for row in cur.fetchall()]
-        except Exception:
-            data['family_album'] = []
-        
-        # Генеалогическое древо
-        try:
-            cur.execute(f"""
-                SELECT * FROM {SCHEMA}.family_tree 
-                WHERE family_id = {family_id}
-            """)
-            data['family_tree'] = [dict(row) for row in cur.fetchall()]
-        except Exception:
-            data['family_tree'] = []
-        
-        # Чат (последние 100 сообщений)
-        try:
-            cur.execute(f"""
-                SELECT cm.*, fm.name as sender_name, fm.avatar as sender_avatar
-                FROM {SCHEMA}.chat_messages cm
-                LEFT JOIN {SCHEMA}.family_members fm ON cm.sender_id = fm.id
-                WHERE cm.family_id = {family_id}
-                ORDER BY cm.created_at DESC
-                LIMIT 100
-            """)
-            data['chat_messages'] = [dict(row) for row in cur.fetchall()]
-        except Exception:
-            data['chat_messages'] = []
-        
-        return data
+        cur.execute("SELECT NOW()::timestamp AS now")
+        server_time = cur.fetchone()['now'].isoformat()
+
+        prev_versions = token['v'] if token else {}
+        since_time = token['t'] if token else None
+        versions = _collection_versions(cur, fid, since_time)
+
+        data: Dict[str, list] = {}
+        ids: Dict[str, list] = {}
+        unchanged: List[str] = []
+
+        for coll in SYNC_COLLECTIONS:
+            name = coll['name']
+            current = versions.get(name)
+            prev = prev_versions.get(name)
+
+            if token and current and prev and prev == [current['version'], current['count']]:
+                unchanged.append(name)
+                continue
+
+            try:
+                if token and current and prev:
+                    change_since = (datetime.fromisoformat(since_time) - timedelta(seconds=SYNC_OVERLAP_SECONDS)).isoformat()
+                    cur.execute(_collection_query(
+                        coll, fid, extra_where=f"AND {_change_expr(coll)} > {escape_string(change_since)}::timestamp"
+                    ))
+                    data[name] = [dict(row) for row in cur.fetchall()]
+                    # Были удаления: текущее число строк меньше прошлого + созданных после since
+                    if current['count'] < int(prev[1]) + current['inserted']:
+                        cur.execute(_collection_query(coll, fid, select=f"{coll['alias']}.id"))
+                        ids[name] = [row['id'] for row in cur.fetchall()]
+                else:
+                    cur.execute(_collection_query(coll, fid))
+                    data[name] = [dict(row) for row in cur.fetchall()]
+            except Exception:
+                data[name] = []
+
+        vector = {name: [v['version'], v['count']] for name, v in versions.items()}
+        result = {
+            'data': data,
+            'delta': bool(token),
+            'sync_token': encode_sync_token(server_time, vector),
+            'versions': {name: {'version': v['version'], 'count': v['count']} for name, v in versions.items()},
+        }
+        if token:
+            result['ids'] = ids
+            result['unchanged'] = unchanged
+        return result
     finally:
         cur.close()
         conn.close()
@@ -402,13 +489,13 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                     'isBase64Encoded': False
                 }
             
-            # По умолчанию - данные семьи
+            # По умолчанию - данные семьи (since=<sync_token> — только изменения)
             else:
-                data = get_family_data(family_id)
+                sync = get_family_data(family_id, query_params.get('since'))
                 return {
                     'statusCode': 200,
                     'headers': headers,
-                    'body': json.dumps({'success': True, 'data': data}),
+                    'body': json.dumps({'success': True, **sync}, default=str),
                     'isBase64Encoded': False
                 }
         
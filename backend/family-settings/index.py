@@ -11,6 +11,8 @@ import psycopg2
 from psycopg2.extras import RealDictCursor
 import boto3
 
+from s3_limit_utils import record_s3_object
+
 DATABASE_URL = os.environ.get('DATABASE_URL')
 SCHEMA = 't_p5815085_family_assistant_pro'
 
@@ -83,6 +85,8 @@ def upload_image_to_s3(image_base64: str, folder: str, family_id: str) -> str:
             Body=image_data,
             ContentType=content_type
         )
+        record_s3_object(None, SCHEMA, file_key, len(image_data), family_id=family_id,
+                         content_type=content_type, source='family-settings')
         
         cdn_url = f"https://cdn.poehali.dev/projects/{os.environ['AWS_ACCESS_KEY_ID']}/bucket/{file_key}"
         return cdn_url
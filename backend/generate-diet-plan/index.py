@@ -2,6 +2,10 @@
 Генерация персонального плана питания через YandexGPT (асинхронный режим).
 Два действия: start — запускает генерацию, check — проверяет результат.
 Списание с семейного кошелька при каждой генерации.
+
+Запущенные операции учитываются в ai_jobs: check читает локальную строку,
+в YandexGPT ходит не чаще окна backoff (next_poll_at), результат разбирается
+и план сохраняется ровно один раз — тем, кто перевёл задание в done.
 """
 
 import json
@@ -11,6 +15,7 @@ import psycopg2
 from typing import Dict, Any, Optional
 
 from ai_credits_utils import check_and_spend_ai_credits
+from s3_limit_utils import record_s3_object
 
 
 CORS = {
@@ -34,6 +39,23 @@ DIET_PRICES_BY_DAYS = {
     30: 49,
 }
 
+SCHEMA = 't_p5815085_family_assistant_pro'
+AI_JOBS_TABLE = 't_p5815085_family_assistant_pro.ai_jobs'
+
+# Тип задания в ai_jobs по действию запуска
+JOB_KIND_BY_ACTION = {
+    'start': 'plan',
+    'recipe': 'recipe',
+    'generate_photo': 'photo',
+    'greeting_photo': 'photo',
+    'recipe_from_products': 'products',
+}
+
+# Опрос operation.api: первый через BASE секунд, далее окно растёт в FACTOR раз до MAX
+JOB_BACKOFF_BASE_SECONDS = 2
+JOB_BACKOFF_FACTOR = 1.6
+JOB_BACKOFF_MAX_SECONDS = 20
+
 
 def calc_diet_price(duration_days: int) -> int:
     try:
@@ -249,6 +271,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     price = PRICES.get(action)
     if action == 'start':
         price = calc_diet_price(body.get('duration_days', 7))
+    user_id, family_id = None, None
     if price:
         user_id, family_id = get_user_and_family(event)
         if not user_id:
@@ -271,15 +294,228 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         print(f"[wallet] Charged {price} rub for {action}, new balance: {spend_result.get('new_balance')}")
 
     if action == 'recipe':
-        return handle_recipe_start(api_key, folder_id, body)
-    if action == 'generate_photo':
-        return handle_photo_start(api_key, folder_id, body)
-    if action == 'greeting_photo':
-        return handle_greeting_start(api_key, folder_id, body)
-    if action == 'recipe_from_products':
-        return handle_products_start(api_key, folder_id, body)
+        resp = handle_recipe_start(api_key, folder_id, body)
+    elif action == 'generate_photo':
+        resp = handle_photo_start(api_key, folder_id, body)
+    elif action == 'greeting_photo':
+        resp = handle_greeting_start(api_key, folder_id, body)
+    elif action == 'recipe_from_products':
+        resp = handle_products_start(api_key, folder_id, body)
+    else:
+        resp = handle_start(api_key, folder_id, body)
+
+    return register_job(resp, JOB_KIND_BY_ACTION.get(action, 'plan'), user_id, family_id, body)
+
+
+def job_backoff_seconds(poll_count: int) -> float:
+    return min(JOB_BACKOFF_MAX_SECONDS, JOB_BACKOFF_BASE_SECONDS * JOB_BACKOFF_FACTOR ** max(0, poll_count - 1))
+
+
+def register_job(resp: Dict[str, Any], kind: str, user_id, family_id, body: Dict) -> Dict[str, Any]:
+    """Записывает запущенную операцию в ai_jobs. Ответ start-обработчика не меняется; ошибка записи не мешает."""
+    if resp.get('statusCode') != 200:
+        return resp
+    try:
+        operation_id = json.loads(resp['body']).get('operationId')
+        if not operation_id:
+            return resp
+        request = {}
+        if kind == 'plan':
+            request = {
+                'duration_days': body.get('duration_days', 7),
+                'quizData': body.get('quizData') or {},
+                'programData': body.get('programData') or {},
+            }
+        conn = get_db()
+        try:
+            cur = conn.cursor()
+            cur.execute(
+                f"INSERT INTO {AI_JOBS_TABLE} "
+                "(operation_id, kind, user_id, family_id, request, next_poll_at) "
+                "VALUES (%s, %s, %s, %s, %s, NOW() + %s * INTERVAL '1 second') "
+                "ON CONFLICT (operation_id) DO NOTHING",
+                (
+                    operation_id,
+                    kind,
+                    str(user_id) if user_id else None,
+                    str(family_id) if family_id else None,
+                    json.dumps(request, ensure_ascii=False),
+                    JOB_BACKOFF_BASE_SECONDS,
+                )
+            )
+            conn.commit()
+        finally:
+            conn.close()
+    except Exception as e:
+        print(f"[ai_jobs] register error: {type(e).__name__}: {e}")
+    return resp
+
+
+def load_job(operation_id: str) -> Optional[Dict[str, Any]]:
+    try:
+        conn = get_db()
+        try:
+            cur = conn.cursor()
+            cur.execute(
+                f"SELECT kind, user_id, family_id, request, status, result, poll_count, "
+                f"GREATEST(0, EXTRACT(EPOCH FROM (next_poll_at - NOW())) * 1000)::int "
+                f"FROM {AI_JOBS_TABLE} WHERE operation_id = %s",
+                (operation_id,)
+            )
+            row = cur.fetchone()
+        finally:
+            conn.close()
+    except Exception as e:
+        print(f"[ai_jobs] load error: {type(e).__name__}: {e}")
+        return None
+    if not row:
+        return None
+    return {
+        'kind': row[0], 'user_id': row[1], 'family_id': row[2], 'request': row[3] or {},
+        'status': row[4], 'result': row[5], 'poll_count': row[6], 'retry_after_ms': row[7],
+    }
+
+
+def claim_job_poll(operation_id: str) -> Optional[int]:
+    """Право сходить в operation.api: одно на окно backoff. Возвращает номер опроса или None."""
+    conn = get_db()
+    try:
+        cur = conn.cursor()
+        cur.execute(
+            f"UPDATE {AI_JOBS_TABLE} SET poll_count = poll_count + 1, "
+            f"next_poll_at = NOW() + LEAST(%s, %s * POWER(%s, poll_count))::float8 * INTERVAL '1 second', "
+            f"updated_at = NOW() "
+            f"WHERE operation_id = %s AND status = 'processing' AND next_poll_at <= NOW() "
+            f"RETURNING poll_count",
+            (JOB_BACKOFF_MAX_SECONDS, JOB_BACKOFF_BASE_SECONDS, JOB_BACKOFF_FACTOR, operation_id)
+        )
+        row = cur.fetchone()
+        conn.commit()
+        return row[0] if row else None
+    finally:
+        conn.close()
+
+
+def complete_job(operation_id: str, status: str, payload: Dict[str, Any]) -> bool:
+    """processing → done/error с готовым ответом. True — этот вызов завершил задание (и только он сохраняет план)."""
+    conn = get_db()
+    try:
+        cur = conn.cursor()
+        cur.execute(
+            f"UPDATE {AI_JOBS_TABLE} SET status = %s, result = %s, completed_at = NOW(), updated_at = NOW() "
+            f"WHERE operation_id = %s AND status = 'processing' RETURNING operation_id",
+            (status, json.dumps(payload, ensure_ascii=False), operation_id)
+        )
+        won = cur.fetchone() is not None
+        conn.commit()
+        return won
+    finally:
+        conn.close()
+
+
+def update_job_result(operation_id: str, payload: Dict[str, Any], plan_id: Optional[str]) -> None:
+    try:
+        conn = get_db()
+        try:
+            cur = conn.cursor()
+            cur.execute(
+                f"UPDATE {AI_JOBS_TABLE} SET result = %s, plan_id = %s, updated_at = NOW() WHERE operation_id = %s",
+                (json.dumps(payload, ensure_ascii=False), plan_id, operation_id)
+            )
+            conn.commit()
+        finally:
+            conn.close()
+    except Exception as e:
+        print(f"[ai_jobs] result update error: {type(e).__name__}: {e}")
+
+
+def fetch_operation(api_key: str, operation_id: str):
+    url = f'https://operation.api.cloud.yandex.net/operations/{operation_id}'
+    headers = {'Authorization': f'Api-Key {api_key}'}
+    return requests.get(url, headers=headers, timeout=25)
+
+
+def check_job(api_key: str, body: Dict, kind: str, event: Optional[Dict] = None) -> Dict[str, Any]:
+    """
+    Общая проверка операции. Есть строка в ai_jobs — ответ из неё, в operation.api
+    идёт только владелец окна backoff. Нет строки (операция запущена до ai_jobs) — прямой опрос.
+    """
+    operation_id = body.get('operationId', '')
+    if not operation_id:
+        return respond(400, {'error': 'operationId не передан'})
+
+    job = load_job(operation_id)
+    if job:
+        if job['status'] != 'processing':
+            return respond(200, job['result'] or {'success': False, 'status': 'error', 'error': 'Пустой результат'})
+        try:
+            poll_count = claim_job_poll(operation_id)
+        except Exception as e:
+            print(f"[ai_jobs] claim error: {type(e).__name__}: {e}")
+            poll_count = None
+        if poll_count is None:
+            return respond(200, {
+                'success': True,
+                'status': 'processing',
+                'retryAfterMs': max(job['retry_after_ms'] or 0, 500),
+            })
+        if kind == 'plan':
+            body = {**body, **job['request']}
+
+    if kind == 'photo':
+        api_key = os.environ.get('YANDEX_ART_API_KEY', api_key)
+
+    print(f"[generate-diet-plan] Checking operation: {operation_id} kind={kind}")
+    response = fetch_operation(api_key, operation_id)
+
+    if response.status_code != 200:
+        return respond(502, {
+            'error': 'Ошибка проверки статуса',
+            'details': response.text[:500]
+        })
 
-    return handle_start(api_key, folder_id, body)
+    result = response.json()
+    if not result.get('done', False):
+        payload = {'success': True, 'status': 'processing'}
+        if job:
+            payload['retryAfterMs'] = int(job_backoff_seconds(poll_count) * 1000)
+        return respond(200, payload)
+
+    if 'error' in result:
+        default_error = 'Ошибка генерации' if kind == 'plan' else ''
+        payload = {'success': False, 'status': 'error', 'error': result['error'].get('message', default_error)}
+    elif kind == 'plan':
+        payload = finish_plan(result, body)
+    elif kind == 'recipe':
+        payload = finish_recipe(result)
+    elif kind == 'photo':
+        payload = finish_photo(result)
+    else:
+        payload = finish_products(result)
+
+    if not job:
+        if kind == 'plan' and payload.get('plan') and event:
+            try:
+                user_id, family_id = get_user_and_family(event)
+                plan_id = save_ai_plan(user_id, family_id, payload['plan'], body, operation_id)
+                print(f"[generate-diet-plan] Saved plan id={plan_id}")
+                payload.update({'plan_id': plan_id, 'saved': bool(plan_id)})
+            except Exception as e:
+                print(f"[generate-diet-plan] save error: {e}")
+        return respond(200, payload)
+
+    # Завершает задание ровно один проверяющий — он же сохраняет план
+    if not complete_job(operation_id, payload.get('status', 'done'), payload):
+        stored = load_job(operation_id)
+        return respond(200, (stored or {}).get('result') or payload)
+
+    if kind == 'plan' and payload.get('plan'):
+        plan_id = save_ai_plan(job['user_id'], job['family_id'], payload['plan'], body, operation_id)
+        print(f"[generate-diet-plan] Saved plan id={plan_id}")
+        payload.update({'plan_id': plan_id, 'saved': bool(plan_id)})
+        update_job_result(operation_id, payload, plan_id)
+
+    return respond(200, payload)
 
 
 def handle_start(api_key: str, folder_id: str, body: Dict) -> Dict[str, Any]:
@@ -394,39 +630,10 @@ def save_ai_plan(user_id, family_id, plan: Dict, body: Dict, operation_id: str)
 
 
 def handle_check(api_key: str, body: Dict, event: Optional[Dict] = None) -> Dict[str, Any]:
-    operation_id = body.get('operationId', '')
-    if not operation_id:
-        return respond(400, {'error': 'operationId не передан'})
-
-    url = f'https://operation.api.cloud.yandex.net/operations/{operation_id}'
-    headers = {'Authorization': f'Api-Key {api_key}'}
-
-    print(f"[generate-diet-plan] Checking operation: {operation_id}")
-    response = requests.get(url, headers=headers, timeout=25)
-    print(f"[generate-diet-plan] Check status={response.status_code}")
-
-    if response.status_code != 200:
-        return respond(502, {
-            'error': 'Ошибка проверки статуса',
-            'details': response.text[:500]
-        })
-
-    result = response.json()
-    done = result.get('done', False)
+    return check_job(api_key, body, 'plan', event)
 
-    if not done:
-        return respond(200, {
-            'success': True,
-            'status': 'processing'
-        })
-
-    if 'error' in result:
-        return respond(200, {
-            'success': False,
-            'status': 'error',
-            'error': result['error'].get('message', 'Ошибка генерации')
-        })
 
+def finish_plan(result: Dict, body: Dict) -> Dict[str, Any]:
     ai_response = result.get('response', {})
     alternatives = ai_response.get('alternatives', [])
     ai_text = alternatives[0].get('message', {}).get('text', '') if alternatives else ''
@@ -436,34 +643,25 @@ def handle_check(api_key: str, body: Dict, event: Optional[Dict] = None) -> Dict
     plan = parse_plan(ai_text)
 
     if not plan:
-        return respond(200, {
+        return {
             'success': True,
             'status': 'done',
             'plan': None,
             'rawText': ai_text,
             'message': 'План сгенерирован, но не удалось разобрать JSON.'
-        })
+        }
 
     # bug31: если ИИ обрезал план — дополняем недостающие дни шаблоном
     expected_days = int(body.get('duration_days', 7))
     plan = pad_missing_days(plan, expected_days)
 
-    plan_id = None
-    if event:
-        try:
-            user_id, family_id = get_user_and_family(event)
-            plan_id = save_ai_plan(user_id, family_id, plan, body, operation_id)
-            print(f"[generate-diet-plan] Saved plan id={plan_id}")
-        except Exception as e:
-            print(f"[generate-diet-plan] save error: {e}")
-
-    return respond(200, {
+    return {
         'success': True,
         'status': 'done',
         'plan': plan,
-        'plan_id': plan_id,
-        'saved': bool(plan_id),
-    })
+        'plan_id': None,
+        'saved': False,
+    }
 
 
 def handle_recipe_start(api_key: str, folder_id: str, body: Dict) -> Dict[str, Any]:
@@ -503,28 +701,14 @@ def handle_recipe_start(api_key: str, folder_id: str, body: Dict) -> Dict[str, A
 
 
 def handle_recipe_check(api_key: str, body: Dict) -> Dict[str, Any]:
-    operation_id = body.get('operationId', '')
-    if not operation_id:
-        return respond(400, {'error': 'operationId не передан'})
-
-    url = f'https://operation.api.cloud.yandex.net/operations/{operation_id}'
-    headers = {'Authorization': f'Api-Key {api_key}'}
-    response = requests.get(url, headers=headers, timeout=25)
+    return check_job(api_key, body, 'recipe')
 
-    if response.status_code != 200:
-        return respond(502, {'error': 'Ошибка проверки'})
-
-    result = response.json()
-    if not result.get('done', False):
-        return respond(200, {'success': True, 'status': 'processing'})
-
-    if 'error' in result:
-        return respond(200, {'success': False, 'status': 'error', 'error': result['error'].get('message', '')})
 
+def finish_recipe(result: Dict) -> Dict[str, Any]:
     ai_text = result.get('response', {}).get('alternatives', [{}])[0].get('message', {}).get('text', '')
 
     recipe = parse_recipe(ai_text)
-    return respond(200, {'success': True, 'status': 'done', 'recipe': recipe})
+    return {'success': True, 'status': 'done', 'recipe': recipe}
 
 
 def parse_recipe(text: str) -> list:
@@ -585,31 +769,15 @@ def handle_photo_start(api_key: str, folder_id: str, body: Dict) -> Dict[str, An
 
 
 def handle_photo_check(api_key: str, body: Dict) -> Dict[str, Any]:
-    operation_id = body.get('operationId', '')
-    if not operation_id:
-        return respond(400, {'error': 'operationId не передан'})
+    return check_job(api_key, body, 'photo')
 
-    art_api_key = os.environ.get('YANDEX_ART_API_KEY', api_key)
-
-    url = f'https://operation.api.cloud.yandex.net/operations/{operation_id}'
-    headers = {'Authorization': f'Api-Key {art_api_key}'}
-    response = requests.get(url, headers=headers, timeout=25)
-
-    if response.status_code != 200:
-        return respond(502, {'error': 'Ошибка проверки фото'})
-
-    result = response.json()
-    if not result.get('done', False):
-        return respond(200, {'success': True, 'status': 'processing'})
-
-    if 'error' in result:
-        return respond(200, {'success': False, 'status': 'error', 'error': result['error'].get('message', '')})
 
+def finish_photo(result: Dict) -> Dict[str, Any]:
     import base64
 
     image_b64 = result.get('response', {}).get('image', '')
     if not image_b64:
-        return respond(200, {'success': False, 'status': 'error', 'error': 'Изображение не получено'})
+        return {'success': False, 'status': 'error', 'error': 'Изображение не получено'}
 
     try:
         import boto3
@@ -624,22 +792,25 @@ def handle_photo_check(api_key: str, body: Dict) -> Dict[str, Any]:
         file_hash = hashlib.md5(image_b64[:100].encode()).hexdigest()[:12]
         key = f'diet-photos/{file_hash}.png'
 
+        image_bytes = base64.b64decode(image_b64)
         s3.put_object(
             Bucket='files',
             Key=key,
-            Body=base64.b64decode(image_b64),
+            Body=image_bytes,
             ContentType='image/png'
         )
+        record_s3_object(None, SCHEMA, key, len(image_bytes), content_type='image/png',
+                         source='generate-diet-plan')
 
         cdn_url = f"https://cdn.poehali.dev/projects/{os.environ['AWS_ACCESS_KEY_ID']}/bucket/{key}"
-        return respond(200, {'success': True, 'status': 'done', 'imageUrl': cdn_url})
+        return {'success': True, 'status': 'done', 'imageUrl': cdn_url}
     except Exception as e:
         print(f"[generate-diet-plan] S3 upload error: {e}")
-        return respond(200, {
+        return {
             'success': True,
             'status': 'done',
             'imageUrl': f'data:image/png;base64,{image_b64[:100000]}'
-        })
+        }
 
 
 def handle_greeting_start(api_key: str, folder_id: str, body: Dict) -> Dict[str, Any]:
@@ -739,28 +910,14 @@ def handle_products_start(api_key: str, folder_id: str, body: Dict) -> Dict[str,
 
 
 def handle_products_check(api_key: str, body: Dict) -> Dict[str, Any]:
-    operation_id = body.get('operationId', '')
-    if not operation_id:
-        return respond(400, {'error': 'operationId не передан'})
-
-    url = f'https://operation.api.cloud.yandex.net/operations/{operation_id}'
-    headers = {'Authorization': f'Api-Key {api_key}'}
-    response = requests.get(url, headers=headers, timeout=25)
-
-    if response.status_code != 200:
-        return respond(502, {'error': 'Ошибка проверки'})
+    return check_job(api_key, body, 'products')
 
-    result = response.json()
-    if not result.get('done', False):
-        return respond(200, {'success': True, 'status': 'processing'})
-
-    if 'error' in result:
-        return respond(200, {'success': False, 'status': 'error', 'error': result['error'].get('message', '')})
 
+def finish_products(result: Dict) -> Dict[str, Any]:
     ai_text = result.get('response', {}).get('alternatives', [{}])[0].get('message', {}).get('text', '')
 
     dishes = parse_dishes(ai_text)
-    return respond(200, {'success': True, 'status': 'done', 'dishes': dishes})
+    return {'success': True, 'status': 'done', 'dishes': dishes}
 
 
 def parse_dishes(text: str) -> list:
@@ -20,9 +20,12 @@ from reportlab.pdfbase import pdfmetrics
 from reportlab.pdfbase.ttfonts import TTFont
 from reportlab.pdfbase.pdfmetrics import registerFontFamily
 
+from s3_limit_utils import record_s3_object
+
 
 SITE = 'https://nasha-semiya.ru'
 S3_KEY = 'docs/nasha-semiya-documentation.pdf'
+SCHEMA = 't_p5815085_family_assistant_pro'
 
 # Кириллические шрифты DejaVu. Скачиваются один раз и кэшируются в /tmp.
 # Несколько источников — на случай недоступности одного из них.
@@ -283,6 +286,9 @@ def handler(event: Dict[str, Any], context) -> Dict[str, Any]:
         ContentType='application/pdf',
         ContentDisposition='inline; filename="nasha-semiya-documentation.pdf"',
     )
+    # Перезапись того же ключа — реестр учтёт только разницу размеров
+    record_s3_object(None, SCHEMA, S3_KEY, len(pdf_bytes), content_type='application/pdf',
+                     source='generate-docs-pdf')
     cdn_url = f"https://cdn.poehali.dev/projects/{os.environ['AWS_ACCESS_KEY_ID']}/bucket/{S3_KEY}"
 
     return {
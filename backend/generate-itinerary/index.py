@@ -9,6 +9,8 @@ import requests
 import psycopg2
 from typing import Dict, Any
 
+from llm_cache_utils import cached_completion
+
 
 CORS = {
     'Access-Control-Allow-Origin': '*',
@@ -195,7 +197,7 @@ def handler(event: Dict[str, Any], context) -> Dict[str, Any]:
 
     # Запрос к YandexGPT API
     try:
-        response = requests.post(
+        response = cached_completion(
             'https://llm.api.cloud.yandex.net/foundationModels/v1/completion',
             headers={
                 'Authorization': f'Api-Key {api_key}',
@@ -219,7 +221,8 @@ def handler(event: Dict[str, Any], context) -> Dict[str, Any]:
                     }
                 ]
             },
-            timeout=60
+            timeout=60,
+            function_name='generate_itinerary'
         )
         
         if response.status_code != 200:
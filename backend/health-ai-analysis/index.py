@@ -6,6 +6,10 @@ import psycopg2
 from datetime import datetime
 
 from ai_credits_utils import check_and_spend_ai_credits
+from llm_cache_utils import cached_completion
+
+# Подсказка «пересними документ» не зависит от пользователя — её можно кэшировать надолго
+FALLBACK_HINT_CACHE_TTL_SECONDS = 7 * 24 * 3600
 
 
 CORS = {
@@ -226,14 +230,16 @@ def handler(event: dict, context) -> dict:
         }
         
         try:
-            fallback_response = requests.post(
+            fallback_response = cached_completion(
                 'https://llm.api.cloud.yandex.net/foundationModels/v1/completion',
                 headers={
                     'Authorization': f'Api-Key {gpt_api_key}',
                     'Content-Type': 'application/json'
                 },
                 json=fallback_payload,
-                timeout=30
+                timeout=30,
+                function_name='health_ai_analysis',
+                ttl_seconds=FALLBACK_HINT_CACHE_TTL_SECONDS
             )
             
             if fallback_response.status_code == 200:
@@ -288,14 +294,15 @@ def handler(event: dict, context) -> dict:
         ]
     }
     
-    yandex_response = requests.post(
+    yandex_response = cached_completion(
         'https://llm.api.cloud.yandex.net/foundationModels/v1/completion',
         headers={
             'Authorization': f'Api-Key {gpt_api_key}',
             'Content-Type': 'application/json'
         },
         json=yandex_payload,
-        timeout=30
+        timeout=30,
+        function_name='health_ai_analysis'
     )
     
     print(f'[DEBUG] YandexGPT response status: {yandex_response.status_code}')
@@ -0,0 +1,208 @@
+"""
+Общий клиент YandexGPT с кэшем ответов — используется AI-функциями вместо прямого requests.post.
+Вызов — как requests.post, плюс имя функции для TTL и статистики:
+    cached_completion(YANDEX_GPT_URL, headers=headers, json=payload, timeout=30, function_name='leisure_ai')
+Возвращает объект с .status_code / .text / .json() / .from_cache (как requests.Response).
+
+Принципы:
+- Ключ кэша: (modelUri, checksum системного промпта, остальные messages, temperature, maxTokens).
+- TTL и допустимость кэша задаются на функцию в LLM_CACHE_TTL_SECONDS. 0 — не кэшировать
+  (персональные данные в промпте: чат ассистента, здоровье, конфликты).
+- Кэшируются только успешные ответы (HTTP 200 с alternatives).
+- Одинаковые параллельные запросы склеиваются через pg_advisory_lock по ключу:
+  первый идёт в YandexGPT, остальные ждут и получают его ответ из кэша.
+- Кэш мягкий: если БД недоступна — запрос просто уходит в YandexGPT.
+"""
+import os
+import json
+import hashlib
+import logging
+from datetime import datetime, timedelta
+from typing import Optional
+
+import requests
+
+logger = logging.getLogger(__name__)
+
+DATABASE_URL = os.environ.get('DATABASE_URL')
+SCHEMA = 't_p5815085_family_assistant_pro'
+YANDEX_GPT_URL = 'https://llm.api.cloud.yandex.net/foundationModels/v1/completion'
+
+# TTL кэша по функциям (секунды). Нет в списке / 0 — кэш выключен.
+LLM_CACHE_TTL_SECONDS = {
+    'ai_assistant':        0,
+    'conflict_ai':         0,
+    'health_ai_analysis':  0,
+    'event_ai_ideas':      7 * 24 * 3600,
+    'leisure_ai':          24 * 3600,
+    'generate_itinerary':  24 * 3600,
+    'trips_ai_recommend':  24 * 3600,
+}
+
+# Сколько ждать чужой идентичный запрос, прежде чем идти в YandexGPT самостоятельно
+COALESCE_WAIT_MS = 35000
+
+# Статистика в пределах тёплого инстанса функции
+_STATS = {'hits': 0, 'misses': 0, 'coalesced': 0, 'bypass': 0, 'errors': 0}
+
+
+class CachedResponse:
+    """Ответ из кэша с интерфейсом requests.Response"""
+
+    def __init__(self, text: str):
+        self.status_code = 200
+        self.text = text
+        self.from_cache = True
+
+    def json(self):
+        return json.loads(self.text)
+
+
+def cache_key(payload: dict) -> str:
+    messages = payload.get('messages') or []
+    system_text = ''.join(m.get('text', '') for m in messages if m.get('role') == 'system')
+    options = payload.get('completionOptions') or {}
+    key_source = json.dumps({
+        'model': payload.get('modelUri'),
+        'system': hashlib.sha256(system_text.encode('utf-8')).hexdigest(),
+        'messages': [m for m in messages if m.get('role') != 'system'],
+        'temperature': options.get('temperature'),
+        'max_tokens': options.get('maxTokens'),
+    }, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(key_source.encode('utf-8')).hexdigest()
+
+
+def _lock_id(key: str) -> int:
+    # pg_advisory_lock принимает bigint
+    return int(key[:15], 16)
+
+
+def _lookup(cur, key: str) -> Optional[str]:
+    cur.execute(
+        f"UPDATE {SCHEMA}.llm_response_cache SET hit_count = hit_count + 1, last_hit_at = NOW() "
+        f"WHERE cache_key = %s AND expires_at > NOW() RETURNING response_text",
+        (key,)
+    )
+    row = cur.fetchone()
+    return row[0] if row else None
+
+
+def _store(cur, key: str, function_name: str, payload: dict, text: str, ttl: int) -> None:
+    cur.execute(
+        f"""
+        INSERT INTO {SCHEMA}.llm_response_cache
+            (cache_key, function_name, model_uri, response_text, expires_at, miss_count)
+        VALUES (%s, %s, %s, %s, %s, 1)
+        ON CONFLICT (cache_key) DO UPDATE SET
+            response_text = EXCLUDED.response_text,
+            expires_at = EXCLUDED.expires_at,
+            created_at = NOW(),
+            miss_count = {SCHEMA}.llm_response_cache.miss_count + 1
+        """,
+        (key, function_name, payload.get('modelUri'), text, datetime.now() + timedelta(seconds=ttl))
+    )
+
+
+def _is_cacheable(response) -> bool:
+    if response.status_code != 200:
+        return False
+    try:
+        return bool(response.json().get('result', {}).get('alternatives'))
+    except Exception:
+        return False
+
+
+def cached_completion(url: str = YANDEX_GPT_URL, headers: Optional[dict] = None,
+                      json: Optional[dict] = None, timeout: int = 30,
+                      function_name: str = '', ttl_seconds: Optional[int] = None):
+    """
+    POST в YandexGPT completion с кэшем и склейкой одинаковых запросов.
+    Исключения requests (таймауты и т.п.) пробрасываются как при прямом вызове.
+    """
+    payload = json or {}
+    ttl = LLM_CACHE_TTL_SECONDS.get(function_name, 0) if ttl_seconds is None else ttl_seconds
+    if ttl <= 0 or payload.get('completionOptions', {}).get('stream'):
+        _STATS['bypass'] += 1
+        response = requests.post(url, headers=headers, json=payload, timeout=timeout)
+        response.from_cache = False
+        return response
+
+    key = cache_key(payload)
+    conn = None
+    locked = False
+    try:
+        import psycopg2
+        conn = psycopg2.connect(DATABASE_URL)
+        conn.autocommit = True
+        cur = conn.cursor()
+        cached = _lookup(cur, key)
+        if cached is not None:
+            _STATS['hits'] += 1
+            return CachedResponse(cached)
+
+        # Склейка: ждём, пока идентичный запрос в другом инстансе допишет кэш
+        cur.execute(f"SET lock_timeout = {int(COALESCE_WAIT_MS)}")
+        cur.execute("SELECT pg_advisory_lock(%s)", (_lock_id(key),))
+        locked = True
+        cached = _lookup(cur, key)
+        if cached is not None:
+            _STATS['coalesced'] += 1
+            return CachedResponse(cached)
+    except Exception as e:
+        logger.warning(f'llm cache lookup failed: {e}')
+        _STATS['errors'] += 1
+
+    try:
+        _STATS['misses'] += 1
+        response = requests.post(url, headers=headers, json=payload, timeout=timeout)
+        response.from_cache = False
+        if conn is not None and _is_cacheable(response):
+            try:
+                _store(conn.cursor(), key, function_name, payload, response.text, ttl)
+            except Exception as e:
+                logger.warning(f'llm cache store failed: {e}')
+                _STATS['errors'] += 1
+        return response
+    finally:
+        if conn is not None:
+            try:
+                if locked:
+                    conn.cursor().execute("SELECT pg_advisory_unlock(%s)", (_lock_id(key),))
+                conn.close()
+            except Exception:
+                pass
+
+
+def get_llm_cache_stats(conn=None) -> dict:
+    """
+    Hit-rate кэша: in-process счётчики + накопленные в БД по функциям
+    (hits / misses / hit_rate / entries).
+    """
+    local = dict(_STATS)
+    served = local['hits'] + local['coalesced'] + local['misses']
+    local['hit_rate'] = round((local['hits'] + local['coalesced']) / served, 4) if served else 0.0
+
+    by_function = {}
+    own_conn = conn is None
+    try:
+        import psycopg2
+        if own_conn:
+            conn = psycopg2.connect(DATABASE_URL)
+        cur = conn.cursor()
+        cur.execute(
+            f"SELECT function_name, COALESCE(SUM(hit_count), 0), COALESCE(SUM(miss_count), 0), COUNT(*) "
+            f"FROM {SCHEMA}.llm_response_cache GROUP BY function_name"
+        )
+        for fn, hits, misses, entries in cur.fetchall():
+            total = int(hits) + int(misses)
+            by_function[fn] = {
+                'hits': int(hits), 'misses': int(misses), 'entries': int(entries),
+                'hit_rate': round(int(hits) / total, 4) if total else 0.0,
+            }
+    except Exception as e:
+        logger.warning(f'llm cache stats failed: {e}')
+    finally:
+        if own_conn and conn is not None:
+            conn.close()
+
+    return {'instance': local, 'by_function': by_function}
@@ -3,14 +3,21 @@
 - Hero мобильный: 949x2000 JPEG 370КБ → WebP 357x752 (размер контейнера × 2x для Retina)
 - Логотип: 768x768 JPG 145КБ → WebP 128x128 (63px × 2x для Retina)
 Результат загружается в S3 с новыми ключами, URL возвращается в ответе.
+
+Превью пользовательских фото (очередь image_derivatives, см. image_derivative_utils):
+POST /?action=process — обработать пачку задач из очереди (вызывается функциями загрузки и по cron)
+GET  /?action=lookup&url=<url>[&url=...] — готовые превью по исходным URL
 """
 import os
 import io
 import json
 import boto3
 import requests
+import psycopg2
 from PIL import Image
 
+from image_derivative_utils import derivative_key, is_project_url
+
 
 HERO_URL = "https://cdn.poehali.dev/projects/bf14db2d-0cf1-4b4d-9257-4d617ffc1cc6/bucket/a56446e2-ef59-4c50-aecf-9ed9fb67b67c.jpeg"
 LOGO_URL = "https://cdn.poehali.dev/projects/bf14db2d-0cf1-4b4d-9257-4d617ffc1cc6/bucket/90f87bac-e708-4551-b2dc-061dd3d7b0ed.JPG"
@@ -34,9 +41,131 @@ def optimize_image(url: str, max_width: int, max_height: int, quality: int = 82)
     buf.seek(0)
     return buf.read(), f"{img.width}x{img.height}"
 
+SCHEMA = 't_p5815085_family_assistant_pro'
+
+# Сколько задач очереди обрабатывает один вызов action=process
+PROCESS_BATCH_SIZE = 5
+# Задача в processing дольше этого — упавший воркер, забираем заново
+PROCESSING_STALE_MINUTES = 10
+MAX_ATTEMPTS = 3
+LOOKUP_MAX_URLS = 100
+
+
+def build_derivatives(s3, project_id: str, source_url: str, widths: list) -> dict:
+    """Скачивает исходник один раз и кладёт WebP каждой ширины по детерминированному ключу."""
+    # Очередь пишут другие функции — качаем только из бакета проекта и без редиректов
+    if not is_project_url(source_url):
+        raise ValueError('source_url is not in the project bucket')
+    resp = requests.get(source_url, timeout=30, allow_redirects=False)
+    resp.raise_for_status()
+    original = Image.open(io.BytesIO(resp.content)).convert("RGB")
+    variants = {}
+    for width in sorted(int(w) for w in widths):
+        img = original.copy()
+        # Не увеличиваем: для узких исходников превью = исходная ширина
+        img.thumbnail((min(width, original.width), original.height * 4), Image.LANCZOS)
+        buf = io.BytesIO()
+        img.save(buf, format="WEBP", quality=80, method=4)
+        key = derivative_key(source_url, width)
+        s3.put_object(Bucket='files', Key=key, Body=buf.getvalue(), ContentType='image/webp',
+                      CacheControl='public, max-age=31536000, immutable')
+        variants[str(width)] = f"https://cdn.poehali.dev/projects/{project_id}/bucket/{key}"
+    return variants
+
+
+def process_queue(limit: int = PROCESS_BATCH_SIZE) -> dict:
+    """Забирает пачку задач (SKIP LOCKED — параллельные вызовы не пересекаются) и строит превью."""
+    conn = psycopg2.connect(os.environ['DATABASE_URL'])
+    cur = conn.cursor()
+    cur.execute(f"""
+        UPDATE {SCHEMA}.image_derivatives SET status = 'processing', attempts = attempts + 1, updated_at = NOW()
+        WHERE source_url IN (
+            SELECT source_url FROM {SCHEMA}.image_derivatives
+            WHERE status = 'pending'
+               OR (status = 'processing' AND updated_at < NOW() - INTERVAL '{PROCESSING_STALE_MINUTES} minutes')
+            ORDER BY created_at
+            LIMIT {int(limit)}
+            FOR UPDATE SKIP LOCKED
+        )
+        RETURNING source_url, widths, attempts
+    """)
+    jobs = cur.fetchall()
+    conn.commit()
+
+    s3 = get_s3() if jobs else None
+    project_id = os.environ.get('AWS_ACCESS_KEY_ID', '')
+    done, failed = 0, 0
+    for source_url, widths, attempts in jobs:
+        try:
+            variants = build_derivatives(s3, project_id, source_url, widths or [])
+            cur.execute(f"""
+                UPDATE {SCHEMA}.image_derivatives
+                SET status = 'done', variants = %s::jsonb, last_error = NULL, updated_at = NOW()
+                WHERE source_url = %s
+            """, (json.dumps(variants), source_url))
+            done += 1
+        except Exception as e:
+            print(f"[image-optimizer] derivative failed {source_url}: {e}")
+            cur.execute(f"""
+                UPDATE {SCHEMA}.image_derivatives
+                SET status = %s, last_error = %s, updated_at = NOW()
+                WHERE source_url = %s
+            """, ('failed' if attempts >= MAX_ATTEMPTS or not is_project_url(source_url) else 'pending', str(e)[:500], source_url))
+            failed += 1
+        conn.commit()
+
+    cur.execute(f"SELECT COUNT(*) FROM {SCHEMA}.image_derivatives WHERE status = 'pending'")
+    pending = cur.fetchone()[0]
+    cur.close()
+    conn.close()
+    return {'processed': len(jobs), 'done': done, 'failed': failed, 'pending': pending}
+
+
+def lookup_derivatives(urls: list) -> dict:
+    """{source_url: {status, variants}} — для URL без задачи в очереди записи нет."""
+    if not urls:
+        return {}
+    conn = psycopg2.connect(os.environ['DATABASE_URL'])
+    cur = conn.cursor()
+    cur.execute(
+        f"SELECT source_url, status, variants FROM {SCHEMA}.image_derivatives WHERE source_url = ANY(%s)",
+        (urls,)
+    )
+    result = {row[0]: {'status': row[1], 'variants': row[2] or {}} for row in cur.fetchall()}
+    cur.close()
+    conn.close()
+    return result
+
+
 def handler(event: dict, context) -> dict:
+    cors = {'Access-Control-Allow-Origin': '*', 'Access-Control-Allow-Methods': 'GET, POST, OPTIONS', 'Access-Control-Allow-Headers': 'Content-Type'}
     if event.get('httpMethod') == 'OPTIONS':
-        return {'statusCode': 200, 'headers': {'Access-Control-Allow-Origin': '*', 'Access-Control-Allow-Methods': 'POST, OPTIONS', 'Access-Control-Allow-Headers': 'Content-Type'}, 'body': ''}
+        return {'statusCode': 200, 'headers': cors, 'body': ''}
+
+    params = event.get('queryStringParameters') or {}
+    action = params.get('action')
+
+    if action == 'process':
+        return {
+            'statusCode': 200,
+            'headers': {**cors, 'Content-Type': 'application/json'},
+            'body': json.dumps({'success': True, **process_queue()}),
+        }
+
+    if action == 'lookup':
+        multi = event.get('multiValueQueryStringParameters') or {}
+        urls = multi.get('url') or ([params['url']] if params.get('url') else [])
+        if not urls:
+            return {
+                'statusCode': 400,
+                'headers': {**cors, 'Content-Type': 'application/json'},
+                'body': json.dumps({'error': 'url required'}),
+            }
+        return {
+            'statusCode': 200,
+            'headers': {**cors, 'Content-Type': 'application/json'},
+            'body': json.dumps({'derivatives': lookup_derivatives(urls[:LOOKUP_MAX_URLS])}, ensure_ascii=False),
+        }
 
     s3 = get_s3()
     project_id = os.environ['AWS_ACCESS_KEY_ID']
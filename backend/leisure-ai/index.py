@@ -5,6 +5,7 @@ import psycopg2
 from typing import Optional
 
 from ai_credits_utils import check_and_spend_ai_credits
+from llm_cache_utils import cached_completion
 
 
 def get_db():
@@ -248,7 +249,7 @@ def handle_recommend(body: dict, headers: dict) -> dict:
         }
     
     try:
-        response = requests.post(
+        response = cached_completion(
             'https://llm.api.cloud.yandex.net/foundationModels/v1/completion',
             headers={
                 'Authorization': f'Api-Key {yandex_api_key}',
@@ -268,7 +269,8 @@ def handle_recommend(body: dict, headers: dict) -> dict:
                     }
                 ]
             },
-            timeout=30
+            timeout=30,
+            function_name='leisure_ai'
         )
         
         if response.status_code != 200:
@@ -514,7 +516,7 @@ def handle_search_restaurants(body: dict, headers: dict) -> dict:
 [{{"name": "название", "address": "город, улица, дом", "cuisine": "тип кухни", "priceRange": "1000-2000₽", "description": "описание"}}]"""
 
     try:
-        response = requests.post(
+        response = cached_completion(
             'https://llm.api.cloud.yandex.net/foundationModels/v1/completion',
             headers={
                 'Authorization': f'Api-Key {yandex_api_key}',
@@ -534,7 +536,8 @@ def handle_search_restaurants(body: dict, headers: dict) -> dict:
                     }
                 ]
             },
-            timeout=30
+            timeout=30,
+            function_name='leisure_ai'
         )
         
         if response.status_code != 200:
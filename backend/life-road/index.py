@@ -8,6 +8,7 @@ import boto3
 import requests
 
 from ai_credits_utils import check_and_spend_ai_credits
+from s3_limit_utils import record_s3_object
 
 DATABASE_URL = os.environ.get('DATABASE_URL', '')
 SCHEMA = 't_p5815085_family_assistant_pro'
@@ -1403,6 +1404,8 @@ def _handle_photo(method, family_id, event):
     safe_name = filename.replace('/', '_').replace('\\', '_')
     key = f'life-road/{family_id}/{safe_name}'
     s3.put_object(Bucket='files', Key=key, Body=data, ContentType=body.get('contentType', 'image/jpeg'))
+    record_s3_object(None, SCHEMA, key, len(data), family_id=family_id,
+                     content_type=body.get('contentType', 'image/jpeg'), source='life-road')
     cdn_url = f"https://cdn.poehali.dev/projects/{os.environ['AWS_ACCESS_KEY_ID']}/bucket/{key}"
     return _resp(200, {'url': cdn_url})
 
@@ -16,6 +16,8 @@ import boto3
 import time
 
 from blog_parser import parse_max_post, make_slug
+from blog_render_cache_utils import invalidate_blog_render
+from s3_limit_utils import record_s3_object
 
 MAX_BOT_TOKEN = os.environ.get('MAX_BOT_TOKEN')
 MAX_API_BASE = 'https://platform-api.max.ru'
@@ -248,6 +250,7 @@ def save_post_to_blog(parsed: Dict, source: str = 'max') -> Optional[int]:
         conn.commit()
         cur.close()
         conn.close()
+        invalidate_blog_render()
         return post_id
     except Exception as e:
         print(f"[ERROR] save_post_to_blog: {e}")
@@ -273,6 +276,7 @@ def upload_image_to_s3(image_url: str, post_id_hint: str = '') -> Optional[str]:
         s3 = boto3.client('s3', endpoint_url='https://bucket.poehali.dev',
                           aws_access_key_id=aws_key, aws_secret_access_key=aws_secret)
         s3.put_object(Bucket='files', Key=key, Body=resp.content, ContentType=content_type)
+        record_s3_object(None, SCHEMA, key, len(resp.content), content_type=content_type, source='max-bot')
         return f'https://cdn.poehali.dev/projects/{aws_key}/bucket/{key}'
     except Exception as e:
         print(f'[WARN] upload_image_to_s3 failed: {e}')
@@ -961,6 +965,8 @@ def handler(event: Dict[str, Any], context) -> Dict[str, Any]:
         conn.commit()
         cur.close()
         conn.close()
+        if fixed:
+            invalidate_blog_render()
         return {
             'statusCode': 200,
             'headers': CORS_HEADERS,
@@ -1049,6 +1055,8 @@ def handler(event: Dict[str, Any], context) -> Dict[str, Any]:
         conn.commit()
         cur.close()
         conn.close()
+        if fixed:
+            invalidate_blog_render()
         return {
             'statusCode': 200,
             'headers': CORS_HEADERS,
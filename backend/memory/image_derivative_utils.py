@@ -0,0 +1,126 @@
+"""
+Очередь WebP-превью для загруженных фото — используется функциями загрузки
+(upload-file, upload-leisure-photo, memory) и image-optimizer.
+
+Пример использования:
+    from image_derivative_utils import enqueue_derivatives, is_image
+
+    if is_image(content_type):
+        enqueue_derivatives(file_url, family_id=family_id)
+
+Принципы:
+- Загрузка только ставит задачу в image_derivatives и «пинает» image-optimizer
+  (?action=process) фоновым HTTP-запросом; превью строит image-optimizer.
+- Ключи S3 детерминированы: derivatives/<sha256(url)[:32]>/w<ширина>.webp —
+  повторная генерация перезаписывает те же объекты.
+- Готовые URL лежат в image_derivatives.variants ({"320": url, ...}),
+  их отдают image-optimizer ?action=lookup и memory.
+- Fail-open: ошибка постановки в очередь не ломает загрузку.
+- В очередь попадают только файлы бакета проекта (is_project_url) — image-optimizer
+  скачивает исходник по URL, чужие адреса он качать не должен.
+"""
+import os
+import json
+import hashlib
+import logging
+import threading
+import urllib.request
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+DATABASE_URL = os.environ.get('DATABASE_URL')
+SCHEMA = 't_p5815085_family_assistant_pro'
+IMAGE_OPTIMIZER_URL = 'https://functions.poehali.dev/4b165674-a8a5-4559-8538-87cb26267d85'
+
+# Ширины превью (px): сетки альбомов / карточки / просмотр на весь экран
+DERIVATIVE_WIDTHS = (320, 640, 1280)
+
+IMAGE_EXTENSIONS = ('jpg', 'jpeg', 'png', 'webp', 'heic', 'heif')
+
+
+def is_image(content_type: Optional[str] = None, file_name: Optional[str] = None) -> bool:
+    """GIF не трогаем — анимация потеряется."""
+    if content_type:
+        return content_type.startswith('image/') and content_type != 'image/gif'
+    if file_name and '.' in file_name:
+        return file_name.rsplit('.', 1)[-1].lower() in IMAGE_EXTENSIONS
+    return False
+
+
+def project_url_prefix() -> str:
+    """https://cdn.poehali.dev/projects/<AWS_ACCESS_KEY_ID>/bucket/ или '' без ключа."""
+    project_id = os.environ.get('AWS_ACCESS_KEY_ID', '')
+    return f'https://cdn.poehali.dev/projects/{project_id}/bucket/' if project_id else ''
+
+
+def is_project_url(url: Optional[str]) -> bool:
+    """URL указывает на объект в бакете проекта."""
+    prefix = project_url_prefix()
+    return bool(prefix) and isinstance(url, str) and url.startswith(prefix) and len(url) > len(prefix)
+
+
+def derivative_key(source_url: str, width: int) -> str:
+    digest = hashlib.sha256(source_url.encode('utf-8')).hexdigest()[:32]
+    return f'derivatives/{digest}/w{int(width)}.webp'
+
+
+def _kick_worker() -> None:
+    try:
+        req = urllib.request.Request(
+            f'{IMAGE_OPTIMIZER_URL}?action=process',
+            data=b'{}',
+            headers={'Content-Type': 'application/json'},
+            method='POST',
+        )
+        urllib.request.urlopen(req, timeout=25).read()
+    except Exception as e:
+        logger.warning(f'image derivative worker kick failed: {e}')
+
+
+def enqueue_derivatives(source_url: str, family_id: Optional[str] = None, conn=None,
+                        schema: str = SCHEMA, kick: bool = True) -> bool:
+    """
+    Ставит фото в очередь на генерацию превью (повторная постановка — no-op).
+    conn не передан — открывается своё соединение.
+    """
+    if not source_url:
+        return False
+    if not is_project_url(source_url):
+        logger.warning(f'image derivative enqueue rejected, not a project bucket url: {source_url[:200]}')
+        return False
+    own_conn = conn is None
+    try:
+        import psycopg2
+        if own_conn:
+            conn = psycopg2.connect(DATABASE_URL)
+        cur = conn.cursor()
+        cur.execute(
+            f"INSERT INTO {schema}.image_derivatives (source_url, family_id, widths)"
+            f" VALUES (%s, %s, %s::jsonb) ON CONFLICT (source_url) DO NOTHING",
+            (source_url, family_id, json.dumps(list(DERIVATIVE_WIDTHS)))
+        )
+        queued = cur.rowcount > 0
+        conn.commit()
+        cur.close()
+    except Exception as e:
+        logger.warning(f'image derivative enqueue failed: {e}')
+        if not own_conn:
+            try:
+                conn.rollback()
+            except Exception:
+                pass
+        return False
+    finally:
+        if own_conn and conn is not None:
+            try:
+                conn.close()
+            except Exception:
+                pass
+
+    if queued and kick:
+        try:
+            threading.Thread(target=_kick_worker, daemon=True).start()
+        except Exception as e:
+            logger.warning(f'image derivative thread start failed: {e}')
+    return queued
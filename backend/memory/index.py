@@ -3,6 +3,8 @@ import os
 from datetime import datetime, date
 import psycopg2
 
+from image_derivative_utils import enqueue_derivatives
+
 
 def handler(event: dict, context) -> dict:
     """
@@ -324,8 +326,10 @@ def _discard_draft(cur, conn, family_id, entry_id):
 
 def _assets_for(cur, entry_id):
     cur.execute(
-        '''SELECT id, file_url, sort_order, width, height, mime_type
-           FROM memory_assets WHERE memory_entry_id = %s ORDER BY sort_order, created_at''',
+        '''SELECT a.id, a.file_url, a.sort_order, a.width, a.height, a.mime_type, d.variants
+           FROM memory_assets a
+           LEFT JOIN image_derivatives d ON d.source_url = a.file_url AND d.status = 'done'
+           WHERE a.memory_entry_id = %s ORDER BY a.sort_order, a.created_at''',
         (entry_id,),
     )
     return [
@@ -336,6 +340,7 @@ def _assets_for(cur, entry_id):
             'width': a[3],
             'height': a[4],
             'mime_type': a[5],
+            'variants': a[6] or None,
         }
         for a in cur.fetchall()
     ]
@@ -476,7 +481,7 @@ def _album_full(cur, family_id, album_id):
 
 def _resolve_album_preview(cur, family_id, album_id, cover_asset_id):
     """
-    Возвращает {id, file_url, width, height, source: 'manual'|'auto'} или None.
+    Возвращает {id, file_url, width, height, variants, source: 'manual'|'auto'} или None.
 
     Приоритет:
       1) manual: cover_asset_id указан И asset существует И принадлежит published памяти этой семьи.
@@ -489,9 +494,10 @@ def _resolve_album_preview(cur, family_id, album_id, cover_asset_id):
     # 1. Manual
     if cover_asset_id:
         cur.execute(
-            '''SELECT a.id, a.file_url, a.width, a.height
+            '''SELECT a.id, a.file_url, a.width, a.height, d.variants
                FROM memory_assets a
                JOIN memory_entries e ON e.id = a.memory_entry_id
+               LEFT JOIN image_derivatives d ON d.source_url = a.file_url AND d.status = 'done'
                WHERE a.id = %s AND e.family_id = %s
                  AND e.archived_at IS NULL AND e.status = 'published' ''',
             (cover_asset_id, family_id),
@@ -503,14 +509,16 @@ def _resolve_album_preview(cur, family_id, album_id, cover_asset_id):
                 'file_url': row[1],
                 'width': row[2],
                 'height': row[3],
+                'variants': row[4] or None,
                 'source': 'manual',
             }
     # 2. Auto: самый свежий asset из самой свежей published памяти альбома
     cur.execute(
-        '''SELECT a.id, a.file_url, a.width, a.height
+        '''SELECT a.id, a.file_url, a.width, a.height, d.variants
            FROM memory_album_links al
            JOIN memory_entries e ON e.id = al.memory_entry_id
            JOIN memory_assets a ON a.memory_entry_id = e.id
+           LEFT JOIN image_derivatives d ON d.source_url = a.file_url AND d.status = 'done'
            WHERE al.album_id = %s
              AND e.family_id = %s
              AND e.archived_at IS NULL
@@ -529,6 +537,7 @@ def _resolve_album_preview(cur, family_id, album_id, cover_asset_id):
             'file_url': row[1],
             'width': row[2],
             'height': row[3],
+            'variants': row[4] or None,
             'source': 'auto',
         }
     return None
@@ -579,6 +588,8 @@ def _handle_assets(cur, conn, method, family_id, item_id, qp, body):
             (new_id, entry_id),
         )
         conn.commit()
+        # WebP-превью для сеток и обложек альбомов строит image-optimizer в фоне
+        enqueue_derivatives(file_url, family_id=str(family_id), conn=conn)
         return _resp(200, {'id': str(new_id), 'entry': _entry_full(cur, family_id, entry_id, include_drafts=True)})
 
     if method == 'PUT':
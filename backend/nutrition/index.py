@@ -5,13 +5,30 @@ Backend функция для работы с питанием и подсчёт
 
 import json
 import os
-from typing import Dict, Any, List, Optional
+import time
+import hashlib
+from typing import Dict, Any, List, Optional, Tuple
 from datetime import datetime, date
 from decimal import Decimal
 import psycopg2
 from psycopg2.extras import RealDictCursor
 
 
+# Узкая проекция справочника продуктов: БЖУ сразу float, без построчной конвертации в Python
+PRODUCT_COLUMNS = (
+    "id, name, category, calories::float AS calories, protein::float AS protein, "
+    "fats::float AS fats, carbs::float AS carbs, fiber::float AS fiber, unit"
+)
+PRODUCT_SEARCH_LIMIT = 20
+# Порог pg_trgm для нечёткого совпадения (опечатки, словоформы)
+PRODUCT_FUZZY_THRESHOLD = 0.3
+
+# Справочник продуктов кэшируется в тёплом инстансе; версия (count + md5 отдаваемых колонок —
+# ловит и правку КБЖУ на месте) перепроверяется не чаще раза в CATALOG_VERSION_CHECK_SECONDS
+CATALOG_VERSION_CHECK_SECONDS = 300
+_CATALOG_CACHE: Dict[str, Tuple[float, str, str, str]] = {}
+
+
 def decimal_to_float(obj):
     """Конвертирует Decimal в float для JSON"""
     if isinstance(obj, Decimal):
@@ -57,6 +74,23 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         return {'statusCode': 200, 'headers': headers, 'body': '', 'isBase64Encoded': False}
     
     try:
+        # Получить все продукты — из кэша инстанса, с ETag; БД только для проверки версии
+        if method == 'GET' and action == 'products':
+            category = params.get('category')
+            body, etag = get_products_cached(category)
+            cache_headers = {**headers, 'ETag': etag, 'Cache-Control': 'public, max-age=300'}
+            if_none_match = next(
+                (v for k, v in (event.get('headers') or {}).items() if k.lower() == 'if-none-match'), ''
+            )
+            if etag in [t.strip() for t in (if_none_match or '').split(',')]:
+                return {'statusCode': 304, 'headers': cache_headers, 'body': '', 'isBase64Encoded': False}
+            return {
+                'statusCode': 200,
+                'headers': cache_headers,
+                'body': body,
+                'isBase64Encoded': False
+            }
+        
         conn = get_db_connection()
         
         # Поиск продуктов
@@ -70,17 +104,6 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 'isBase64Encoded': False
             }
         
-        # Получить все продукты
-        if method == 'GET' and action == 'products':
-            category = params.get('category')
-            products = get_products(conn, category)
-            return {
-                'statusCode': 200,
-                'headers': headers,
-                'body': json.dumps({'products': products}, ensure_ascii=False),
-                'isBase64Encoded': False
-            }
-        
         # Дневник питания
         if method == 'GET' and action == 'diary':
             user_id_param = params.get('user_id', '1')
@@ -216,42 +239,87 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
 
 
 def search_products(conn, query: str) -> List[Dict]:
-    """Поиск продуктов по названию"""
+    """
+    Поиск продуктов по названию с ранжированием: точное совпадение, затем префикс,
+    затем подстрока/нечёткое (pg_trgm). Индексы — idx_nutrition_products_name_trgm / _prefix.
+    """
+    q = (query or '').strip().lower()
+    if not q:
+        return []
+    like_q = q.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
     with conn.cursor(cursor_factory=RealDictCursor) as cur:
+        cur.execute(f"SELECT set_limit({PRODUCT_FUZZY_THRESHOLD})")
         cur.execute(
-            "SELECT * FROM nutrition_products WHERE LOWER(name) LIKE LOWER(%s) LIMIT 20",
-            (f'%{query}%',)
+            f"""
+            SELECT {PRODUCT_COLUMNS}
+            FROM nutrition_products
+            WHERE LOWER(name) LIKE %(contains)s OR LOWER(name) %% %(q)s
+            ORDER BY
+                CASE
+                    WHEN LOWER(name) = %(q)s THEN 0
+                    WHEN LOWER(name) LIKE %(prefix)s THEN 1
+                    WHEN LOWER(name) LIKE %(contains)s THEN 2
+                    ELSE 3
+                END,
+                similarity(LOWER(name), %(q)s) DESC,
+                LENGTH(name),
+                name
+            LIMIT {PRODUCT_SEARCH_LIMIT}
+            """,
+            {'q': q, 'prefix': f'{like_q}%', 'contains': f'%{like_q}%'}
         )
-        results = []
-        for row in cur.fetchall():
-            result = dict(row)
-            # Конвертируем Decimal и datetime в JSON-совместимые типы
-            for key, value in result.items():
-                if isinstance(value, Decimal):
-                    result[key] = float(value)
-                elif isinstance(value, (datetime, date)):
-                    result[key] = value.isoformat()
-            results.append(result)
-        return results
+        return [dict(row) for row in cur.fetchall()]
 
 
 def get_products(conn, category: Optional[str] = None) -> List[Dict]:
     """Получить все продукты или по категории"""
     with conn.cursor(cursor_factory=RealDictCursor) as cur:
         if category:
-            cur.execute("SELECT * FROM nutrition_products WHERE category = %s ORDER BY name", (category,))
+            cur.execute(f"SELECT {PRODUCT_COLUMNS} FROM nutrition_products WHERE category = %s ORDER BY name", (category,))
         else:
-            cur.execute("SELECT * FROM nutrition_products ORDER BY category, name")
-        results = []
-        for row in cur.fetchall():
-            result = dict(row)
-            for key, value in result.items():
-                if isinstance(value, Decimal):
-                    result[key] = float(value)
-                elif isinstance(value, (datetime, date)):
-                    result[key] = value.isoformat()
-            results.append(result)
-        return results
+            cur.execute(f"SELECT {PRODUCT_COLUMNS} FROM nutrition_products ORDER BY category, name")
+        return [dict(row) for row in cur.fetchall()]
+
+
+def get_catalog_version(conn) -> str:
+    """Версия справочника: число строк + md5 по всем колонкам PRODUCT_COLUMNS в порядке id."""
+    with conn.cursor() as cur:
+        cur.execute("""
+            SELECT COUNT(*),
+                   md5(COALESCE(string_agg(
+                       concat_ws('|', id, name, category, calories, protein, fats, carbs, fiber, unit),
+                       E'\\n' ORDER BY id), ''))
+            FROM nutrition_products
+        """)
+        count, digest = cur.fetchone()
+    return f'{count}:{digest}'
+
+
+def get_products_cached(category: Optional[str] = None) -> Tuple[str, str]:
+    """
+    (JSON-тело, сильный ETag) справочника. Тело собирается один раз на версию каталога;
+    в пределах CATALOG_VERSION_CHECK_SECONDS запросов в БД нет вовсе.
+    """
+    key = category or ''
+    now = time.time()
+    cached = _CATALOG_CACHE.get(key)
+    if cached and cached[0] > now:
+        return cached[2], cached[3]
+
+    conn = get_db_connection()
+    try:
+        version = get_catalog_version(conn)
+        if cached and cached[1] == version:
+            _CATALOG_CACHE[key] = (now + CATALOG_VERSION_CHECK_SECONDS, version, cached[2], cached[3])
+            return cached[2], cached[3]
+        products = get_products(conn, category)
+    finally:
+        conn.close()
+
+    body = json.dumps({'products': products}, ensure_ascii=False)
+    etag = '"' + hashlib.sha256(body.encode('utf-8')).hexdigest()[:32] + '"'
+    _CATALOG_CACHE[key] = (now + CATALOG_VERSION_CHECK_SECONDS, version, body, etag)
+    return body, etag
 
 
 def get_food_diary(conn, user_id, diary_date: str) -> List[Dict]:
@@ -313,6 +381,37 @@ def _is_uuid(value) -> bool:
     return bool(re.match(r'^[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}$', value.lower()))
 
 
+def _rollup_subject(member_id, user_id) -> str:
+    """Ключ дневной свёртки: member_id, для записей без него — legacy user_id"""
+    return str(member_id) if member_id else f'legacy:{user_id}'
+
+
+def bump_daily_rollup(cur, entry: Dict, sign: int = 1, previous: Optional[Dict] = None) -> None:
+    """
+    Инкрементально обновляет daily_health_rollups по записи дневника.
+    sign=1 — добавлена, sign=-1 — удалена; previous — старая версия изменённой записи (учитывается дельта).
+    """
+    def num(row, key):
+        return float(row.get(key) or 0) if row else 0.0
+
+    deltas = [sign * num(entry, k) - num(previous, k) for k in ('calories', 'protein', 'fats', 'carbs')]
+    entries_delta = sign if previous is None else 0
+    cur.execute(
+        """
+        INSERT INTO daily_health_rollups (subject_id, day, calories, protein, fats, carbs, diary_entries)
+        VALUES (%s, %s, %s, %s, %s, %s, %s)
+        ON CONFLICT (subject_id, day) DO UPDATE SET
+            calories = daily_health_rollups.calories + EXCLUDED.calories,
+            protein = daily_health_rollups.protein + EXCLUDED.protein,
+            fats = daily_health_rollups.fats + EXCLUDED.fats,
+            carbs = daily_health_rollups.carbs + EXCLUDED.carbs,
+            diary_entries = daily_health_rollups.diary_entries + EXCLUDED.diary_entries,
+            updated_at = NOW()
+        """,
+        (_rollup_subject(entry.get('member_id'), entry.get('user_id')), entry['date'], *deltas, entries_delta)
+    )
+
+
 def add_diary_entry(conn, data: Dict) -> Dict:
     """Добавить запись в дневник питания.
     Поддерживает как legacy user_id (int), так и member_id (UUID) от фронта.
@@ -362,8 +461,9 @@ def add_diary_entry(conn, data: Dict) -> Dict:
             (user_id, member_id, meal_type, product_id, product_name, amount, 
              calories, protein, fats, carbs, data.get('notes'))
         )
-        conn.commit()
         result = dict(cur.fetchone())
+        bump_daily_rollup(cur, result)
+        conn.commit()
         
         # Конвертируем даты и Decimal в JSON-совместимые типы
         for key, value in result.items():
@@ -411,8 +511,9 @@ def update_diary_entry(conn, data: Dict) -> Dict:
                 (amount, meal_type or entry['meal_type'], entry_id)
             )
         
-        conn.commit()
         result = dict(cur.fetchone())
+        bump_daily_rollup(cur, result, previous=entry)
+        conn.commit()
         
         # Конвертируем даты и Decimal в JSON-совместимые типы
         for key, value in result.items():
@@ -426,8 +527,14 @@ def update_diary_entry(conn, data: Dict) -> Dict:
 
 def delete_diary_entry(conn, entry_id: int) -> None:
     """Удалить запись из дневника питания"""
-    with conn.cursor() as cur:
-        cur.execute("DELETE FROM food_diary WHERE id = %s", (entry_id,))
+    with conn.cursor(cursor_factory=RealDictCursor) as cur:
+        cur.execute(
+            "DELETE FROM food_diary WHERE id = %s RETURNING member_id, user_id, date, calories, protein, fats, carbs",
+            (entry_id,)
+        )
+        deleted = cur.fetchone()
+        if deleted:
+            bump_daily_rollup(cur, dict(deleted), sign=-1)
         conn.commit()
 
 
@@ -438,6 +545,7 @@ def get_nutrition_analytics(conn, user_id, analytics_date: str) -> Dict:
     """
     is_uuid_filter = _is_uuid(user_id)
     with conn.cursor(cursor_factory=RealDictCursor) as cur:
+        # Итоги дня — из свёртки daily_health_rollups (одна строка на участника за день)
         if user_id is None:
             cur.execute(
                 """
@@ -446,9 +554,9 @@ def get_nutrition_analytics(conn, user_id, analytics_date: str) -> Dict:
                     COALESCE(SUM(protein), 0) as total_protein,
                     COALESCE(SUM(fats), 0) as total_fats,
                     COALESCE(SUM(carbs), 0) as total_carbs,
-                    COUNT(*) as entries_count
-                FROM food_diary
-                WHERE date = %s
+                    COALESCE(SUM(diary_entries), 0) as entries_count
+                FROM daily_health_rollups
+                WHERE day = %s
                 """,
                 (analytics_date,)
             )
@@ -460,11 +568,11 @@ def get_nutrition_analytics(conn, user_id, analytics_date: str) -> Dict:
                     COALESCE(SUM(protein), 0) as total_protein,
                     COALESCE(SUM(fats), 0) as total_fats,
                     COALESCE(SUM(carbs), 0) as total_carbs,
-                    COUNT(*) as entries_count
-                FROM food_diary
-                WHERE member_id = %s::uuid AND date = %s
+                    COALESCE(SUM(diary_entries), 0) as entries_count
+                FROM daily_health_rollups
+                WHERE subject_id = %s AND day = %s
                 """,
-                (user_id, analytics_date)
+                (str(user_id).lower(), analytics_date)
             )
         else:
             cur.execute(
@@ -6,96 +6,26 @@ Rate Limiter - защита от брутфорса и DDoS атак
 - Смена пароля: 3 попытки за 30 минут
 - API запросы: 100 запросов в минуту
 
-Использует PostgreSQL для хранения счетчиков
+Использует PostgreSQL для хранения счетчиков.
+Логика лимитов — в rate_limit_utils (тот же модуль встраивается в другие функции
+напрямую, без HTTP-хопа сюда).
 """
 
 import json
 import os
 from datetime import datetime, timedelta
-from typing import Dict, Any, Optional
+from typing import Dict, Any
 import psycopg2
-from psycopg2.extras import RealDictCursor
+from rate_limit_utils import RATE_LIMITS, check_rate_limit, get_rate_limit_stats
 
 DATABASE_URL = os.environ.get('DATABASE_URL')
 SCHEMA = 't_p5815085_family_assistant_pro'
 
-# Конфигурация лимитов
-RATE_LIMITS = {
-    'auth': {'max_attempts': 5, 'window_minutes': 15},
-    'password_reset': {'max_attempts': 3, 'window_minutes': 30},
-    'api': {'max_attempts': 100, 'window_minutes': 1}
-}
-
 def get_db_connection():
     conn = psycopg2.connect(DATABASE_URL)
     conn.autocommit = True
     return conn
 
-def check_rate_limit(ip_address: str, action_type: str) -> Dict[str, Any]:
-    """
-    Проверка лимита запросов
-    
-    Returns:
-        {
-            'allowed': bool,
-            'remaining': int,
-            'reset_at': datetime
-        }
-    """
-    conn = get_db_connection()
-    cur = conn.cursor(cursor_factory=RealDictCursor)
-    
-    limit_config = RATE_LIMITS.get(action_type, RATE_LIMITS['api'])
-    max_attempts = limit_config['max_attempts']
-    window_minutes = limit_config['window_minutes']
-    
-    window_start = datetime.now() - timedelta(minutes=window_minutes)
-    
-    # Подсчёт попыток за временное окно
-    cur.execute(
-        f"""
-        SELECT COUNT(*) as attempt_count
-        FROM {SCHEMA}.rate_limit_log
-        WHERE ip_address = %s 
-        AND action_type = %s
-        AND created_at > %s
-        """,
-        (ip_address, action_type, window_start)
-    )
-    
-    result = cur.fetchone()
-    attempt_count = result['attempt_count'] if result else 0
-    
-    allowed = attempt_count < max_attempts
-    remaining = max(0, max_attempts - attempt_count - 1)
-    reset_at = datetime.now() + timedelta(minutes=window_minutes)
-    
-    cur.close()
-    conn.close()
-    
-    return {
-        'allowed': allowed,
-        'remaining': remaining,
-        'reset_at': reset_at.isoformat(),
-        'current_attempts': attempt_count
-    }
-
-def log_attempt(ip_address: str, action_type: str, user_id: Optional[int] = None):
-    """Логирование попытки запроса"""
-    conn = get_db_connection()
-    cur = conn.cursor()
-    
-    cur.execute(
-        f"""
-        INSERT INTO {SCHEMA}.rate_limit_log (ip_address, action_type, user_id, created_at)
-        VALUES (%s, %s, %s, NOW())
-        """,
-        (ip_address, action_type, user_id)
-    )
-    
-    cur.close()
-    conn.close()
-
 def cleanup_old_logs():
     """Очистка старых логов (старше 24 часов)"""
     conn = get_db_connection()
@@ -151,10 +81,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             user_id = body.get('user_id')
             should_log = body.get('log_attempt', True)
             
-            result = check_rate_limit(ip_address, action_type)
-            
-            if should_log and result['allowed']:
-                log_attempt(ip_address, action_type, user_id)
+            result = check_rate_limit(ip_address, action_type, log_attempt=should_log, user_id=user_id)
             
             return {
                 'statusCode': 200 if result['allowed'] else 429,
@@ -169,6 +96,17 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 'isBase64Encoded': False
             }
         
+        elif method == 'GET' and (event.get('queryStringParameters') or {}).get('action') == 'stats':
+            return {
+                'statusCode': 200,
+                'headers': {
+                    'Content-Type': 'application/json',
+                    'Access-Control-Allow-Origin': '*'
+                },
+                'body': json.dumps({'stats': get_rate_limit_stats()}),
+                'isBase64Encoded': False
+            }
+        
         elif method == 'GET':
             # Очистка старых логов (вызывается по расписанию)
             deleted = cleanup_old_logs()
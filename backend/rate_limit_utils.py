@@ -0,0 +1,198 @@
+"""
+Встраиваемый rate limiter — используется любыми backend-функциями in-process,
+без HTTP-хопа в функцию rate-limiter.
+
+Пример использования:
+    from rate_limit_utils import check_rate_limit, check_rate_limits
+
+    # одна проверка (семантика как у POST rate-limiter)
+    result = check_rate_limit(ip_address, 'auth')
+    if not result['allowed']:
+        return 429
+
+    # пакетная проверка: IP + пользователь + действие одним SQL-запросом
+    result = check_rate_limits([
+        ip_key(ip_address, 'api'),
+        user_key(user_id, 'password_reset'),
+    ])
+
+Принципы:
+- Те же RATE_LIMITS и та же таблица rate_limit_log, что у функции rate-limiter.
+- Пакет проверяется и логируется одним запросом: попытки пишутся только если
+  разрешены ВСЕ проверки пакета (как log_attempt только при allowed).
+- Fail-open: при ошибке БД запрос разрешается, ошибка считается в статистике.
+- Ключ пользователя хранится в ip_address с префиксом 'u:' (колонка user_id INTEGER,
+  а id пользователей — UUID).
+"""
+import os
+import logging
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+DATABASE_URL = os.environ.get('DATABASE_URL')
+SCHEMA = 't_p5815085_family_assistant_pro'
+
+# Конфигурация лимитов (синхронно с backend/rate-limiter)
+RATE_LIMITS = {
+    'auth': {'max_attempts': 5, 'window_minutes': 15},
+    'password_reset': {'max_attempts': 3, 'window_minutes': 30},
+    'api': {'max_attempts': 100, 'window_minutes': 1}
+}
+
+# Счётчики для наблюдаемости (живут в пределах тёплого инстанса функции)
+_STATS: Dict[str, Dict[str, int]] = {}
+
+
+def ip_key(ip_address: str, action_type: str = 'api') -> Tuple[str, str]:
+    """Проверка по IP-адресу."""
+    return (ip_address or 'unknown', action_type)
+
+
+def user_key(user_id: str, action_type: str = 'api') -> Tuple[str, str]:
+    """Проверка по пользователю (ключ 'u:<user_id>')."""
+    return (f'u:{user_id}', action_type)
+
+
+def _limit_config(action_type: str) -> Dict[str, int]:
+    return RATE_LIMITS.get(action_type, RATE_LIMITS['api'])
+
+
+def _bump(action_type: str, field: str) -> None:
+    stats = _STATS.setdefault(action_type, {'checks': 0, 'allowed': 0, 'denied': 0, 'errors': 0})
+    stats[field] += 1
+
+
+def get_rate_limit_stats() -> Dict[str, Dict[str, int]]:
+    """Снимок счётчиков проверок по action_type: checks / allowed / denied / errors."""
+    return {k: dict(v) for k, v in _STATS.items()}
+
+
+def reset_rate_limit_stats() -> None:
+    _STATS.clear()
+
+
+def check_rate_limits(
+    checks: List[Tuple[str, str]],
+    log_attempt: bool = True,
+    user_id: Optional[int] = None,
+    conn=None,
+    schema: str = SCHEMA,
+) -> Dict[str, Any]:
+    """
+    Пакетная проверка лимитов одним запросом к БД.
+    checks — список пар (ключ, action_type), см. ip_key()/user_key().
+
+    Returns:
+        {
+            'allowed': bool,          # True если разрешены все проверки
+            'results': [              # по одной записи на проверку, в порядке checks
+                {'key', 'action_type', 'allowed', 'remaining', 'reset_at', 'current_attempts', 'limit'}
+            ]
+        }
+    """
+    if not checks:
+        return {'allowed': True, 'results': []}
+
+    now = datetime.now()
+    values_sql = []
+    params: List[Any] = []
+    for idx, (key, action_type) in enumerate(checks):
+        cfg = _limit_config(action_type)
+        values_sql.append('(%s, %s::varchar, %s::varchar, %s::timestamp, %s)')
+        params.extend([idx, key, action_type, now - timedelta(minutes=cfg['window_minutes']), cfg['max_attempts']])
+
+    sql = f"""
+        WITH req(idx, k, action_type, since, max_attempts) AS (
+            VALUES {', '.join(values_sql)}
+        ),
+        counts AS (
+            SELECT req.idx, req.k, req.action_type, req.max_attempts,
+                   (SELECT COUNT(*) FROM {schema}.rate_limit_log l
+                    WHERE l.ip_address = req.k
+                      AND l.action_type = req.action_type
+                      AND l.created_at > req.since) AS attempt_count
+            FROM req
+        ),
+        ins AS (
+            INSERT INTO {schema}.rate_limit_log (ip_address, action_type, user_id, created_at)
+            SELECT k, action_type, %s, NOW() FROM counts
+            WHERE %s AND NOT EXISTS (SELECT 1 FROM counts WHERE attempt_count >= max_attempts)
+            RETURNING 1
+        )
+        SELECT idx, attempt_count FROM counts ORDER BY idx
+    """
+    params.extend([user_id, bool(log_attempt)])
+
+    counts: Dict[int, int] = {}
+    failed = False
+    own_conn = conn is None
+    try:
+        import psycopg2
+
+        if own_conn:
+            conn = psycopg2.connect(DATABASE_URL)
+            conn.autocommit = True
+        with conn.cursor() as cur:
+            cur.execute(sql, params)
+            for row in cur.fetchall():
+                counts[row[0]] = int(row[1])
+        if not conn.autocommit:
+            conn.commit()
+    except Exception as e:
+        logger.warning(f'rate limit check failed, fail-open: {e}')
+        failed = True
+        if not own_conn:
+            try:
+                conn.rollback()
+            except Exception:
+                pass
+    finally:
+        if own_conn and conn is not None:
+            try:
+                conn.close()
+            except Exception:
+                pass
+
+    results = []
+    for idx, (key, action_type) in enumerate(checks):
+        cfg = _limit_config(action_type)
+        attempt_count = counts.get(idx, 0)
+        allowed = failed or attempt_count < cfg['max_attempts']
+        _bump(action_type, 'checks')
+        _bump(action_type, 'errors' if failed else ('allowed' if allowed else 'denied'))
+        results.append({
+            'key': key,
+            'action_type': action_type,
+            'allowed': allowed,
+            'remaining': max(0, cfg['max_attempts'] - attempt_count - 1),
+            'reset_at': (now + timedelta(minutes=cfg['window_minutes'])).isoformat(),
+            'current_attempts': attempt_count,
+            'limit': cfg['max_attempts'],
+        })
+
+    return {'allowed': all(r['allowed'] for r in results), 'results': results}
+
+
+def check_rate_limit(
+    ip_address: str,
+    action_type: str = 'api',
+    log_attempt: bool = True,
+    user_id: Optional[int] = None,
+    conn=None,
+    schema: str = SCHEMA,
+) -> Dict[str, Any]:
+    """
+    Одиночная проверка по IP — тот же ответ, что у POST rate-limiter:
+    {'allowed', 'remaining', 'reset_at', 'current_attempts'}
+    """
+    batch = check_rate_limits([ip_key(ip_address, action_type)], log_attempt=log_attempt,
+                              user_id=user_id, conn=conn, schema=schema)
+    r = batch['results'][0]
+    return {
+        'allowed': r['allowed'],
+        'remaining': r['remaining'],
+        'reset_at': r['reset_at'],
+        'current_attempts': r['current_attempts'],
+    }
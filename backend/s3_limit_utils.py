@@ -2,7 +2,12 @@
 Утилита лимита S3-хранилища на семью.
 Вызвать ДО записи в S3: check_and_track_storage(conn, schema, family_id, file_size_bytes)
 Возвращает (ok: bool, error_response: dict | None)
+
+Реестр объектов: вызвать ПОСЛЕ записи в S3: record_s3_object(conn, schema, key, size, family_id, ...)
+Пишет s3_object_ledger и инкрементально обновляет свёртки s3_usage_rollups
+(scope 'family' — по семье, 'prefix' — по '<bucket>:<первый сегмент ключа>').
 """
+import os
 import json
 
 # Лимиты в МБ по тарифам (fallback если БД недоступна)
@@ -118,3 +123,101 @@ def track_storage_increase(conn, schema: str, family_id: str, file_size_bytes: i
         cur.close()
     except Exception:
         pass
+
+
+def s3_key_prefix(s3_key: str) -> str:
+    """Первый сегмент ключа: 'recipes/2024/x.jpg' -> 'recipes'."""
+    return s3_key.split('/', 1)[0] if '/' in s3_key else ''
+
+
+def record_s3_object(conn, schema: str, s3_key: str, size_bytes: int, family_id=None,
+                     content_type=None, source=None, bucket: str = 'files') -> None:
+    """
+    Записывает объект в реестр и одним запросом сдвигает свёртки семьи и префикса.
+    Перезапись того же ключа учитывает разницу размеров. Мягко: ошибки не пробрасываются.
+    conn=None — открывается своё соединение.
+    """
+    own_conn = conn is None
+    try:
+        if own_conn:
+            import psycopg2
+            conn = psycopg2.connect(os.environ['DATABASE_URL'])
+        cur = conn.cursor()
+        cur.execute(f"""
+            WITH prev AS (
+                SELECT size_bytes FROM {schema}.s3_object_ledger
+                WHERE bucket = %(bucket)s AND s3_key = %(key)s AND deleted_at IS NULL
+            ),
+            upsert AS (
+                INSERT INTO {schema}.s3_object_ledger
+                    (bucket, s3_key, family_id, prefix, size_bytes, content_type, source)
+                VALUES (%(bucket)s, %(key)s, %(family_id)s, %(prefix)s, %(size)s, %(content_type)s, %(source)s)
+                ON CONFLICT (bucket, s3_key) DO UPDATE SET
+                    family_id = COALESCE(EXCLUDED.family_id, {schema}.s3_object_ledger.family_id),
+                    size_bytes = EXCLUDED.size_bytes,
+                    content_type = EXCLUDED.content_type,
+                    deleted_at = NULL
+                RETURNING family_id, prefix, size_bytes
+            ),
+            delta AS (
+                SELECT u.family_id, u.prefix,
+                       u.size_bytes - COALESCE((SELECT size_bytes FROM prev), 0) AS bytes,
+                       CASE WHEN EXISTS (SELECT 1 FROM prev) THEN 0 ELSE 1 END AS objects
+                FROM upsert u
+            )
+            INSERT INTO {schema}.s3_usage_rollups (scope, scope_id, bytes, objects, updated_at)
+            SELECT 'family', family_id::text, bytes, objects, NOW() FROM delta WHERE family_id IS NOT NULL
+            UNION ALL
+            SELECT 'prefix', %(bucket)s || ':' || prefix, bytes, objects, NOW() FROM delta
+            ON CONFLICT (scope, scope_id) DO UPDATE SET
+                bytes = {schema}.s3_usage_rollups.bytes + EXCLUDED.bytes,
+                objects = {schema}.s3_usage_rollups.objects + EXCLUDED.objects,
+                updated_at = NOW()
+        """, {
+            'bucket': bucket, 'key': s3_key, 'family_id': family_id,
+            'prefix': s3_key_prefix(s3_key), 'size': int(size_bytes),
+            'content_type': content_type, 'source': source,
+        })
+        conn.commit()
+        cur.close()
+    except Exception as e:
+        print(f"[s3_limit_utils] record_s3_object failed: {e}")
+        try:
+            conn.rollback()
+        except Exception:
+            pass
+    finally:
+        if own_conn and conn is not None:
+            try:
+                conn.close()
+            except Exception:
+                pass
+
+
+def mark_s3_object_deleted(conn, schema: str, s3_key: str, bucket: str = 'files') -> None:
+    """Помечает объект удалённым и вычитает его из свёрток. Вызывать после delete_object."""
+    try:
+        cur = conn.cursor()
+        cur.execute(f"""
+            WITH del AS (
+                UPDATE {schema}.s3_object_ledger SET deleted_at = NOW()
+                WHERE bucket = %(bucket)s AND s3_key = %(key)s AND deleted_at IS NULL
+                RETURNING family_id, prefix, size_bytes
+            )
+            INSERT INTO {schema}.s3_usage_rollups (scope, scope_id, bytes, objects, updated_at)
+            SELECT 'family', family_id::text, -size_bytes, -1, NOW() FROM del WHERE family_id IS NOT NULL
+            UNION ALL
+            SELECT 'prefix', %(bucket)s || ':' || prefix, -size_bytes, -1, NOW() FROM del
+            ON CONFLICT (scope, scope_id) DO UPDATE SET
+                bytes = {schema}.s3_usage_rollups.bytes + EXCLUDED.bytes,
+                objects = {schema}.s3_usage_rollups.objects + EXCLUDED.objects,
+                updated_at = NOW()
+        """, {'bucket': bucket, 'key': s3_key})
+        conn.commit()
+        cur.close()
+    except Exception as e:
+        print(f"[s3_limit_utils] mark_s3_object_deleted failed: {e}")
+        try:
+            conn.rollback()
+        except Exception:
+            pass
@@ -3,6 +3,8 @@ Sitemap — динамически отдаёт XML.
 ?type=blog — все посты, категории, теги блога
 ?type=full (или без параметра) — общий sitemap: главная + лендинги + ссылка на блог
 Возвращает application/xml.
+Готовый XML кэшируется в S3 (blog_render_cache_utils) на сутки с сильным ETag, If-None-Match → 304.
+Кэш сбрасывают blog-api и max-bot при публикации/правке постов.
 """
 
 import os
@@ -11,6 +13,8 @@ from datetime import datetime
 import psycopg2
 from psycopg2.extras import RealDictCursor
 
+from blog_render_cache_utils import render_key, get_rendered, put_rendered, etag_matches
+
 SCHEMA = 't_p5815085_family_assistant_pro'
 SITE = 'https://nasha-semiya.ru'
 
@@ -31,6 +35,9 @@ PUBLIC_PAGES = [
     ('/terms', 'yearly', '0.3'),
 ]
 
+# lastmod статичных страниц — «сегодня», поэтому даже без публикаций XML живёт не дольше суток
+SITEMAP_CACHE_MAX_AGE_SECONDS = 24 * 3600
+
 
 def db_conn():
     return psycopg2.connect(os.environ['DATABASE_URL'])
@@ -206,17 +213,27 @@ def handler(event: Dict[str, Any], context) -> Dict[str, Any]:
     sitemap_type = params.get('type', 'blog')
 
     try:
-        if sitemap_type == 'full':
-            xml = generate_full_sitemap()
+        key = render_key('sitemap', 'full' if sitemap_type == 'full' else 'blog')
+        headers = {
+            'Content-Type': 'application/xml; charset=utf-8',
+            'Access-Control-Allow-Origin': '*',
+            'Cache-Control': 'public, max-age=300',
+        }
+        cache_status = 'HIT'
+        cached = get_rendered(key, max_age_seconds=SITEMAP_CACHE_MAX_AGE_SECONDS)
+        if cached:
+            xml, etag = cached
         else:
-            xml = generate_sitemap()
+            xml = generate_full_sitemap() if sitemap_type == 'full' else generate_sitemap()
+            etag = put_rendered(key, xml, headers['Content-Type'])
+            cache_status = 'MISS'
+        headers['ETag'] = etag
+        headers['X-Render-Cache'] = cache_status
+        if etag_matches(event.get('headers'), etag):
+            return {'statusCode': 304, 'headers': headers, 'body': '', 'isBase64Encoded': False}
         return {
             'statusCode': 200,
-            'headers': {
-                'Content-Type': 'application/xml; charset=utf-8',
-                'Access-Control-Allow-Origin': '*',
-                'Cache-Control': 'public, max-age=300',
-            },
+            'headers': headers,
             'body': xml,
             'isBase64Encoded': False,
         }
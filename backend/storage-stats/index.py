@@ -1,59 +1,197 @@
 import json
 import os
+import threading
 import boto3
+import psycopg2
 from botocore.exceptions import ClientError
 
+SCHEMA = 't_p5815085_family_assistant_pro'
+BUCKET = 'files'
+DEFAULT_PREFIX = 'recipes'
+
+# Фоновая сверка реестра с листингом S3 — не чаще раза в сутки на префикс
+RECONCILE_INTERVAL_HOURS = 24
+
+CORS_JSON = {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'}
+
+
+def get_s3():
+    return boto3.client('s3',
+        endpoint_url='https://bucket.poehali.dev',
+        aws_access_key_id=os.environ['AWS_ACCESS_KEY_ID'],
+        aws_secret_access_key=os.environ['AWS_SECRET_ACCESS_KEY']
+    )
+
+
+def read_prefix_usage(prefix: str):
+    """(bytes, objects, reconciled_at, need_reconcile) из свёртки s3_usage_rollups — индексное чтение."""
+    conn = psycopg2.connect(os.environ['DATABASE_URL'])
+    cur = conn.cursor()
+    cur.execute(f"""
+        SELECT bytes, objects, reconciled_at,
+               (reconciled_at IS NULL
+                OR reconciled_at < NOW() - INTERVAL '{RECONCILE_INTERVAL_HOURS} hours') AS need_reconcile
+        FROM {SCHEMA}.s3_usage_rollups
+        WHERE scope = 'prefix' AND scope_id = %s
+    """, (f'{BUCKET}:{prefix}',))
+    row = cur.fetchone()
+    cur.close()
+    conn.close()
+    if not row:
+        return 0, 0, None, True
+    return int(row[0] or 0), int(row[1] or 0), row[2], bool(row[3])
+
+
+def reconcile_prefix(prefix: str) -> dict:
+    """
+    Сверяет реестр s3_object_ledger с листингом S3 по префиксу:
+    новые/изменённые объекты дописываются (без семьи, source='reconcile'),
+    пропавшие помечаются удалёнными, свёртки префикса и затронутых семей пересчитываются точно.
+    """
+    s3_objects = {}
+    paginator = get_s3().get_paginator('list_objects_v2')
+    for page in paginator.paginate(Bucket=BUCKET, Prefix=f'{prefix}/'):
+        for obj in page.get('Contents', []):
+            s3_objects[obj['Key']] = int(obj['Size'])
+
+    conn = psycopg2.connect(os.environ['DATABASE_URL'])
+    cur = conn.cursor()
+    cur.execute(f"""
+        SELECT s3_key, size_bytes FROM {SCHEMA}.s3_object_ledger
+        WHERE bucket = %s AND prefix = %s AND deleted_at IS NULL
+    """, (BUCKET, prefix))
+    ledger = {r[0]: int(r[1]) for r in cur.fetchall()}
+
+    upsert_keys = [k for k, size in s3_objects.items() if ledger.get(k) != size]
+    gone_keys = [k for k in ledger if k not in s3_objects]
+
+    if upsert_keys:
+        cur.execute(f"""
+            INSERT INTO {SCHEMA}.s3_object_ledger (bucket, s3_key, prefix, size_bytes, source)
+            SELECT %s, k, %s, sz, 'reconcile'
+            FROM unnest(%s::text[], %s::bigint[]) AS t(k, sz)
+            ON CONFLICT (bucket, s3_key) DO UPDATE SET size_bytes = EXCLUDED.size_bytes, deleted_at = NULL
+        """, (BUCKET, prefix, upsert_keys, [s3_objects[k] for k in upsert_keys]))
+    if gone_keys:
+        cur.execute(f"""
+            UPDATE {SCHEMA}.s3_object_ledger SET deleted_at = NOW()
+            WHERE bucket = %s AND s3_key = ANY(%s) AND deleted_at IS NULL
+        """, (BUCKET, gone_keys))
+
+    cur.execute(f"""
+        INSERT INTO {SCHEMA}.s3_usage_rollups (scope, scope_id, bytes, objects, updated_at, reconciled_at)
+        SELECT 'prefix', %s, COALESCE(SUM(size_bytes), 0), COUNT(*), NOW(), NOW()
+        FROM {SCHEMA}.s3_object_ledger
+        WHERE bucket = %s AND prefix = %s AND deleted_at IS NULL
+        ON CONFLICT (scope, scope_id) DO UPDATE SET
+            bytes = EXCLUDED.bytes, objects = EXCLUDED.objects,
+            updated_at = NOW(), reconciled_at = NOW()
+    """, (f'{BUCKET}:{prefix}', BUCKET, prefix))
+    cur.execute(f"""
+        WITH fams AS (
+            SELECT DISTINCT family_id FROM {SCHEMA}.s3_object_ledger
+            WHERE bucket = %s AND prefix = %s AND family_id IS NOT NULL
+        )
+        INSERT INTO {SCHEMA}.s3_usage_rollups (scope, scope_id, bytes, objects, updated_at, reconciled_at)
+        SELECT 'family', f.family_id::text,
+               COALESCE(SUM(l.size_bytes) FILTER (WHERE l.deleted_at IS NULL), 0),
+               COUNT(*) FILTER (WHERE l.deleted_at IS NULL), NOW(), NOW()
+        FROM fams f
+        JOIN {SCHEMA}.s3_object_ledger l ON l.family_id = f.family_id
+        GROUP BY f.family_id
+        ON CONFLICT (scope, scope_id) DO UPDATE SET
+            bytes = EXCLUDED.bytes, objects = EXCLUDED.objects,
+            updated_at = NOW(), reconciled_at = NOW()
+    """, (BUCKET, prefix))
+    conn.commit()
+    cur.close()
+    conn.close()
+
+    return {
+        'prefix': prefix,
+        's3_objects': len(s3_objects),
+        'ledger_objects': len(ledger),
+        'upserted': len(upsert_keys),
+        'marked_deleted': len(gone_keys),
+    }
+
+
+def _reconcile_background(prefix: str) -> None:
+    try:
+        reconcile_prefix(prefix)
+    except Exception as e:
+        print(f"[storage-stats] background reconcile failed: {e}")
+
+
+def _is_internal(event: dict) -> bool:
+    hdrs = event.get('headers') or {}
+    internal_token = hdrs.get('X-Internal-Token') or hdrs.get('x-internal-token')
+    expected_internal = os.environ.get('INTERNAL_CRON_TOKEN', '')
+    return bool(expected_internal) and internal_token == expected_internal
+
 
 def handler(event: dict, context) -> dict:
-    '''Подсчёт использованного места в хранилище рецептов'''
-    
+    '''
+    Подсчёт использованного места в хранилище (по умолчанию — рецепты).
+    GET / — объём рецептов из реестра s3_object_ledger (свёртка по префиксу), без обхода бакета;
+    другой ?prefix= — только с X-Internal-Token (в бакете экспорты и медицинские файлы семей)
+    POST /?action=reconcile&prefix=recipes — сверка реестра с S3 (cron, X-Internal-Token)
+    '''
+
     method = event.get('httpMethod', 'GET')
-    
+
     if method == 'OPTIONS':
         return {
             'statusCode': 200,
             'headers': {
                 'Access-Control-Allow-Origin': '*',
-                'Access-Control-Allow-Methods': 'GET, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type, X-User-Id, X-Authorization'
+                'Access-Control-Allow-Methods': 'GET, POST, OPTIONS',
+                'Access-Control-Allow-Headers': 'Content-Type, X-User-Id, X-Authorization, X-Internal-Token'
             },
             'body': ''
         }
-    
+
+    params = event.get('queryStringParameters') or {}
+    prefix = (params.get('prefix') or DEFAULT_PREFIX).strip('/') or DEFAULT_PREFIX
+
+    if prefix != DEFAULT_PREFIX and not _is_internal(event):
+        return {'statusCode': 403, 'headers': CORS_JSON, 'body': json.dumps({'error': 'prefix_not_allowed'})}
+
+    if method == 'POST' and params.get('action') == 'reconcile':
+        if not _is_internal(event):
+            return {'statusCode': 401, 'headers': CORS_JSON, 'body': json.dumps({'error': 'invalid_internal_token'})}
+        try:
+            return {'statusCode': 200, 'headers': CORS_JSON, 'body': json.dumps(reconcile_prefix(prefix))}
+        except ClientError as e:
+            return {'statusCode': 500, 'headers': CORS_JSON, 'body': json.dumps({'error': f'S3 error: {str(e)}'})}
+        except Exception as e:
+            return {'statusCode': 500, 'headers': CORS_JSON, 'body': json.dumps({'error': str(e)})}
+
     if method != 'GET':
         return {
             'statusCode': 405,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'headers': CORS_JSON,
             'body': json.dumps({'error': 'Method not allowed'})
         }
-    
+
     try:
-        s3 = boto3.client('s3',
-            endpoint_url='https://bucket.poehali.dev',
-            aws_access_key_id=os.environ['AWS_ACCESS_KEY_ID'],
-            aws_secret_access_key=os.environ['AWS_SECRET_ACCESS_KEY']
-        )
-        
-        total_size = 0
-        photo_count = 0
-        
-        paginator = s3.get_paginator('list_objects_v2')
-        pages = paginator.paginate(Bucket='files', Prefix='recipes/')
-        
-        for page in pages:
-            if 'Contents' in page:
-                for obj in page['Contents']:
-                    total_size += obj['Size']
-                    photo_count += 1
-        
+        total_size, photo_count, reconciled_at, need_reconcile = read_prefix_usage(prefix)
+
+        # Сверка с S3 — в фоне, ответ отдаётся из реестра сразу
+        if need_reconcile:
+            try:
+                threading.Thread(target=_reconcile_background, args=(prefix,), daemon=True).start()
+            except Exception as e:
+                print(f"[storage-stats] thread start failed: {e}")
+
         total_size_mb = round(total_size / (1024 * 1024), 2)
-        
+
         free_limit_mb = 500
         free_limit_photos = 100
-        
+
         return {
             'statusCode': 200,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'headers': CORS_JSON,
             'body': json.dumps({
                 'total_size_bytes': total_size,
                 'total_size_mb': total_size_mb,
@@ -66,19 +204,14 @@ def handler(event: dict, context) -> dict:
                     'size': round((total_size_mb / free_limit_mb) * 100, 1),
                     'photos': round((photo_count / free_limit_photos) * 100, 1)
                 },
-                'is_limit_reached': total_size_mb >= free_limit_mb or photo_count >= free_limit_photos
+                'is_limit_reached': total_size_mb >= free_limit_mb or photo_count >= free_limit_photos,
+                'reconciled_at': reconciled_at.isoformat() if reconciled_at else None,
             })
         }
-        
-    except ClientError as e:
-        return {
-            'statusCode': 500,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'error': f'S3 error: {str(e)}'})
-        }
+
     except Exception as e:
         return {
             'statusCode': 500,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'headers': CORS_JSON,
             'body': json.dumps({'error': str(e)})
         }
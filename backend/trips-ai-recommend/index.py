@@ -6,6 +6,8 @@ from typing import Optional, Dict, Any, List
 import psycopg2
 from psycopg2.extras import RealDictCursor
 
+from llm_cache_utils import cached_completion
+
 SCHEMA = os.environ.get('POSTGRES_SCHEMA', 't_p5815085_family_assistant_pro')
 YANDEX_GPT_API_KEY = os.environ.get('YANDEX_GPT_API_KEY', '')
 YANDEX_FOLDER_ID = os.environ.get('YANDEX_FOLDER_ID', '')
@@ -94,7 +96,7 @@ def call_yandex_gpt(prompt: str) -> str:
     print(f'[DEBUG] Отправка запроса к YandexGPT. ModelUri: gpt://{correct_folder_id}/yandexgpt-lite')
     
     try:
-        response = requests.post(url, headers=headers, json=payload, timeout=30)
+        response = cached_completion(url, headers=headers, json=payload, timeout=30, function_name='trips_ai_recommend')
         
         if response.status_code != 200:
             error_text = response.text
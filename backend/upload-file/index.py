@@ -5,7 +5,8 @@ import base64
 import psycopg2
 from datetime import datetime
 import uuid
-from s3_limit_utils import check_and_track_storage
+from s3_limit_utils import check_and_track_storage, track_storage_increase, record_s3_object
+from image_derivative_utils import enqueue_derivatives, is_image
 
 SCHEMA = os.environ.get('MAIN_DB_SCHEMA', 't_p5815085_family_assistant_pro')
 
@@ -49,6 +50,11 @@ def _get_family_by_token(token: str) -> str | None:
         return None
 
 MAX_FILE_SIZE_BYTES = 10 * 1024 * 1024  # 10 MB
+MAX_DIRECT_UPLOAD_BYTES = 100 * 1024 * 1024  # 100 MB — presigned POST, мимо памяти функции
+PRESIGN_EXPIRES_SECONDS = 900
+# После истечения presigned POST ждём ещё столько, прежде чем снять резерв незавершённой загрузки
+PRESIGN_INTENT_GRACE_SECONDS = 900
+EXPIRE_INTENTS_BATCH = 20
 
 CORS = {
     'Access-Control-Allow-Origin': '*',
@@ -61,8 +67,254 @@ def respond(status, body):
     return {'statusCode': status, 'headers': {'Content-Type': 'application/json', **CORS}, 'body': json.dumps(body, ensure_ascii=False)}
 
 
+def _resolve_family(event: dict):
+    """(family_id | None, token, error_response | None) по заголовкам запроса."""
+    hdrs = event.get('headers') or {}
+    family_id = hdrs.get('X-Family-Id') or hdrs.get('x-family-id')
+    token = hdrs.get('X-Authorization') or hdrs.get('x-authorization') or hdrs.get('X-Auth-Token') or hdrs.get('x-auth-token')
+
+    if family_id:
+        # Явно передан family_id — валидируем принадлежность
+        if not _validate_family(token, family_id):
+            return None, token, respond(403, {'error': 'Нет доступа к этой семье'})
+    elif token:
+        # family_id не передан, но есть токен — определяем семью автоматически
+        family_id = _get_family_by_token(token)
+    return family_id, token, None
+
+
+def _make_key(folder: str, file_name: str, content_type: str | None):
+    """Уникальный ключ S3 и content-type по имени файла."""
+    file_ext = file_name.rsplit('.', 1)[-1].lower() if '.' in file_name else 'jpg'
+    unique_name = f"{folder}/{datetime.now().strftime('%Y%m%d')}/{uuid.uuid4().hex}.{file_ext}"
+
+    if not content_type:
+        ct_map = {
+            'jpg': 'image/jpeg', 'jpeg': 'image/jpeg', 'png': 'image/png',
+            'gif': 'image/gif', 'webp': 'image/webp', 'pdf': 'application/pdf',
+        }
+        content_type = ct_map.get(file_ext, 'application/octet-stream')
+    return unique_name, content_type
+
+
+def _s3_client(access_key: str, secret_key: str):
+    return boto3.client(
+        's3',
+        endpoint_url='https://bucket.poehali.dev',
+        aws_access_key_id=access_key,
+        aws_secret_access_key=secret_key,
+    )
+
+
+def _expire_stale_intents(conn, s3) -> int:
+    """
+    Разбирает брошенные pending-загрузки (presign без complete) старше срока presigned POST + grace.
+    Объект в S3 есть — загрузка засчитывается как completed по фактическому размеру (HEAD) и
+    попадает в реестр; объекта нет — intent помечается expired и declared_size возвращается семье.
+    Идёт по частичному индексу idx_s3_upload_intents_pending, не больше EXPIRE_INTENTS_BATCH за вызов.
+    """
+    cur = conn.cursor()
+    cur.execute(
+        f"SELECT s3_key, family_id, declared_size, content_type FROM {SCHEMA}.s3_upload_intents"
+        f" WHERE status = 'pending' AND created_at < NOW() - make_interval(secs => %s)"
+        f" ORDER BY created_at LIMIT %s FOR UPDATE SKIP LOCKED",
+        (PRESIGN_EXPIRES_SECONDS + PRESIGN_INTENT_GRACE_SECONDS, EXPIRE_INTENTS_BATCH)
+    )
+    rows = cur.fetchall()
+    storage_delta = {}
+    uploaded = []
+    for s3_key, family_id, declared_size, content_type in rows:
+        try:
+            head = s3.head_object(Bucket='files', Key=s3_key)
+            actual_size = int(head.get('ContentLength') or 0)
+        except Exception as e:
+            code = str(getattr(e, 'response', {}).get('Error', {}).get('Code', ''))
+            if code not in ('404', 'NoSuchKey', 'NotFound'):
+                # S3 недоступен — не угадываем, intent разберёт следующий вызов
+                print(f"[upload-file] expire intent head failed {s3_key}: {e}")
+                continue
+            actual_size = None
+
+        if actual_size is None:
+            cur.execute(
+                f"UPDATE {SCHEMA}.s3_upload_intents SET status = 'expired' WHERE s3_key = %s",
+                (s3_key,)
+            )
+            delta = -int(declared_size or 0)
+        else:
+            cur.execute(
+                f"UPDATE {SCHEMA}.s3_upload_intents"
+                f" SET status = 'completed', actual_size = %s, completed_at = NOW() WHERE s3_key = %s",
+                (actual_size, s3_key)
+            )
+            delta = actual_size - int(declared_size or 0)
+            uploaded.append((s3_key, actual_size, family_id, content_type))
+        if family_id and delta:
+            storage_delta[str(family_id)] = storage_delta.get(str(family_id), 0) + delta
+
+    for family_id, size_bytes in storage_delta.items():
+        cur.execute(
+            f"UPDATE {SCHEMA}.subscription_usage"
+            f" SET file_storage_used_mb = GREATEST(0, file_storage_used_mb + %s),"
+            f"     updated_at = CURRENT_TIMESTAMP"
+            f" WHERE family_id = %s",
+            (round(size_bytes / (1024 * 1024), 4), family_id)
+        )
+    conn.commit()
+    cur.close()
+
+    for s3_key, actual_size, family_id, content_type in uploaded:
+        record_s3_object(conn, SCHEMA, s3_key, actual_size, family_id=str(family_id) if family_id else None,
+                         content_type=content_type, source='upload-file')
+    return len(rows)
+
+
+def _presign(event: dict, body_data: dict, access_key: str, secret_key: str) -> dict:
+    """
+    Шаг 1 прямой загрузки: проверяет лимит семьи на заявленный размер, резервирует его
+    и выдаёт presigned POST с ограничением content-length-range — файл идёт в S3 мимо функции.
+    """
+    file_name = body_data.get('file_name') or body_data.get('fileName', 'upload.jpg')
+    folder = body_data.get('folder', 'general')
+    try:
+        declared_size = int(body_data.get('size') or 0)
+    except (TypeError, ValueError):
+        declared_size = 0
+    if declared_size <= 0:
+        return respond(400, {'error': 'Не указан размер файла'})
+    if declared_size > MAX_DIRECT_UPLOAD_BYTES:
+        return respond(413, {
+            'error': f'Файл слишком большой. Максимум {MAX_DIRECT_UPLOAD_BYTES // 1024 // 1024} МБ. '
+                     f'Ваш файл: {declared_size / 1024 / 1024:.1f} МБ'
+        })
+
+    family_id, _token, err = _resolve_family(event)
+    if err:
+        return err
+    # Без семьи нет квоты — для анонимной загрузки тот же лимит, что и у base64-пути
+    if not family_id and declared_size > MAX_FILE_SIZE_BYTES:
+        return respond(413, {
+            'error': f'Файл слишком большой. Без входа в аккаунт максимум {MAX_FILE_SIZE_BYTES // 1024 // 1024} МБ. '
+                     f'Ваш файл: {declared_size / 1024 / 1024:.1f} МБ'
+        })
+
+    unique_name, content_type = _make_key(folder, file_name, body_data.get('content_type'))
+
+    # Резерв заявленного размера (fail-open), реальный размер уточнит complete
+    try:
+        conn = psycopg2.connect(os.environ['DATABASE_URL'])
+        try:
+            _expire_stale_intents(conn, _s3_client(access_key, secret_key))
+        except Exception as e:
+            conn.rollback()
+            print(f"[upload-file] expire intents failed: {e}")
+        if family_id:
+            ok, limit_err = check_and_track_storage(conn, SCHEMA, family_id, declared_size)
+            if not ok:
+                conn.close()
+                return limit_err
+        cur = conn.cursor()
+        cur.execute(
+            f"INSERT INTO {SCHEMA}.s3_upload_intents (s3_key, family_id, declared_size, content_type)"
+            f" VALUES (%s, %s, %s, %s)",
+            (unique_name, family_id, declared_size, content_type)
+        )
+        conn.commit()
+        conn.close()
+    except Exception as e:
+        print(f"[upload-file] presign intent failed: {e}")
+        return respond(500, {'error': 'Не удалось подготовить загрузку'})
+
+    post = _s3_client(access_key, secret_key).generate_presigned_post(
+        Bucket='files',
+        Key=unique_name,
+        Fields={'Content-Type': content_type},
+        Conditions=[
+            {'Content-Type': content_type},
+            ['content-length-range', 1, declared_size],
+        ],
+        ExpiresIn=PRESIGN_EXPIRES_SECONDS,
+    )
+
+    return respond(200, {
+        'upload_url': post['url'],
+        'fields': post['fields'],
+        'fileName': unique_name,
+        'url': f"https://cdn.poehali.dev/projects/{access_key}/bucket/{unique_name}",
+        'expires_in': PRESIGN_EXPIRES_SECONDS,
+    })
+
+
+def _complete(event: dict, body_data: dict, access_key: str, secret_key: str) -> dict:
+    """
+    Шаг 2 прямой загрузки: берёт фактический размер объекта из S3 (HEAD)
+    и поправляет счётчик хранилища семьи на разницу с заявленным. Идемпотентен.
+    """
+    key = body_data.get('fileName') or body_data.get('file_name')
+    if not key:
+        return respond(400, {'error': 'fileName required'})
+
+    conn = psycopg2.connect(os.environ['DATABASE_URL'])
+    try:
+        cur = conn.cursor()
+        cur.execute(
+            f"SELECT family_id, declared_size, actual_size, status, content_type FROM {SCHEMA}.s3_upload_intents"
+            f" WHERE s3_key = %s",
+            (key,)
+        )
+        row = cur.fetchone()
+        if not row:
+            return respond(404, {'error': 'Загрузка не найдена'})
+        family_id, declared_size, actual_size, status, content_type = row
+
+        if family_id:
+            hdrs = event.get('headers') or {}
+            token = hdrs.get('X-Authorization') or hdrs.get('x-authorization') or hdrs.get('X-Auth-Token') or hdrs.get('x-auth-token')
+            if not _validate_family(token, str(family_id)):
+                return respond(403, {'error': 'Нет доступа к этой семье'})
+
+        if status != 'completed':
+            try:
+                head = _s3_client(access_key, secret_key).head_object(Bucket='files', Key=key)
+            except Exception:
+                return respond(409, {'error': 'Файл ещё не загружен в хранилище'})
+            actual_size = int(head.get('ContentLength') or 0)
+
+            cur.execute(
+                f"UPDATE {SCHEMA}.s3_upload_intents"
+                f" SET status = 'completed', actual_size = %s, completed_at = NOW()"
+                f" WHERE s3_key = %s AND status = %s",
+                (actual_size, key, status)
+            )
+            conn.commit()
+            completed_now = cur.rowcount > 0
+            # Для expired резерв уже снят свипом — учитываем размер целиком
+            reserved = declared_size if status == 'pending' else 0
+            if completed_now and family_id and actual_size != reserved:
+                track_storage_increase(conn, SCHEMA, str(family_id), actual_size - reserved)
+            if completed_now:
+                record_s3_object(conn, SCHEMA, key, actual_size, family_id=str(family_id) if family_id else None,
+                                 content_type=content_type, source='upload-file')
+            if completed_now and is_image(content_type):
+                enqueue_derivatives(f"https://cdn.poehali.dev/projects/{access_key}/bucket/{key}",
+                                    family_id=str(family_id) if family_id else None, conn=conn, schema=SCHEMA)
+    finally:
+        conn.close()
+
+    return respond(200, {
+        'url': f"https://cdn.poehali.dev/projects/{access_key}/bucket/{key}",
+        'fileName': key,
+        'size': actual_size,
+        'size_mb': round((actual_size or 0) / 1024 / 1024, 2),
+    })
+
+
 def handler(event: dict, context) -> dict:
-    """Загрузка файлов (фото, PDF) в S3. Проверяет лимит 10 МБ на файл и лимит объёма на семью."""
+    """
+    Загрузка файлов (фото, PDF) в S3. Проверяет лимит 10 МБ на файл и лимит объёма на семью.
+    action=presign / action=complete — прямая загрузка в S3 по presigned POST (до 100 МБ),
+    без action — загрузка base64 через функцию.
+    """
 
     if event.get('httpMethod') == 'OPTIONS':
         return {'statusCode': 200, 'headers': CORS, 'body': ''}
@@ -71,6 +323,17 @@ def handler(event: dict, context) -> dict:
         return respond(405, {'error': 'Method not allowed'})
 
     body_data = json.loads(event.get('body') or '{}')
+    action = body_data.get('action')
+
+    access_key = os.environ.get('AWS_ACCESS_KEY_ID')
+    secret_key  = os.environ.get('AWS_SECRET_ACCESS_KEY')
+
+    if action in ('presign', 'complete'):
+        if not access_key or not secret_key:
+            return respond(500, {'error': 'S3 configuration missing'})
+        if action == 'presign':
+            return _presign(event, body_data, access_key, secret_key)
+        return _complete(event, body_data, access_key, secret_key)
 
     file_base64 = body_data.get('file_data') or body_data.get('file')
     file_name   = body_data.get('file_name') or body_data.get('fileName', 'upload.jpg')
@@ -80,8 +343,6 @@ def handler(event: dict, context) -> dict:
     if not file_base64:
         return respond(400, {'error': 'No file provided'})
 
-    access_key = os.environ.get('AWS_ACCESS_KEY_ID')
-    secret_key  = os.environ.get('AWS_SECRET_ACCESS_KEY')
     if not access_key or not secret_key:
         return respond(500, {'error': 'S3 configuration missing'})
 
@@ -95,17 +356,9 @@ def handler(event: dict, context) -> dict:
         })
 
     # Лимит объёма хранилища на семью
-    hdrs = event.get('headers') or {}
-    family_id = hdrs.get('X-Family-Id') or hdrs.get('x-family-id')
-    token = hdrs.get('X-Authorization') or hdrs.get('x-authorization') or hdrs.get('X-Auth-Token') or hdrs.get('x-auth-token')
-
-    if family_id:
-        # Явно передан family_id — валидируем принадлежность
-        if not _validate_family(token, family_id):
-            return respond(403, {'error': 'Нет доступа к этой семье'})
-    elif token:
-        # family_id не передан, но есть токен — определяем семью автоматически
-        family_id = _get_family_by_token(token)
+    family_id, _token, err = _resolve_family(event)
+    if err:
+        return err
 
     # Учёт S3-лимита (fail-open: если БД недоступна — загрузка продолжается)
     if family_id:
@@ -118,27 +371,19 @@ def handler(event: dict, context) -> dict:
         except Exception:
             pass
 
-    # Определить расширение и content-type
-    file_ext = file_name.rsplit('.', 1)[-1].lower() if '.' in file_name else 'jpg'
-    unique_name = f"{folder}/{datetime.now().strftime('%Y%m%d')}/{uuid.uuid4().hex}.{file_ext}"
-
-    if not content_type:
-        ct_map = {
-            'jpg': 'image/jpeg', 'jpeg': 'image/jpeg', 'png': 'image/png',
-            'gif': 'image/gif', 'webp': 'image/webp', 'pdf': 'application/pdf',
-        }
-        content_type = ct_map.get(file_ext, 'application/octet-stream')
+    unique_name, content_type = _make_key(folder, file_name, content_type)
 
     # Загрузить в S3
-    s3 = boto3.client(
-        's3',
-        endpoint_url='https://bucket.poehali.dev',
-        aws_access_key_id=access_key,
-        aws_secret_access_key=secret_key,
-    )
+    s3 = _s3_client(access_key, secret_key)
     s3.put_object(Bucket='files', Key=unique_name, Body=file_data, ContentType=content_type)
 
     file_url = f"https://cdn.poehali.dev/projects/{access_key}/bucket/{unique_name}"
+    record_s3_object(None, SCHEMA, unique_name, len(file_data), family_id=family_id,
+                     content_type=content_type, source='upload-file')
+
+    # WebP-превью строит image-optimizer в фоне
+    if is_image(content_type):
+        enqueue_derivatives(file_url, family_id=family_id, schema=SCHEMA)
 
     return respond(200, {
         'url': file_url,
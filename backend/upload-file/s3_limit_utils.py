@@ -2,7 +2,12 @@
 Утилита лимита S3-хранилища на семью.
 Вызвать ДО записи в S3: check_and_track_storage(conn, schema, family_id, file_size_bytes)
 Возвращает (ok: bool, error_response: dict | None)
+
+Реестр объектов: вызвать ПОСЛЕ записи в S3: record_s3_object(conn, schema, key, size, family_id, ...)
+Пишет s3_object_ledger и инкрементально обновляет свёртки s3_usage_rollups
+(scope 'family' — по семье, 'prefix' — по '<bucket>:<первый сегмент ключа>').
 """
+import os
 import json
 
 # Лимиты в МБ по тарифам (fallback если БД недоступна)
@@ -33,13 +38,14 @@ def check_and_track_storage(conn, schema: str, family_id: str, file_size_bytes:
     """
     Проверяет лимит S3 и увеличивает счётчик после успешной загрузки.
     Возвращает (True, None) если ok, (False, error_dict) если лимит превышен.
-    Мягкий режим: если учёт падает — файл загружается.
+    Использует мягкую логику: если учёт падает — файл всё равно загружается.
     """
     file_size_mb = file_size_bytes / (1024 * 1024)
 
     try:
         cur = conn.cursor()
 
+        # 1. Тариф семьи
         cur.execute(f"""
             SELECT COALESCE(plan_type, 'free_2026') AS plan_type
             FROM {schema}.subscriptions
@@ -48,12 +54,19 @@ def check_and_track_storage(conn, schema: str, family_id: str, file_size_bytes:
         """, (family_id,))
         sub = cur.fetchone()
         plan_type = sub[0] if sub else 'free_2026'
+
         limit_mb = STORAGE_LIMITS_MB.get(plan_type, DEFAULT_FREE_LIMIT_MB)
 
-        cur.execute(f"SELECT file_storage_used_mb FROM {schema}.subscription_usage WHERE family_id = %s", (family_id,))
+        # 2. Текущее использование
+        cur.execute(f"""
+            SELECT file_storage_used_mb
+            FROM {schema}.subscription_usage
+            WHERE family_id = %s
+        """, (family_id,))
         row = cur.fetchone()
 
         if not row:
+            # Создать запись если нет
             cur.execute(f"""
                 INSERT INTO {schema}.subscription_usage
                   (family_id, file_storage_used_mb, ai_credits_used, ai_requests_used,
@@ -66,6 +79,7 @@ def check_and_track_storage(conn, schema: str, family_id: str, file_size_bytes:
         else:
             used_mb = float(row[0] or 0)
 
+        # 3. Проверить лимит
         if (used_mb + file_size_mb) > limit_mb:
             cur.close()
             available_mb = max(0.0, limit_mb - used_mb)
@@ -78,9 +92,11 @@ def check_and_track_storage(conn, schema: str, family_id: str, file_size_bytes:
                 'plan': plan_type,
             })
 
+        # 4. Обновить счётчик
         cur.execute(f"""
             UPDATE {schema}.subscription_usage
-            SET file_storage_used_mb = file_storage_used_mb + %s, updated_at = CURRENT_TIMESTAMP
+            SET file_storage_used_mb = file_storage_used_mb + %s,
+                updated_at = CURRENT_TIMESTAMP
             WHERE family_id = %s
         """, (round(file_size_mb, 4), family_id))
         conn.commit()
@@ -88,4 +104,120 @@ def check_and_track_storage(conn, schema: str, family_id: str, file_size_bytes:
         return True, None
 
     except Exception:
+        # Если учёт упал — не блокируем загрузку (мягкий режим)
         return True, None
+
+
+def track_storage_increase(conn, schema: str, family_id: str, file_size_bytes: int):
+    """Только увеличить счётчик (без проверки лимита). Для случаев где проверка уже пройдена."""
+    try:
+        file_size_mb = file_size_bytes / (1024 * 1024)
+        cur = conn.cursor()
+        cur.execute(f"""
+            UPDATE {schema}.subscription_usage
+            SET file_storage_used_mb = file_storage_used_mb + %s,
+                updated_at = CURRENT_TIMESTAMP
+            WHERE family_id = %s
+        """, (round(file_size_mb, 4), family_id))
+        conn.commit()
+        cur.close()
+    except Exception:
+        pass
+
+
+def s3_key_prefix(s3_key: str) -> str:
+    """Первый сегмент ключа: 'recipes/2024/x.jpg' -> 'recipes'."""
+    return s3_key.split('/', 1)[0] if '/' in s3_key else ''
+
+
+def record_s3_object(conn, schema: str, s3_key: str, size_bytes: int, family_id=None,
+                     content_type=None, source=None, bucket: str = 'files') -> None:
+    """
+    Записывает объект в реестр и одним запросом сдвигает свёртки семьи и префикса.
+    Перезапись того же ключа учитывает разницу размеров. Мягко: ошибки не пробрасываются.
+    conn=None — открывается своё соединение.
+    """
+    own_conn = conn is None
+    try:
+        if own_conn:
+            import psycopg2
+            conn = psycopg2.connect(os.environ['DATABASE_URL'])
+        cur = conn.cursor()
+        cur.execute(f"""
+            WITH prev AS (
+                SELECT size_bytes FROM {schema}.s3_object_ledger
+                WHERE bucket = %(bucket)s AND s3_key = %(key)s AND deleted_at IS NULL
+            ),
+            upsert AS (
+                INSERT INTO {schema}.s3_object_ledger
+                    (bucket, s3_key, family_id, prefix, size_bytes, content_type, source)
+                VALUES (%(bucket)s, %(key)s, %(family_id)s, %(prefix)s, %(size)s, %(content_type)s, %(source)s)
+                ON CONFLICT (bucket, s3_key) DO UPDATE SET
+                    family_id = COALESCE(EXCLUDED.family_id, {schema}.s3_object_ledger.family_id),
+                    size_bytes = EXCLUDED.size_bytes,
+                    content_type = EXCLUDED.content_type,
+                    deleted_at = NULL
+                RETURNING family_id, prefix, size_bytes
+            ),
+            delta AS (
+                SELECT u.family_id, u.prefix,
+                       u.size_bytes - COALESCE((SELECT size_bytes FROM prev), 0) AS bytes,
+                       CASE WHEN EXISTS (SELECT 1 FROM prev) THEN 0 ELSE 1 END AS objects
+                FROM upsert u
+            )
+            INSERT INTO {schema}.s3_usage_rollups (scope, scope_id, bytes, objects, updated_at)
+            SELECT 'family', family_id::text, bytes, objects, NOW() FROM delta WHERE family_id IS NOT NULL
+            UNION ALL
+            SELECT 'prefix', %(bucket)s || ':' || prefix, bytes, objects, NOW() FROM delta
+            ON CONFLICT (scope, scope_id) DO UPDATE SET
+                bytes = {schema}.s3_usage_rollups.bytes + EXCLUDED.bytes,
+                objects = {schema}.s3_usage_rollups.objects + EXCLUDED.objects,
+                updated_at = NOW()
+        """, {
+            'bucket': bucket, 'key': s3_key, 'family_id': family_id,
+            'prefix': s3_key_prefix(s3_key), 'size': int(size_bytes),
+            'content_type': content_type, 'source': source,
+        })
+        conn.commit()
+        cur.close()
+    except Exception as e:
+        print(f"[s3_limit_utils] record_s3_object failed: {e}")
+        try:
+            conn.rollback()
+        except Exception:
+            pass
+    finally:
+        if own_conn and conn is not None:
+            try:
+                conn.close()
+            except Exception:
+                pass
+
+
+def mark_s3_object_deleted(conn, schema: str, s3_key: str, bucket: str = 'files') -> None:
+    """Помечает объект удалённым и вычитает его из свёрток. Вызывать после delete_object."""
+    try:
+        cur = conn.cursor()
+        cur.execute(f"""
+            WITH del AS (
+                UPDATE {schema}.s3_object_ledger SET deleted_at = NOW()
+                WHERE bucket = %(bucket)s AND s3_key = %(key)s AND deleted_at IS NULL
+                RETURNING family_id, prefix, size_bytes
+            )
+            INSERT INTO {schema}.s3_usage_rollups (scope, scope_id, bytes, objects, updated_at)
+            SELECT 'family', family_id::text, -size_bytes, -1, NOW() FROM del WHERE family_id IS NOT NULL
+            UNION ALL
+            SELECT 'prefix', %(bucket)s || ':' || prefix, -size_bytes, -1, NOW() FROM del
+            ON CONFLICT (scope, scope_id) DO UPDATE SET
+                bytes = {schema}.s3_usage_rollups.bytes + EXCLUDED.bytes,
+                objects = {schema}.s3_usage_rollups.objects + EXCLUDED.objects,
+                updated_at = NOW()
+        """, {'bucket': bucket, 'key': s3_key})
+        conn.commit()
+        cur.close()
+    except Exception as e:
+        print(f"[s3_limit_utils] mark_s3_object_deleted failed: {e}")
+        try:
+            conn.rollback()
+        except Exception:
+            pass
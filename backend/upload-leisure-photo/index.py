@@ -5,7 +5,8 @@ import boto3
 from datetime import datetime
 import psycopg2
 from psycopg2.extras import RealDictCursor
-from s3_limit_utils import check_and_track_storage
+from s3_limit_utils import check_and_track_storage, record_s3_object
+from image_derivative_utils import enqueue_derivatives
 
 MAX_FILE_SIZE_BYTES = 10 * 1024 * 1024  # 10 MB
 SCHEMA = os.environ.get('MAIN_DB_SCHEMA', 't_p5815085_family_assistant_pro')
@@ -101,6 +102,10 @@ def handler(event: dict, context) -> dict:
             result = cur.fetchone()
             conn.commit()
 
+        record_s3_object(conn, SCHEMA, key, len(photo_data), family_id=family_id,
+                         content_type='image/jpeg', source='upload-leisure-photo')
+        # WebP-превью строит image-optimizer в фоне
+        enqueue_derivatives(cdn_url, family_id=family_id, conn=conn, schema=SCHEMA)
         conn.close()
         
         return {
@@ -5,8 +5,10 @@ from typing import Dict, Any
 import base64
 from datetime import datetime
 import uuid
+from s3_limit_utils import record_s3_object
 
 MAX_FILE_SIZE_BYTES = 10 * 1024 * 1024  # 10 MB
+SCHEMA = 't_p5815085_family_assistant_pro'
 
 
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
@@ -120,6 +122,9 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     )
     
     file_url = f"https://storage.yandexcloud.net/{bucket_name}/{unique_filename}"
+
+    record_s3_object(None, SCHEMA, unique_filename, len(file_data), content_type=file_type,
+                     source='upload-medical-file', bucket=bucket_name)
     document_id = f"doc_{timestamp}_{random_str}"
     
     return {
@@ -0,0 +1,32 @@
+-- Счётчик непрочитанных на (диалог, участник): список чатов читает его одним запросом
+-- вместо COUNT(*) по family_chat_messages на каждый диалог.
+-- Строка без last_read_at = участник ещё ни разу не открывал диалог.
+ALTER TABLE t_p5815085_family_assistant_pro.chat_reads
+    ADD COLUMN IF NOT EXISTS unread_count INTEGER NOT NULL DEFAULT 0;
+
+ALTER TABLE t_p5815085_family_assistant_pro.chat_reads
+    ALTER COLUMN last_read_at DROP NOT NULL;
+
+-- Бэкфилл для уже открывавшихся диалогов
+UPDATE t_p5815085_family_assistant_pro.chat_reads r
+SET unread_count = (
+    SELECT COUNT(*) FROM t_p5815085_family_assistant_pro.family_chat_messages m
+    WHERE m.conversation_id = r.conversation_id
+      AND m.created_at > r.last_read_at
+      AND m.sender_member_id != r.member_id
+);
+
+-- Бэкфилл для участников, которые ни разу не открывали диалог с сообщениями
+INSERT INTO t_p5815085_family_assistant_pro.chat_reads (conversation_id, member_id, last_read_at, unread_count)
+SELECT m.conversation_id, fm.id, NULL, COUNT(*)
+FROM t_p5815085_family_assistant_pro.family_chat_messages m
+JOIN t_p5815085_family_assistant_pro.chat_conversations c ON c.id = m.conversation_id
+JOIN t_p5815085_family_assistant_pro.family_members fm
+  ON fm.family_id = c.family_id
+ AND (c.kind = 'family' OR fm.id IN (c.member_a_id, c.member_b_id))
+WHERE m.sender_member_id != fm.id
+GROUP BY m.conversation_id, fm.id
+ON CONFLICT (conversation_id, member_id) DO NOTHING;
+
+CREATE INDEX IF NOT EXISTS idx_fam_chat_msg_conv_created
+    ON t_p5815085_family_assistant_pro.family_chat_messages (conversation_id, created_at);
@@ -0,0 +1,29 @@
+-- Водяной знак диалога для дешёвого polling: клиент шлёт after_seq, функция сравнивает
+-- его с chat_conversations.last_seq и не трогает family_chat_messages, если нового нет.
+ALTER TABLE t_p5815085_family_assistant_pro.chat_conversations
+    ADD COLUMN IF NOT EXISTS last_seq BIGINT NOT NULL DEFAULT 0,
+    ADD COLUMN IF NOT EXISTS last_message_at TIMESTAMP NULL;
+
+ALTER TABLE t_p5815085_family_assistant_pro.family_chat_messages
+    ADD COLUMN IF NOT EXISTS seq BIGINT NULL;
+
+-- Бэкфилл: порядковый номер сообщения внутри диалога
+UPDATE t_p5815085_family_assistant_pro.family_chat_messages m
+SET seq = n.rn
+FROM (
+    SELECT id, ROW_NUMBER() OVER (PARTITION BY conversation_id ORDER BY created_at, id) AS rn
+    FROM t_p5815085_family_assistant_pro.family_chat_messages
+) n
+WHERE n.id = m.id AND m.seq IS NULL;
+
+UPDATE t_p5815085_family_assistant_pro.chat_conversations c
+SET last_seq = s.max_seq, last_message_at = s.max_created
+FROM (
+    SELECT conversation_id, MAX(seq) AS max_seq, MAX(created_at) AS max_created
+    FROM t_p5815085_family_assistant_pro.family_chat_messages
+    GROUP BY conversation_id
+) s
+WHERE s.conversation_id = c.id;
+
+CREATE UNIQUE INDEX IF NOT EXISTS uq_fam_chat_msg_conv_seq
+    ON t_p5815085_family_assistant_pro.family_chat_messages (conversation_id, seq);
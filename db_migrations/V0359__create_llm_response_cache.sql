@@ -0,0 +1,19 @@
+-- Кэш ответов YandexGPT (backend/llm_cache_utils.py).
+-- Ключ — sha256 от (modelUri, checksum системного промпта, messages, temperature, maxTokens).
+CREATE TABLE IF NOT EXISTS t_p5815085_family_assistant_pro.llm_response_cache (
+    cache_key      VARCHAR(64)  PRIMARY KEY,
+    function_name  VARCHAR(64)  NOT NULL,
+    model_uri      VARCHAR(256) NULL,
+    response_text  TEXT         NOT NULL,
+    created_at     TIMESTAMP    NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    expires_at     TIMESTAMP    NOT NULL,
+    hit_count      INTEGER      NOT NULL DEFAULT 0,
+    miss_count     INTEGER      NOT NULL DEFAULT 0,
+    last_hit_at    TIMESTAMP    NULL
+);
+
+CREATE INDEX IF NOT EXISTS idx_llm_response_cache_function
+    ON t_p5815085_family_assistant_pro.llm_response_cache (function_name);
+
+CREATE INDEX IF NOT EXISTS idx_llm_response_cache_expires
+    ON t_p5815085_family_assistant_pro.llm_response_cache (expires_at);
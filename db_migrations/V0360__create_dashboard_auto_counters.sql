@@ -0,0 +1,11 @@
+-- Предрасчитанные счётчики auto-прогресса дашборда: (владелец, таблица) -> COUNT(*).
+-- owner_field = 'user_id' | 'family_id', owner_id — значение в текстовом виде.
+-- Дашборд читает их одним JOIN с dashboard_sections и пересчитывает только устаревшие.
+CREATE TABLE IF NOT EXISTS t_p5815085_family_assistant_pro.dashboard_auto_counters (
+    owner_field   VARCHAR(16)  NOT NULL,
+    owner_id      VARCHAR(128) NOT NULL,
+    table_name    VARCHAR(64)  NOT NULL,
+    cnt           INTEGER      NOT NULL DEFAULT 0,
+    refreshed_at  TIMESTAMP    NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (owner_field, owner_id, table_name)
+);
@@ -0,0 +1,38 @@
+-- Delta-синхронизация family-data (GET ?since=<sync_token>): версия строки —
+-- COALESCE(updated_at, created_at). Добавляем updated_at туда, где его нет,
+-- и индексы (family_id, updated_at) под выборку изменённых строк.
+
+ALTER TABLE t_p5815085_family_assistant_pro.family_members ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP;
+ALTER TABLE t_p5815085_family_assistant_pro.tasks ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP;
+ALTER TABLE t_p5815085_family_assistant_pro.children_profiles ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP;
+ALTER TABLE t_p5815085_family_assistant_pro.test_results ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP;
+ALTER TABLE t_p5815085_family_assistant_pro.calendar_events ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP;
+ALTER TABLE t_p5815085_family_assistant_pro.family_values ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP;
+ALTER TABLE t_p5815085_family_assistant_pro.traditions ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP;
+ALTER TABLE t_p5815085_family_assistant_pro.blog_posts ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP;
+ALTER TABLE t_p5815085_family_assistant_pro.family_album ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP;
+ALTER TABLE t_p5815085_family_assistant_pro.family_tree ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP;
+ALTER TABLE t_p5815085_family_assistant_pro.chat_messages ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP;
+
+CREATE INDEX IF NOT EXISTS idx_family_members_family_updated
+    ON t_p5815085_family_assistant_pro.family_members (family_id, updated_at);
+CREATE INDEX IF NOT EXISTS idx_tasks_family_updated
+    ON t_p5815085_family_assistant_pro.tasks (family_id, updated_at);
+CREATE INDEX IF NOT EXISTS idx_children_profiles_family_updated
+    ON t_p5815085_family_assistant_pro.children_profiles (family_id, updated_at);
+CREATE INDEX IF NOT EXISTS idx_calendar_events_family_updated
+    ON t_p5815085_family_assistant_pro.calendar_events (family_id, updated_at);
+CREATE INDEX IF NOT EXISTS idx_family_values_family_updated
+    ON t_p5815085_family_assistant_pro.family_values (family_id, updated_at);
+CREATE INDEX IF NOT EXISTS idx_traditions_family_updated
+    ON t_p5815085_family_assistant_pro.traditions (family_id, updated_at);
+CREATE INDEX IF NOT EXISTS idx_blog_posts_family_updated
+    ON t_p5815085_family_assistant_pro.blog_posts (family_id, updated_at);
+CREATE INDEX IF NOT EXISTS idx_family_album_family_updated
+    ON t_p5815085_family_assistant_pro.family_album (family_id, updated_at);
+CREATE INDEX IF NOT EXISTS idx_family_tree_family_updated
+    ON t_p5815085_family_assistant_pro.family_tree (family_id, updated_at);
+CREATE INDEX IF NOT EXISTS idx_chat_messages_family_updated
+    ON t_p5815085_family_assistant_pro.chat_messages (family_id, updated_at);
+CREATE INDEX IF NOT EXISTS idx_test_results_child_updated
+    ON t_p5815085_family_assistant_pro.test_results (child_member_id, updated_at);
@@ -0,0 +1,20 @@
+-- Буферизованный подсчёт просмотров блога:
+-- public_blog_post_views — журнал событий (только INSERT), views_count пересчитывается
+-- периодической свёрткой журнала с дедупликацией по visitor_hash в окне.
+
+CREATE TABLE IF NOT EXISTS t_p5815085_family_assistant_pro.blog_view_fold_state (
+    id INTEGER PRIMARY KEY DEFAULT 1,
+    last_view_id INTEGER NOT NULL DEFAULT 0,
+    last_folded_at TIMESTAMP,
+    last_result JSONB,
+    CHECK (id = 1)
+);
+
+-- Уже накопленные события учтены в views_count синхронным счётчиком — начинаем свёртку после них
+INSERT INTO t_p5815085_family_assistant_pro.blog_view_fold_state (id, last_view_id, last_folded_at)
+SELECT 1, COALESCE(MAX(id), 0), NOW() FROM t_p5815085_family_assistant_pro.public_blog_post_views
+ON CONFLICT (id) DO NOTHING;
+
+-- Поиск уже учтённого просмотра того же посетителя в окне
+CREATE INDEX IF NOT EXISTS idx_pbpv_post_visitor
+    ON t_p5815085_family_assistant_pro.public_blog_post_views(post_id, visitor_hash, viewed_at);
@@ -0,0 +1,3 @@
+-- Keyset-пагинация ленты блога: ORDER BY published_at DESC, id DESC
+CREATE INDEX IF NOT EXISTS idx_pbp_status_published_id
+    ON t_p5815085_family_assistant_pro.public_blog_posts(status, published_at DESC, id DESC);
@@ -0,0 +1,16 @@
+-- Прямая загрузка файлов в S3 по presigned POST (upload-file action=presign/complete):
+-- на presign резервируется заявленный размер, на complete фиксируется фактический из S3.
+CREATE TABLE IF NOT EXISTS t_p5815085_family_assistant_pro.s3_upload_intents (
+    s3_key VARCHAR(500) PRIMARY KEY,
+    family_id UUID,
+    declared_size BIGINT NOT NULL,
+    actual_size BIGINT,
+    content_type VARCHAR(100),
+    status VARCHAR(20) NOT NULL DEFAULT 'pending',
+    created_at TIMESTAMP DEFAULT NOW(),
+    completed_at TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_s3_upload_intents_pending
+    ON t_p5815085_family_assistant_pro.s3_upload_intents(created_at)
+    WHERE status = 'pending';
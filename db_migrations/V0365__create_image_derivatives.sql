@@ -0,0 +1,17 @@
+-- Очередь и реестр WebP-превью загруженных фото (image_derivative_utils / image-optimizer).
+-- variants: {"320": "<cdn url>", "640": "...", "1280": "..."}
+CREATE TABLE IF NOT EXISTS t_p5815085_family_assistant_pro.image_derivatives (
+    source_url TEXT PRIMARY KEY,
+    family_id UUID,
+    widths JSONB NOT NULL DEFAULT '[320, 640, 1280]'::jsonb,
+    variants JSONB,
+    status VARCHAR(20) NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    last_error TEXT,
+    created_at TIMESTAMP DEFAULT NOW(),
+    updated_at TIMESTAMP DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS idx_image_derivatives_pending
+    ON t_p5815085_family_assistant_pro.image_derivatives(created_at)
+    WHERE status IN ('pending', 'processing');
@@ -0,0 +1,30 @@
+-- Реестр объектов S3 и инкрементальные свёртки объёма (s3_limit_utils.record_s3_object).
+-- storage-stats читает свёртки вместо обхода бакета, сверка с S3 — storage-stats ?action=reconcile.
+CREATE TABLE IF NOT EXISTS t_p5815085_family_assistant_pro.s3_object_ledger (
+    bucket VARCHAR(63) NOT NULL DEFAULT 'files',
+    s3_key VARCHAR(1024) NOT NULL,
+    family_id UUID,
+    prefix VARCHAR(100) NOT NULL DEFAULT '',
+    size_bytes BIGINT NOT NULL DEFAULT 0,
+    content_type VARCHAR(100),
+    source VARCHAR(50),
+    created_at TIMESTAMP DEFAULT NOW(),
+    deleted_at TIMESTAMP,
+    PRIMARY KEY (bucket, s3_key)
+);
+
+CREATE INDEX IF NOT EXISTS idx_s3_object_ledger_family
+    ON t_p5815085_family_assistant_pro.s3_object_ledger(family_id) WHERE deleted_at IS NULL;
+CREATE INDEX IF NOT EXISTS idx_s3_object_ledger_prefix
+    ON t_p5815085_family_assistant_pro.s3_object_ledger(bucket, prefix) WHERE deleted_at IS NULL;
+
+-- scope: 'family' (scope_id = family_id) | 'prefix' (scope_id = '<bucket>:<prefix>')
+CREATE TABLE IF NOT EXISTS t_p5815085_family_assistant_pro.s3_usage_rollups (
+    scope VARCHAR(20) NOT NULL,
+    scope_id VARCHAR(200) NOT NULL,
+    bytes BIGINT NOT NULL DEFAULT 0,
+    objects INTEGER NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP DEFAULT NOW(),
+    reconciled_at TIMESTAMP,
+    PRIMARY KEY (scope, scope_id)
+);
@@ -0,0 +1,24 @@
+-- Фоновые задания экспорта данных семьи (data-export action=start/run/status):
+-- строки читаются серверными курсорами и пишутся в S3 частями, прогресс — rows_done / rows_total.
+CREATE TABLE IF NOT EXISTS t_p5815085_family_assistant_pro.data_export_jobs (
+    id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+    user_id UUID NOT NULL,
+    family_id UUID NOT NULL,
+    format VARCHAR(10) NOT NULL DEFAULT 'csv',
+    status VARCHAR(20) NOT NULL DEFAULT 'queued',
+    rows_total INTEGER NOT NULL DEFAULT 0,
+    rows_done INTEGER NOT NULL DEFAULT 0,
+    s3_key VARCHAR(500),
+    size_bytes BIGINT,
+    error TEXT,
+    created_at TIMESTAMP DEFAULT NOW(),
+    started_at TIMESTAMP,
+    finished_at TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_data_export_jobs_user
+    ON t_p5815085_family_assistant_pro.data_export_jobs(user_id, created_at DESC);
+
+CREATE INDEX IF NOT EXISTS idx_data_export_jobs_queued
+    ON t_p5815085_family_assistant_pro.data_export_jobs(created_at)
+    WHERE status IN ('queued', 'running');
@@ -0,0 +1,3 @@
+-- Время по этапам обработки команды Алисы (resolve_user_ms / route_ms / total_ms)
+ALTER TABLE t_p5815085_family_assistant_pro.alice_commands_log
+    ADD COLUMN IF NOT EXISTS stage_timings JSONB;
@@ -0,0 +1,25 @@
+-- Асинхронные операции YandexGPT / YandexART из generate-diet-plan:
+-- check читает строку отсюда, в operation.api ходит не чаще next_poll_at,
+-- результат (готовый ответ клиенту) сохраняется один раз при переходе processing → done/error.
+CREATE TABLE IF NOT EXISTS t_p5815085_family_assistant_pro.ai_jobs (
+    operation_id VARCHAR(100) PRIMARY KEY,
+    kind VARCHAR(20) NOT NULL,
+    user_id UUID,
+    family_id UUID,
+    request JSONB,
+    status VARCHAR(20) NOT NULL DEFAULT 'processing',
+    result JSONB,
+    plan_id UUID,
+    poll_count INTEGER NOT NULL DEFAULT 0,
+    next_poll_at TIMESTAMP DEFAULT NOW(),
+    created_at TIMESTAMP DEFAULT NOW(),
+    updated_at TIMESTAMP DEFAULT NOW(),
+    completed_at TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_ai_jobs_processing
+    ON t_p5815085_family_assistant_pro.ai_jobs(created_at)
+    WHERE status = 'processing';
+
+CREATE INDEX IF NOT EXISTS idx_ai_jobs_user
+    ON t_p5815085_family_assistant_pro.ai_jobs(user_id, created_at DESC);
@@ -0,0 +1,6 @@
+-- Поиск продуктов в nutrition (search_products): подстрока/нечёткое — триграммы, префикс — text_pattern_ops
+CREATE INDEX IF NOT EXISTS idx_nutrition_products_name_trgm
+    ON nutrition_products USING GIN (LOWER(name) gin_trgm_ops);
+
+CREATE INDEX IF NOT EXISTS idx_nutrition_products_name_prefix
+    ON nutrition_products (LOWER(name) text_pattern_ops);
@@ -0,0 +1,61 @@
+-- Дневные свёртки питания, веса и активности: одна строка на (субъект, день).
+-- subject_id: member_id (UUID) для дневника питания nutrition, 'legacy:<user_id>' для записей без member_id,
+-- user_id сессии для diet-progress (вес, активность). Поля питания и диеты не пересекаются,
+-- поэтому сумма калорий за день по всем строкам равна сумме по food_diary.
+-- Обновляются инкрементально: nutrition add/update/delete_diary, diet-progress log_weight/log_activity/save_plan.
+CREATE TABLE IF NOT EXISTS daily_health_rollups (
+    subject_id VARCHAR(64) NOT NULL,
+    day DATE NOT NULL,
+    calories DECIMAL(10, 2) NOT NULL DEFAULT 0,
+    protein DECIMAL(10, 2) NOT NULL DEFAULT 0,
+    fats DECIMAL(10, 2) NOT NULL DEFAULT 0,
+    carbs DECIMAL(10, 2) NOT NULL DEFAULT 0,
+    diary_entries INTEGER NOT NULL DEFAULT 0,
+    weight_first_kg DECIMAL(5, 2),
+    weight_last_kg DECIMAL(5, 2),
+    weigh_ins INTEGER NOT NULL DEFAULT 0,
+    last_weight_at TIMESTAMP,
+    last_wellbeing TEXT,
+    steps INTEGER NOT NULL DEFAULT 0,
+    exercise_min INTEGER NOT NULL DEFAULT 0,
+    calories_burned INTEGER NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP DEFAULT NOW(),
+    PRIMARY KEY (subject_id, day)
+);
+
+CREATE INDEX IF NOT EXISTS idx_daily_health_rollups_day ON daily_health_rollups(day);
+
+-- Заполнение по истории
+INSERT INTO daily_health_rollups (subject_id, day, calories, protein, fats, carbs, diary_entries)
+SELECT COALESCE(member_id::text, 'legacy:' || user_id::text), date,
+       COALESCE(SUM(calories), 0), COALESCE(SUM(protein), 0), COALESCE(SUM(fats), 0), COALESCE(SUM(carbs), 0),
+       COUNT(*)
+FROM food_diary
+GROUP BY 1, 2
+ON CONFLICT (subject_id, day) DO NOTHING;
+
+INSERT INTO daily_health_rollups (subject_id, day, weight_first_kg, weight_last_kg, weigh_ins, last_weight_at, last_wellbeing)
+SELECT user_id::text, measured_at::date,
+       (ARRAY_AGG(weight_kg ORDER BY measured_at ASC))[1],
+       (ARRAY_AGG(weight_kg ORDER BY measured_at DESC))[1],
+       COUNT(*),
+       MAX(measured_at),
+       (ARRAY_AGG(wellbeing ORDER BY measured_at DESC))[1]
+FROM diet_weight_log
+GROUP BY 1, 2
+ON CONFLICT (subject_id, day) DO UPDATE SET
+    weight_first_kg = EXCLUDED.weight_first_kg,
+    weight_last_kg = EXCLUDED.weight_last_kg,
+    weigh_ins = EXCLUDED.weigh_ins,
+    last_weight_at = EXCLUDED.last_weight_at,
+    last_wellbeing = EXCLUDED.last_wellbeing;
+
+INSERT INTO daily_health_rollups (subject_id, day, steps, exercise_min, calories_burned)
+SELECT user_id::text, log_date,
+       COALESCE(SUM(steps), 0), COALESCE(SUM(exercise_duration_min), 0), COALESCE(SUM(calories_burned), 0)
+FROM diet_activity_log
+GROUP BY 1, 2
+ON CONFLICT (subject_id, day) DO UPDATE SET
+    steps = EXCLUDED.steps,
+    exercise_min = EXCLUDED.exercise_min,
+    calories_burned = EXCLUDED.calories_burned;
@@ -0,0 +1,5 @@
+-- Dev Agent: индексы для копирования неизменённых файлов из предыдущего снапшота
+-- (INSERT ... SELECT по file_id / source_file_id в dev-agent-indexer ingest_files).
+CREATE INDEX IF NOT EXISTS idx_dasym_file ON t_p5815085_family_assistant_pro.dev_agent_symbols(file_id);
+CREATE INDEX IF NOT EXISTS idx_daroute_source_file ON t_p5815085_family_assistant_pro.dev_agent_routes(source_file_id);
+CREATE INDEX IF NOT EXISTS idx_dafile_snap_sha ON t_p5815085_family_assistant_pro.dev_agent_files(snapshot_id, sha256);
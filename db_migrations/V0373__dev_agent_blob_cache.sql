@@ -0,0 +1,10 @@
+-- Dev Agent: кэш содержимого GitHub-блобов по blob sha (содержимое по sha не меняется).
+-- dev-agent-indexer берёт отсюда неизменённые файлы вместо повторной загрузки из GitHub API.
+CREATE TABLE IF NOT EXISTS t_p5815085_family_assistant_pro.dev_agent_blob_cache (
+  blob_sha TEXT PRIMARY KEY,
+  content TEXT NOT NULL,
+  size_bytes INT NOT NULL DEFAULT 0,
+  created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+  last_used_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+CREATE INDEX IF NOT EXISTS idx_dablob_last_used ON t_p5815085_family_assistant_pro.dev_agent_blob_cache(last_used_at);
@@ -0,0 +1,20 @@
+-- Dev Agent: ранжированный поиск по коду (dev-agent-admin search / citations).
+-- search_tsv: текст чанка + он же с разрезанным camelCase ('useDietQuiz' → 'usedietquiz use diet quiz'),
+-- конфиг 'simple' — без стемминга и стоп-слов, идентификаторы остаются как есть.
+ALTER TABLE t_p5815085_family_assistant_pro.dev_agent_code_chunks
+    ADD COLUMN IF NOT EXISTS search_tsv tsvector
+    GENERATED ALWAYS AS (
+        to_tsvector('simple',
+            chunk_text || ' ' ||
+            regexp_replace(chunk_text, '([a-zа-яё0-9])([A-ZА-ЯЁ])', '\1 \2', 'g'))
+    ) STORED;
+
+CREATE INDEX IF NOT EXISTS idx_dachunk_search_tsv
+    ON t_p5815085_family_assistant_pro.dev_agent_code_chunks USING GIN (search_tsv);
+
+-- Пути и имена символов: подстрока (LIKE) и нечёткое совпадение (<%) — триграммы
+CREATE INDEX IF NOT EXISTS idx_dafile_path_trgm
+    ON t_p5815085_family_assistant_pro.dev_agent_files USING GIN (lower(path) gin_trgm_ops);
+
+CREATE INDEX IF NOT EXISTS idx_dasym_name_trgm
+    ON t_p5815085_family_assistant_pro.dev_agent_symbols USING GIN (lower(symbol_name) gin_trgm_ops);
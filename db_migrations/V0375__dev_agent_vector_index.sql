@@ -0,0 +1,17 @@
+-- Dev Agent: локальный векторный индекс чанков кода.
+-- embedding — hashed n-gram вектор (code_embedding.py, EMBED_DIM = 256, L2 = 1), считается индексатором;
+-- ivf_list — номер IVF-списка (k-means по векторам снапшота), центроиды — в dev_agent_vector_lists.
+ALTER TABLE t_p5815085_family_assistant_pro.dev_agent_code_chunks ADD COLUMN IF NOT EXISTS embedding REAL[];
+ALTER TABLE t_p5815085_family_assistant_pro.dev_agent_code_chunks ADD COLUMN IF NOT EXISTS ivf_list INT;
+
+CREATE INDEX IF NOT EXISTS idx_dachunk_snap_ivf
+    ON t_p5815085_family_assistant_pro.dev_agent_code_chunks(snapshot_id, ivf_list);
+
+CREATE TABLE IF NOT EXISTS t_p5815085_family_assistant_pro.dev_agent_vector_lists (
+  snapshot_id BIGINT NOT NULL REFERENCES t_p5815085_family_assistant_pro.dev_agent_repo_snapshots(id),
+  list_no INT NOT NULL,
+  centroid REAL[] NOT NULL,
+  size INT NOT NULL DEFAULT 0,
+  created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+  PRIMARY KEY (snapshot_id, list_no)
+);
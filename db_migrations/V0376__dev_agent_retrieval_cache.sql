@@ -0,0 +1,13 @@
+-- Dev Agent: кэш retrieval (allowed citations) для chat.send_llm и review.file.
+-- Ключ — снапшот + sha256(вид | нормализованный запрос или file_path | max_chunks).
+-- Записи неактивных снапшотов удаляет dev-agent-indexer при активации другого снапшота.
+CREATE TABLE IF NOT EXISTS t_p5815085_family_assistant_pro.dev_agent_retrieval_cache (
+  snapshot_id BIGINT NOT NULL REFERENCES t_p5815085_family_assistant_pro.dev_agent_repo_snapshots(id),
+  cache_key TEXT NOT NULL,
+  kind TEXT NOT NULL,
+  payload JSONB NOT NULL,
+  hits INT NOT NULL DEFAULT 0,
+  created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+  last_hit_at TIMESTAMPTZ,
+  PRIMARY KEY (snapshot_id, cache_key)
+);
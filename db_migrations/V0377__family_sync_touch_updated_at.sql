@@ -0,0 +1,68 @@
+-- Delta-синхронизация family-data (V0361) сравнивает версии по
+-- COALESCE(updated_at, created_at), но большинство UPDATE не трогают updated_at
+-- (например, начисление очков в tasks: UPDATE family_members SET points ...).
+-- Триггер BEFORE UPDATE проставляет updated_at = NOW() для всех коллекций SYNC_COLLECTIONS,
+-- чтобы изменение без вставки/удаления попадало в delta.
+
+CREATE OR REPLACE FUNCTION t_p5815085_family_assistant_pro.touch_updated_at()
+RETURNS TRIGGER AS $$
+BEGIN
+    NEW.updated_at = NOW();
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_family_members_touch_updated_at ON t_p5815085_family_assistant_pro.family_members;
+CREATE TRIGGER trg_family_members_touch_updated_at
+    BEFORE UPDATE ON t_p5815085_family_assistant_pro.family_members
+    FOR EACH ROW EXECUTE FUNCTION t_p5815085_family_assistant_pro.touch_updated_at();
+
+DROP TRIGGER IF EXISTS trg_tasks_touch_updated_at ON t_p5815085_family_assistant_pro.tasks;
+CREATE TRIGGER trg_tasks_touch_updated_at
+    BEFORE UPDATE ON t_p5815085_family_assistant_pro.tasks
+    FOR EACH ROW EXECUTE FUNCTION t_p5815085_family_assistant_pro.touch_updated_at();
+
+DROP TRIGGER IF EXISTS trg_children_profiles_touch_updated_at ON t_p5815085_family_assistant_pro.children_profiles;
+CREATE TRIGGER trg_children_profiles_touch_updated_at
+    BEFORE UPDATE ON t_p5815085_family_assistant_pro.children_profiles
+    FOR EACH ROW EXECUTE FUNCTION t_p5815085_family_assistant_pro.touch_updated_at();
+
+DROP TRIGGER IF EXISTS trg_test_results_touch_updated_at ON t_p5815085_family_assistant_pro.test_results;
+CREATE TRIGGER trg_test_results_touch_updated_at
+    BEFORE UPDATE ON t_p5815085_family_assistant_pro.test_results
+    FOR EACH ROW EXECUTE FUNCTION t_p5815085_family_assistant_pro.touch_updated_at();
+
+DROP TRIGGER IF EXISTS trg_calendar_events_touch_updated_at ON t_p5815085_family_assistant_pro.calendar_events;
+CREATE TRIGGER trg_calendar_events_touch_updated_at
+    BEFORE UPDATE ON t_p5815085_family_assistant_pro.calendar_events
+    FOR EACH ROW EXECUTE FUNCTION t_p5815085_family_assistant_pro.touch_updated_at();
+
+DROP TRIGGER IF EXISTS trg_family_values_touch_updated_at ON t_p5815085_family_assistant_pro.family_values;
+CREATE TRIGGER trg_family_values_touch_updated_at
+    BEFORE UPDATE ON t_p5815085_family_assistant_pro.family_values
+    FOR EACH ROW EXECUTE FUNCTION t_p5815085_family_assistant_pro.touch_updated_at();
+
+DROP TRIGGER IF EXISTS trg_traditions_touch_updated_at ON t_p5815085_family_assistant_pro.traditions;
+CREATE TRIGGER trg_traditions_touch_updated_at
+    BEFORE UPDATE ON t_p5815085_family_assistant_pro.traditions
+    FOR EACH ROW EXECUTE FUNCTION t_p5815085_family_assistant_pro.touch_updated_at();
+
+DROP TRIGGER IF EXISTS trg_blog_posts_touch_updated_at ON t_p5815085_family_assistant_pro.blog_posts;
+CREATE TRIGGER trg_blog_posts_touch_updated_at
+    BEFORE UPDATE ON t_p5815085_family_assistant_pro.blog_posts
+    FOR EACH ROW EXECUTE FUNCTION t_p5815085_family_assistant_pro.touch_updated_at();
+
+DROP TRIGGER IF EXISTS trg_family_album_touch_updated_at ON t_p5815085_family_assistant_pro.family_album;
+CREATE TRIGGER trg_family_album_touch_updated_at
+    BEFORE UPDATE ON t_p5815085_family_assistant_pro.family_album
+    FOR EACH ROW EXECUTE FUNCTION t_p5815085_family_assistant_pro.touch_updated_at();
+
+DROP TRIGGER IF EXISTS trg_family_tree_touch_updated_at ON t_p5815085_family_assistant_pro.family_tree;
+CREATE TRIGGER trg_family_tree_touch_updated_at
+    BEFORE UPDATE ON t_p5815085_family_assistant_pro.family_tree
+    FOR EACH ROW EXECUTE FUNCTION t_p5815085_family_assistant_pro.touch_updated_at();
+
+DROP TRIGGER IF EXISTS trg_chat_messages_touch_updated_at ON t_p5815085_family_assistant_pro.chat_messages;
+CREATE TRIGGER trg_chat_messages_touch_updated_at
+    BEFORE UPDATE ON t_p5815085_family_assistant_pro.chat_messages
+    FOR EACH ROW EXECUTE FUNCTION t_p5815085_family_assistant_pro.touch_updated_at();
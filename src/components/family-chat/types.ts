@@ -7,6 +7,7 @@ export interface ChatMsg {
   sender_avatar?: string | null;
   content: string;
   reactions: Record<string, number>;
+  seq?: number | null;
   created_at: string;
 }
 
@@ -5,6 +5,8 @@ import type { ChatMsg, ChatItem, MeInfo } from './types';
 
 const API = (func2url as Record<string, string>)['family-chat'];
 const POLL_INTERVAL_MS = 3000;
+// Long-poll: сервер держит запрос до LONG_POLL_WAIT_S секунд, пока не придёт новое сообщение
+const LONG_POLL_WAIT_S = 20;
 
 export function useFamilyChat() {
   const [me, setMe] = useState<MeInfo | null>(null);
@@ -19,6 +21,7 @@ export function useFamilyChat() {
   const scrollRef = useRef<HTMLDivElement | null>(null);
   const emojiBtnRef = useRef<HTMLButtonElement | null>(null);
   const lastTsRef = useRef<string | null>(null);
+  const lastSeqRef = useRef<number | null>(null);
   const activeChatRef = useRef<string | null>(null);
 
   const getToken = () => localStorage.getItem('authToken') || '';
@@ -69,6 +72,7 @@ export function useFamilyChat() {
       const msgs: ChatMsg[] = data.messages || [];
       setMessages(msgs);
       lastTsRef.current = msgs.length ? msgs[msgs.length - 1].created_at : null;
+      lastSeqRef.current = typeof data.last_seq === 'number' ? data.last_seq : null;
       apiPost({ action: 'mark_read', conversation_id: conversationId }).catch(() => {});
     } catch (e) {
       setError(e instanceof Error ? e.message : 'Не удалось загрузить сообщения');
@@ -80,11 +84,16 @@ export function useFamilyChat() {
     if (!convId) return;
     try {
       const after = lastTsRef.current;
-      const qs = after
-        ? `action=messages&conversation_id=${encodeURIComponent(convId)}&after=${encodeURIComponent(after)}`
-        : `action=messages&conversation_id=${encodeURIComponent(convId)}`;
+      const afterSeq = lastSeqRef.current;
+      const qs = afterSeq !== null
+        ? `action=messages&conversation_id=${encodeURIComponent(convId)}&after_seq=${afterSeq}&wait=${LONG_POLL_WAIT_S}`
+        : after
+          ? `action=messages&conversation_id=${encodeURIComponent(convId)}&after=${encodeURIComponent(after)}`
+          : `action=messages&conversation_id=${encodeURIComponent(convId)}`;
       const data = await apiGet(qs);
+      if (activeChatRef.current !== convId) return;
       const newMsgs: ChatMsg[] = data.messages || [];
+      if (typeof data.last_seq === 'number') lastSeqRef.current = data.last_seq;
       if (newMsgs.length > 0) {
         setMessages((prev) => {
           const ids = new Set(prev.map((m) => m.id));
@@ -107,6 +116,7 @@ export function useFamilyChat() {
     activeChatRef.current = activeChatId;
     setMessages([]);
     lastTsRef.current = null;
+    lastSeqRef.current = null;
     setReactionFor(null);
     setShowEmoji(false);
     loadMessages(activeChatId);
@@ -114,8 +124,15 @@ export function useFamilyChat() {
 
   useEffect(() => {
     if (!activeChatId) return;
-    const id = setInterval(pollNew, POLL_INTERVAL_MS);
-    return () => clearInterval(id);
+    // Следующий опрос — только после завершения предыдущего (long-poll может висеть до LONG_POLL_WAIT_S)
+    let stopped = false;
+    let timer: ReturnType<typeof setTimeout>;
+    const loop = async () => {
+      await pollNew();
+      if (!stopped) timer = setTimeout(loop, POLL_INTERVAL_MS);
+    };
+    timer = setTimeout(loop, POLL_INTERVAL_MS);
+    return () => { stopped = true; clearTimeout(timer); };
   }, [activeChatId, pollNew]);
 
   useEffect(() => {
@@ -1,6 +1,7 @@
 import { useState } from 'react';
 import Icon from '@/components/ui/icon';
 import type { MemoryAlbum } from './types';
+import { pickVariant } from './imageVariant';
 
 interface MemoryAlbumCardProps {
   album: MemoryAlbum;
@@ -13,7 +14,7 @@ export default function MemoryAlbumCard({ album, coverUrl, onClick }: MemoryAlbu
   const [broken, setBroken] = useState(false);
   const count = album.entries_count ?? 0;
   // Приоритет: явный override → backend preview_asset → placeholder
-  const url = !broken ? (coverUrl || album.preview_asset?.file_url || null) : null;
+  const url = !broken ? (coverUrl || pickVariant(album.preview_asset) || null) : null;
 
   return (
     <button
@@ -4,6 +4,7 @@ import { ru } from 'date-fns/locale';
 import Icon from '@/components/ui/icon';
 import { Badge } from '@/components/ui/badge';
 import type { MemoryEntry } from './types';
+import { pickVariant } from './imageVariant';
 
 interface MemoryCardProps {
   entry: MemoryEntry;
@@ -27,8 +28,7 @@ function formatDate(entry: MemoryEntry): string | null {
 export default function MemoryCard({ entry, onClick, selectable, selected }: MemoryCardProps) {
   const [broken, setBroken] = useState(false);
   const cover = !broken
-    ? entry.assets.find(a => a.id === entry.cover_asset_id)?.file_url ||
-      entry.assets[0]?.file_url
+    ? pickVariant(entry.assets.find(a => a.id === entry.cover_asset_id) || entry.assets[0])
     : null;
   const dateLabel = formatDate(entry);
   const photosCount = entry.assets.length;
@@ -1,4 +1,5 @@
 import type { MemoryAlbum, MemoryEntry } from './types';
+import { pickVariant } from './imageVariant';
 
 /**
  * Возвращает URL обложки альбома.
@@ -18,14 +19,14 @@ export function resolveAlbumCover(
 ): string | null {
   // 1. preview_asset — бэкенд уже выбрал нужный ассет для этого альбома
   if (album.preview_asset?.file_url) {
-    return album.preview_asset.file_url;
+    return pickVariant(album.preview_asset) ?? album.preview_asset.file_url;
   }
 
   // 2. Ручная обложка через cover_asset_id — ищем в entries конкретного альбома
   if (album.cover_asset_id) {
     for (const e of entries) {
       const found = e.assets.find(a => a.id === album.cover_asset_id);
-      if (found) return found.file_url;
+      if (found) return pickVariant(found) ?? found.file_url;
     }
   }
 
@@ -33,8 +34,7 @@ export function resolveAlbumCover(
   const albumEntries = entries.filter(e => e.album_ids?.includes(album.id));
   for (const e of albumEntries) {
     const sorted = [...e.assets].sort((a, b) => a.sort_order - b.sort_order);
-    const cover =
-      sorted.find(a => a.id === e.cover_asset_id)?.file_url || sorted[0]?.file_url;
+    const cover = pickVariant(sorted.find(a => a.id === e.cover_asset_id) || sorted[0]);
     if (cover) return cover;
   }
 
@@ -0,0 +1,22 @@
+import type { ImageVariants } from './types';
+
+/** Ширина превью для карточек и обложек альбомов (2x для Retina) */
+export const CARD_IMAGE_WIDTH = 640;
+
+/**
+ * URL превью не уже width — самое узкое из подходящих, иначе самое широкое.
+ * Пока превью не готово (variants пустой) — исходный файл.
+ */
+export function pickVariant(
+  asset: { file_url: string; variants?: ImageVariants | null } | null | undefined,
+  width: number = CARD_IMAGE_WIDTH,
+): string | undefined {
+  if (!asset) return undefined;
+  const widths = Object.keys(asset.variants || {})
+    .map(Number)
+    .filter(w => Number.isFinite(w))
+    .sort((a, b) => a - b);
+  if (!widths.length) return asset.file_url;
+  const best = widths.find(w => w >= width) ?? widths[widths.length - 1];
+  return asset.variants![String(best)] || asset.file_url;
+}
@@ -1,3 +1,6 @@
+/** WebP-превью фото по ширине: {"320": url, "640": url, "1280": url} (строит image-optimizer) */
+export type ImageVariants = Record<string, string>;
+
 export interface MemoryAsset {
   id: string;
   file_url: string;
@@ -5,6 +8,7 @@ export interface MemoryAsset {
   width: number | null;
   height: number | null;
   mime_type: string | null;
+  variants?: ImageVariants | null;
 }
 
 export type MemoryEntryStatus = 'draft' | 'published' | 'archived';
@@ -41,6 +45,7 @@ export interface AlbumPreviewAsset {
   file_url: string;
   width: number | null;
   height: number | null;
+  variants?: ImageVariants | null;
   source: 'manual' | 'auto';
 }
 
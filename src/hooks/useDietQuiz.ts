@@ -62,9 +62,11 @@ export default function useDietQuiz() {
   };
 
   const pollOperation = async (operationId: string) => {
-    const maxAttempts = 30;
-    for (let i = 0; i < maxAttempts; i++) {
-      await new Promise(r => setTimeout(r, 5000));
+    // Сервер подсказывает, когда спрашивать снова (retryAfterMs), общий лимит — 150 секунд
+    const deadline = Date.now() + 150000;
+    let delay = 5000;
+    while (Date.now() < deadline) {
+      await new Promise(r => setTimeout(r, delay));
       try {
         const res = await fetch(DIET_PLAN_API_URL, {
           method: 'POST',
@@ -72,7 +74,10 @@ export default function useDietQuiz() {
           body: JSON.stringify({ action: 'check', operationId }),
         });
         const d = await res.json();
-        if (d.status === 'processing') continue;
+        if (d.status === 'processing') {
+          delay = Math.min(10000, Math.max(2000, Number(d.retryAfterMs) || 5000));
+          continue;
+        }
         if (d.status === 'done') {
           if (d.plan?.days) {
             setGeneratedPlan(d.plan);
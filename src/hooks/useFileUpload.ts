@@ -13,7 +13,11 @@ interface UseFileUploadReturn {
   progress: number;
 }
 
-const MAX_FILE_SIZE = 10 * 1024 * 1024;
+const UPLOAD_FILE_URL = 'https://functions.poehali.dev/159c1ff5-fd0b-4564-b93b-55b81348c9a0';
+// Прямая загрузка в S3 по presigned POST — файл не проходит через память функции
+const MAX_FILE_SIZE = 100 * 1024 * 1024;
+// Загрузка base64 через функцию (запасной путь, если presign недоступен)
+const MAX_LEGACY_FILE_SIZE = 10 * 1024 * 1024;
 const MAX_IMAGE_DIMENSION = 1920;
 const IMAGE_QUALITY = 0.82;
 
@@ -59,6 +63,78 @@ async function compressImage(file: File): Promise<File> {
   return new File([blob], newName, { type: 'image/jpeg' });
 }
 
+async function readError(response: Response): Promise<string> {
+  let msg = `Upload failed (${response.status})`;
+  try {
+    const errorData = await response.json();
+    if (errorData.error) msg = errorData.error;
+  } catch {
+    try {
+      const text = await response.text();
+      if (text) msg = text.slice(0, 200);
+    } catch {
+      /* ignore */
+    }
+  }
+  return msg;
+}
+
+/**
+ * Прямая загрузка: presign (проверка лимита + резерв) → POST в S3 → complete (фактический размер).
+ * Возвращает null, если presign недоступен и нужно уйти на загрузку base64.
+ */
+async function uploadDirect(
+  file: File,
+  folder: string,
+  headers: Record<string, string>,
+  onProgress: (value: number) => void,
+): Promise<UploadResult | null> {
+  let presign: Response;
+  try {
+    presign = await fetch(UPLOAD_FILE_URL, {
+      method: 'POST',
+      headers,
+      body: JSON.stringify({
+        action: 'presign',
+        fileName: file.name,
+        content_type: file.type || undefined,
+        size: file.size,
+        folder,
+      }),
+    });
+  } catch {
+    return null;
+  }
+  // Лимиты и доступ — окончательный отказ, остальное — пробуем старый путь
+  if (presign.status === 403 || presign.status === 413) {
+    throw new Error(await readError(presign));
+  }
+  if (!presign.ok) return null;
+
+  const { upload_url, fields, fileName } = await presign.json();
+  onProgress(40);
+
+  const form = new FormData();
+  Object.entries(fields as Record<string, string>).forEach(([k, v]) => form.append(k, v));
+  form.append('file', file);
+  const s3Response = await fetch(upload_url, { method: 'POST', body: form });
+  if (!s3Response.ok) {
+    throw new Error(`Upload failed (${s3Response.status})`);
+  }
+  onProgress(85);
+
+  const complete = await fetch(UPLOAD_FILE_URL, {
+    method: 'POST',
+    headers,
+    body: JSON.stringify({ action: 'complete', fileName }),
+  });
+  if (!complete.ok) {
+    throw new Error(await readError(complete));
+  }
+  onProgress(100);
+  return complete.json();
+}
+
 export const useFileUpload = (): UseFileUploadReturn => {
   const [uploading, setUploading] = useState(false);
   const [error, setError] = useState<string | null>(null);
@@ -71,7 +147,7 @@ export const useFileUpload = (): UseFileUploadReturn => {
 
     try {
       if (file.size > MAX_FILE_SIZE) {
-        throw new Error('Файл больше 10 МБ');
+        throw new Error('Файл больше 100 МБ');
       }
 
       let workFile = file;
@@ -81,7 +157,24 @@ export const useFileUpload = (): UseFileUploadReturn => {
         workFile = file;
       }
 
-      setProgress(30);
+      setProgress(20);
+
+      // Передаём токен чтобы бэкенд мог определить семью и учесть S3-лимит
+      const _token = localStorage.getItem('authToken') || localStorage.getItem('auth_token') || '';
+      const _familyId = localStorage.getItem('familyId') || '';
+      const _uploadHeaders: Record<string, string> = { 'Content-Type': 'application/json' };
+      if (_token) _uploadHeaders['X-Auth-Token'] = _token;
+      if (_familyId) _uploadHeaders['X-Family-Id'] = _familyId;
+
+      const presigned = await uploadDirect(workFile, folder, _uploadHeaders, setProgress);
+      if (presigned) {
+        setUploading(false);
+        return presigned.url;
+      }
+
+      if (workFile.size > MAX_LEGACY_FILE_SIZE) {
+        throw new Error('Файл больше 10 МБ');
+      }
 
       const base64 = await new Promise<string>((resolve, reject) => {
         const reader = new FileReader();
@@ -95,14 +188,7 @@ export const useFileUpload = (): UseFileUploadReturn => {
 
       setProgress(60);
 
-      // Передаём токен чтобы бэкенд мог определить семью и учесть S3-лимит
-      const _token = localStorage.getItem('authToken') || localStorage.getItem('auth_token') || '';
-      const _familyId = localStorage.getItem('familyId') || '';
-      const _uploadHeaders: Record<string, string> = { 'Content-Type': 'application/json' };
-      if (_token) _uploadHeaders['X-Auth-Token'] = _token;
-      if (_familyId) _uploadHeaders['X-Family-Id'] = _familyId;
-
-      const response = await fetch('https://functions.poehali.dev/159c1ff5-fd0b-4564-b93b-55b81348c9a0', {
+      const response = await fetch(UPLOAD_FILE_URL, {
         method: 'POST',
         headers: _uploadHeaders,
         body: JSON.stringify({
@@ -115,19 +201,7 @@ export const useFileUpload = (): UseFileUploadReturn => {
       setProgress(100);
 
       if (!response.ok) {
-        let msg = `Upload failed (${response.status})`;
-        try {
-          const errorData = await response.json();
-          if (errorData.error) msg = errorData.error;
-        } catch {
-          try {
-            const text = await response.text();
-            if (text) msg = text.slice(0, 200);
-          } catch {
-            /* ignore */
-          }
-        }
-        throw new Error(msg);
+        throw new Error(await readError(response));
       }
 
       const result: UploadResult = await response.json();
@@ -64,6 +64,7 @@ export interface BlogListResponse {
   page: number;
   limit: number;
   pages: number;
+  next_cursor: string | null;
 }
 
 async function api<T>(path: string): Promise<T> {
@@ -82,9 +83,11 @@ export const blogApi = {
     category?: string;
     tag?: string;
     q?: string;
+    cursor?: string;
   } = {}): Promise<BlogListResponse> => {
     const sp = new URLSearchParams({ action: 'list' });
     if (params.page) sp.set('page', String(params.page));
+    if (params.cursor) sp.set('cursor', params.cursor);
     if (params.limit) sp.set('limit', String(params.limit));
     if (params.category) sp.set('category', params.category);
     if (params.tag) sp.set('tag', params.tag);
@@ -1,4 +1,4 @@
-import { useEffect, useState } from 'react';
+import { useEffect, useRef, useState } from 'react';
 import { Link, useSearchParams, useParams, useNavigate } from 'react-router-dom';
 import { Helmet } from '@/lib/helmet';
 import { Button } from '@/components/ui/button';
@@ -32,6 +32,8 @@ export default function Blog() {
   const [loading, setLoading] = useState(true);
   const [categories, setCategories] = useState<BlogCategory[]>([]);
   const [popularTags, setPopularTags] = useState<BlogTag[]>([]);
+  // Keyset-курсоры страниц текущего фильтра: page -> cursor (page 1 и прямые ссылки — без курсора)
+  const cursorsRef = useRef<{ filter: string; byPage: Record<number, string> }>({ filter: '', byPage: {} });
 
   useEffect(() => {
     blogApi.getCategories().then(d => setCategories(d.categories)).catch(console.error);
@@ -40,12 +42,20 @@ export default function Blog() {
 
   useEffect(() => {
     setLoading(true);
+    const filter = `${category}|${tag}|${q}`;
+    if (cursorsRef.current.filter !== filter) {
+      cursorsRef.current = { filter, byPage: {} };
+    }
+    const cursor = cursorsRef.current.byPage[page];
     blogApi
-      .list({ page, limit: POSTS_PER_PAGE, category, tag, q })
+      .list({ page, limit: POSTS_PER_PAGE, category, tag, q, cursor })
       .then(d => {
         setPosts(d.posts);
         setTotal(d.total);
         setPages(d.pages);
+        if (d.next_cursor && cursorsRef.current.filter === filter) {
+          cursorsRef.current.byPage[page + 1] = d.next_cursor;
+        }
       })
       .catch(console.error)
       .finally(() => setLoading(false));
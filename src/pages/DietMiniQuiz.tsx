@@ -269,9 +269,11 @@ export default function DietMiniQuiz() {
   };
 
   const pollOperation = async (operationId: string) => {
-    const maxAttempts = 30;
-    for (let i = 0; i < maxAttempts; i++) {
-      await new Promise(r => setTimeout(r, 5000));
+    // Сервер подсказывает, когда спрашивать снова (retryAfterMs), общий лимит — 150 секунд
+    const deadline = Date.now() + 150000;
+    let delay = 5000;
+    while (Date.now() < deadline) {
+      await new Promise(r => setTimeout(r, delay));
 
       try {
         const res = await fetch(DIET_PLAN_API_URL, {
@@ -281,7 +283,10 @@ export default function DietMiniQuiz() {
         });
         const data = await res.json();
 
-        if (data.status === 'processing') continue;
+        if (data.status === 'processing') {
+          delay = Math.min(10000, Math.max(2000, Number(data.retryAfterMs) || 5000));
+          continue;
+        }
 
         if (data.status === 'done') {
           if (data.plan) {